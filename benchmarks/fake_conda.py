@@ -0,0 +1,417 @@
+"""
+Stand-in for the `conda` and `mamba` executables, for benchmarking ezconda
+without a conda installation or network access.
+
+It understands the commands that ezconda runs and answers them instantly
+from a synthetic package universe of `FAKE_CONDA_SIZE` packages. Every
+environment it creates has all of them installed, plus the packages that
+were asked for by name, so `FAKE_CONDA_SIZE` sets the size of the
+environments ezconda works with.
+
+Environments are real prefixes (`conda-meta/*.json` and `conda-meta/history`)
+in `FAKE_CONDA_ENVS`. Pointing `CONDA_ENVS_PATH` elsewhere hides them from
+ezconda, which then falls back to `list --json`, `list --revision --json`
+and `repoquery whoneeds`.
+
+Every call is appended to `FAKE_CONDA_LOG` with the time spent in it.
+Only the standard library is used, so the stub starts quickly.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SIZE_VAR = "FAKE_CONDA_SIZE"
+ENVS_VAR = "FAKE_CONDA_ENVS"
+LOG_VAR = "FAKE_CONDA_LOG"
+
+CHANNEL = "conda-forge"
+CHANNEL_URL = f"https://conda.anaconda.org/{CHANNEL}"
+
+
+def _platform() -> str:
+
+    return os.environ.get("CONDA_SUBDIR") or {
+        "linux": "linux-64",
+        "darwin": "osx-64",
+        "win32": "win-64",
+    }.get(sys.platform, "linux-64")
+
+
+def _record(name: str, version: str, depends: List[str], subdir: str) -> Dict:
+    """conda-meta record of a package, whose file contains just its file name"""
+
+    build = "h0_0"
+    fn = f"{name}-{version}-{build}.tar.bz2"
+    return {
+        "name": name,
+        "version": version,
+        "build": build,
+        "build_number": 0,
+        "channel": f"{CHANNEL_URL}/{subdir}",
+        "subdir": subdir,
+        "fn": fn,
+        "url": f"{CHANNEL_URL}/{subdir}/{fn}",
+        "md5": hashlib.md5(fn.encode()).hexdigest(),
+        "sha256": hashlib.sha256(fn.encode()).hexdigest(),
+        "size": len(fn),
+        "depends": depends,
+        "timestamp": 1640995200000,
+    }
+
+
+def universe(size: int, subdir: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    `size` packages named 'pkg00000', 'pkg00001', ... Each one depends on one
+    or two packages before it, so they form a single dependency tree.
+    """
+
+    subdir = subdir or _platform()
+    packages = {}
+    for i in range(size):
+        depends = []
+        if i > 0:
+            depends.append(f"pkg{i // 2:05d}")
+        if i > 2 and i // 3 != i // 2:
+            depends.append(f"pkg{i // 3:05d} >=1.0")
+        name = f"pkg{i:05d}"
+        version = f"{1 + i % 7}.{i % 13}.0"
+        packages[name] = _record(name, version, depends, subdir)
+    return packages
+
+
+def spec_name(spec: str) -> str:
+
+    spec = spec.split("::")[-1]
+    for i, char in enumerate(spec):
+        if char in "=<>!~ [":
+            return spec[:i]
+    return spec
+
+
+def spec_record(spec: str, packages: Dict[str, Dict]) -> Dict:
+    """Record for a requested package: from the universe, or a new leaf package"""
+
+    name = spec_name(spec)
+    if name in packages:
+        return packages[name]
+    version = "1.0"
+    if "=" in spec:
+        version = spec.split("=")[-1].strip() or version
+    depends = ["pkg00000"] if "pkg00000" in packages else []
+    return _record(name, version, depends, _platform())
+
+
+def explicit_record(url: str) -> Dict:
+    """Record for a package url of an '@EXPLICIT' file"""
+
+    url = url.split("#")[0]
+    subdir, fn = url.rsplit("/", 2)[-2:]
+    name, version, _ = fn[: -len(".tar.bz2")].rsplit("-", 2)
+    return _record(name, version, [], subdir)
+
+
+def to_list_record(record: Dict) -> Dict:
+    """Fields of a record in the output of `conda list --json`"""
+
+    return {
+        "base_url": CHANNEL_URL,
+        "build_number": record["build_number"],
+        "build_string": record["build"],
+        "channel": CHANNEL,
+        "dist_name": record["fn"][: -len(".tar.bz2")],
+        "name": record["name"],
+        "platform": record["subdir"],
+        "version": record["version"],
+    }
+
+
+def _dist(record: Dict) -> str:
+
+    return f"{CHANNEL}/{record['subdir']}::{record['fn'][: -len('.tar.bz2')]}"
+
+
+class FakeEnv:
+    """An environment prefix managed by the stub"""
+
+    def __init__(self, prefix: Path) -> None:
+
+        self.prefix = Path(prefix)
+        self.meta = self.prefix / "conda-meta"
+
+    def exists(self) -> bool:
+
+        return self.meta.is_dir()
+
+    def records(self) -> Dict[str, Dict]:
+
+        records = {}
+        if self.exists():
+            for path in self.meta.glob("*.json"):
+                with open(path) as f:
+                    record = json.load(f)
+                records[record["name"]] = record
+        return records
+
+    def revisions(self) -> List[Dict]:
+
+        path = self.meta / "revisions.json.stub"
+        if not path.is_file():
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def apply(self, records: Dict[str, Dict], cmd: str, specs: Iterable[str]) -> None:
+        """Make `records` the installed packages and record the change as a revision"""
+
+        self.meta.mkdir(parents=True, exist_ok=True)
+        old = self.records()
+
+        removed = [
+            old[n] for n in sorted(old) if old[n]["fn"] != records.get(n, {}).get("fn")
+        ]
+        added = [
+            records[n]
+            for n in sorted(records)
+            if records[n]["fn"] != old.get(n, {}).get("fn")
+        ]
+        for record in removed:
+            os.unlink(self.meta / f"{record['fn'][: -len('.tar.bz2')]}.json")
+        for record in added:
+            with open(self.meta / f"{record['fn'][: -len('.tar.bz2')]}.json", "w") as f:
+                json.dump(record, f)
+
+        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        revisions = self.revisions()
+        with open(self.meta / "history", "a") as f:
+            f.write(f"==> {date} <==\n# cmd: {cmd}\n")
+            f.writelines(f"-{_dist(r)}\n" for r in removed)
+            f.writelines(f"+{_dist(r)}\n" for r in added)
+            f.write(f"# update specs: {list(specs)}\n")
+
+        revision = {
+            "date": date,
+            "rev": len(revisions),
+            "install": [],
+            "remove": [],
+            "upgrade": [],
+            "downgrade": [],
+        }
+        old_names = {r["name"]: r for r in removed}
+        for record in added:
+            dist = record["fn"][: -len(".tar.bz2")]
+            if record["name"] in old_names:
+                old_dist = old_names.pop(record["name"])["fn"][: -len(".tar.bz2")]
+                revision["upgrade"].append(
+                    {"old": f"{old_dist}-{CHANNEL}", "new": f"{dist}-{CHANNEL}"}
+                )
+            else:
+                revision["install"].append(f"{dist}-{CHANNEL}")
+        revision["remove"].extend(
+            f"{r['fn'][: -len('.tar.bz2')]}-{CHANNEL}" for r in old_names.values()
+        )
+        revisions.append(revision)
+        with open(self.meta / "revisions.json.stub", "w") as f:
+            json.dump(revisions, f)
+
+
+def fill_package_cache(pkgs_dir: Path, records: Iterable[Dict]) -> None:
+    """Put the package files in the package cache, so nothing is downloaded"""
+
+    Path(pkgs_dir).mkdir(parents=True, exist_ok=True)
+    for record in records:
+        path = Path(pkgs_dir) / record["fn"]
+        if not path.is_file():
+            path.write_text(record["fn"])
+
+
+def seed_env(
+    envs_dir: Path, env_name: str, size: int, extra: Iterable[str] = ()
+) -> Path:
+    """Create an environment with the universe of `size` packages and `extra` packages"""
+
+    packages = universe(size)
+    records = dict(packages)
+    for spec in extra:
+        record = spec_record(spec, packages)
+        records[record["name"]] = record
+    env = FakeEnv(Path(envs_dir) / env_name)
+    env.apply(records, "seed", extra)
+    return env.prefix
+
+
+def _parse_args(args: List[str]) -> Tuple[Dict, List[str]]:
+    """Split arguments into options and package specs"""
+
+    options: Dict = {"channels": []}
+    specs = []
+    with_value = {
+        "-n": "name",
+        "--name": "name",
+        "-p": "prefix",
+        "--prefix": "prefix",
+        "--file": "file",
+        "-f": "file",
+    }
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in with_value:
+            options[with_value[arg]] = args[i + 1]
+            i += 1
+        elif arg in ("-c", "--channel"):
+            options["channels"].append(args[i + 1])
+            i += 1
+        elif arg.startswith("-"):
+            options[arg.lstrip("-")] = True
+        else:
+            specs.append(arg)
+        i += 1
+    return options, specs
+
+
+def _read_specs_file(file: str) -> Tuple[Optional[str], List[str], List[str]]:
+    """Name, dependencies and explicit urls of a '.yml' or '@EXPLICIT' file"""
+
+    name, specs, urls = None, [], []
+    in_dependencies = False
+    with open(file) as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith(("http://", "https://", "file://")):
+                urls.append(stripped)
+            elif stripped.startswith("name:"):
+                name = stripped.split(":", 1)[1].strip()
+            elif not line.startswith((" ", "-")):
+                in_dependencies = stripped == "dependencies:"
+            elif (
+                in_dependencies
+                and stripped.startswith("- ")
+                and not stripped.endswith(":")
+            ):
+                specs.append(stripped[2:].strip().strip("'\""))
+    return name, specs, urls
+
+
+def _envs_dir() -> Path:
+
+    return Path(os.environ.get(ENVS_VAR) or Path.home() / ".conda" / "envs")
+
+
+def _env(options: Dict) -> FakeEnv:
+
+    if options.get("prefix"):
+        return FakeEnv(Path(options["prefix"]))
+    return FakeEnv(_envs_dir() / options["name"])
+
+
+def run(argv: List[str]) -> Tuple[int, str]:
+    """Run a conda command; returns the exit code and output"""
+
+    size = int(os.environ.get(SIZE_VAR, "100"))
+    if not argv or argv[0] in ("--version", "-V"):
+        return 0, "conda 99.0.0"
+
+    command, args = argv[0], argv[1:]
+    if command == "env" and args:
+        command, args = f"env {args[0]}", args[1:]
+    options, specs = _parse_args(args)
+
+    if command == "repoquery":
+        # repoquery whoneeds <pkg>
+        name = spec_name(specs[-1])
+        pkgs = [
+            to_list_record(r)
+            for r in universe(size).values()
+            if any(spec_name(dep) == name for dep in r["depends"])
+        ]
+        return 0, json.dumps({"result": {"pkgs": pkgs}})
+
+    if command in ("run", "activate", "init"):
+        return 0, ""
+
+    env = _env(options) if "name" in options or "prefix" in options else None
+
+    if command == "list":
+        if env is None or not env.exists():
+            return 1, "EnvironmentLocationNotFound"
+        if options.get("revision") or options.get("revisions"):
+            return 0, json.dumps(env.revisions())
+        records = sorted(env.records().values(), key=lambda r: r["name"])
+        return 0, json.dumps([to_list_record(r) for r in records])
+
+    if command not in (
+        "create",
+        "install",
+        "remove",
+        "update",
+        "env create",
+        "env update",
+    ):
+        return 1, f"fake conda: unsupported command {argv}"
+
+    urls = []
+    if options.get("file"):
+        name, file_specs, urls = _read_specs_file(options["file"])
+        specs.extend(file_specs)
+        if env is None:
+            env = FakeEnv(_envs_dir() / name)
+
+    packages = universe(size)
+    current = {} if command in ("create", "env create") else env.records()
+    if command == "remove":
+        names = {spec_name(spec) for spec in specs}
+        records = {n: r for n, r in current.items() if n not in names}
+    elif urls:
+        records = dict(current)
+        records.update((r["name"], r) for r in map(explicit_record, urls))
+    else:
+        records = (
+            dict(packages)
+            if command in ("create", "env create", "env update")
+            else dict(current)
+        )
+        for spec in specs:
+            record = spec_record(spec, packages)
+            records[record["name"]] = record
+
+    if options.get("dry-run"):
+        link = [
+            r for n, r in records.items() if current.get(n, {}).get("fn") != r["fn"]
+        ]
+        unlink = [
+            r for n, r in current.items() if records.get(n, {}).get("fn") != r["fn"]
+        ]
+        actions = {
+            "FETCH": link,
+            "LINK": [to_list_record(r) for r in link],
+            "UNLINK": [to_list_record(r) for r in unlink],
+            "PREFIX": str(env.prefix),
+        }
+        return 0, json.dumps({"success": True, "dry_run": True, "actions": actions})
+
+    env.apply(records, " ".join(["conda", *argv]), specs)
+    return 0, json.dumps({"success": True}) if options.get("json") else "done"
+
+
+def main() -> None:
+
+    start = time.perf_counter()
+    returncode, output = run(sys.argv[1:])
+    print(output, file=sys.stdout if returncode == 0 else sys.stderr)
+
+    if os.environ.get(LOG_VAR):
+        entry = {"argv": sys.argv[1:], "seconds": time.perf_counter() - start}
+        with open(os.environ[LOG_VAR], "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
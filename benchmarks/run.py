@@ -0,0 +1,411 @@
+"""
+End-to-end benchmarks of ezconda commands against a stub conda.
+
+`fake_conda.py` is put on PATH as `conda` and `mamba`, so commands run without
+a conda installation or network, on environments of 10 to 10,000 packages.
+The time spent in the stub is subtracted, which leaves the time spent in
+ezconda itself: starting up, reading environments, writing specifications
+and lock files, and printing summaries.
+
+Results are saved to 'benchmarks/results/<commit>.json' and can be compared
+with the results of another commit:
+
+    python benchmarks/run.py --size 100 --size 1000 --compare 1a2b3c4
+"""
+import os
+import sys
+import json
+import shutil
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import typer
+
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rich.console import Console
+from rich.table import Table
+
+sys.path.insert(0, str(Path(__file__).parent))
+import fake_conda  # noqa: E402
+
+
+BENCHMARKS_DIR = Path(__file__).parent
+REPO_DIR = BENCHMARKS_DIR.parent
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+
+ENV_NAME = "bench"
+# packages that are installed, removed or changed by the benchmarks
+EXTRA_PACKAGES = ("extra-a", "extra-b", "drift")
+
+console = Console()
+
+
+class Mode(str, Enum):
+    # ezconda reads the environment prefixes directly
+    prefix = "prefix"
+    # prefixes are hidden, ezconda asks conda (`list`, `repoquery`, ...)
+    commands = "commands"
+
+
+class Command(str, Enum):
+    create = "create"
+    install = "install"
+    remove = "remove"
+    lock = "lock"
+    summary = "summary"
+    sync = "sync"
+
+
+class Bench:
+    """A directory with the stub executables, environments and a work directory"""
+
+    def __init__(self, root: Path, size: int, mode: Mode) -> None:
+
+        self.root = root
+        self.size = size
+        self.bin_dir = root / "bin"
+        self.envs_dir = root / "envs"
+        self.work_dir = root / "work"
+        self.log = root / "conda-calls.jsonl"
+
+        # packages are never downloaded, as if they were cached by earlier runs
+        packages = fake_conda.universe(size)
+        extra = [fake_conda.spec_record(pkg, packages) for pkg in EXTRA_PACKAGES]
+        fake_conda.fill_package_cache(root / "pkgs", [*packages.values(), *extra])
+
+        self.bin_dir.mkdir(parents=True, exist_ok=True)
+        for executable in ("conda", "mamba"):
+            path = self.bin_dir / executable
+            path.write_text(
+                f"#!{sys.executable} -S\n"
+                f"import sys\n"
+                f"sys.path.insert(0, {str(BENCHMARKS_DIR)!r})\n"
+                f"from fake_conda import main\n"
+                f"main()\n"
+            )
+            path.chmod(0o755)
+
+        self.env = {
+            **os.environ,
+            "PATH": os.pathsep.join([str(self.bin_dir), os.environ.get("PATH", "")]),
+            "HOME": str(root / "home"),
+            "XDG_CONFIG_HOME": str(root / "home" / ".config"),
+            "CONDA_ROOT": str(root / "root"),
+            "CONDA_PKGS_DIRS": str(root / "pkgs"),
+            # the stub creates environments here ...
+            fake_conda.ENVS_VAR: str(self.envs_dir),
+            fake_conda.SIZE_VAR: str(size),
+            fake_conda.LOG_VAR: str(self.log),
+            # ... and ezconda looks for them here
+            "CONDA_ENVS_PATH": str(
+                self.envs_dir if mode == Mode.prefix else root / "no-envs"
+            ),
+            "EZCONDA_NO_DAEMON": "1",
+            "COLUMNS": "120",
+        }
+        self.env.pop("CONDA_EXE", None)
+        self.env.pop("MAMBA_ROOT_PREFIX", None)
+        # benchmark the ezconda of this working tree
+        self.env["PYTHONPATH"] = str(REPO_DIR)
+
+    def reset(self) -> None:
+        """Remove the environments, files and call log of the previous run"""
+
+        for path in (self.envs_dir, self.work_dir, self.root / "home"):
+            shutil.rmtree(path, ignore_errors=True)
+        self.work_dir.mkdir()
+        if self.log.exists():
+            self.log.unlink()
+
+    def seed(self, *extra: str) -> None:
+        """Create the environment and its specifications file"""
+
+        fake_conda.seed_env(self.envs_dir, ENV_NAME, self.size, extra)
+        dependencies = "".join(f"- {pkg}\n" for pkg in extra)
+        (self.work_dir / f"{ENV_NAME}.yml").write_text(
+            f"name: {ENV_NAME}\nchannels:\n- defaults\ndependencies:\n{dependencies}"
+        )
+
+    def ezconda(self, *args: str) -> Tuple[float, subprocess.CompletedProcess]:
+        """Run an ezconda command; returns the time it took and its result"""
+
+        cmd = [sys.executable, "-m", "ezconda", *args]
+        start = time.perf_counter()
+        result = subprocess.run(
+            cmd, cwd=self.work_dir, env=self.env, capture_output=True, text=True
+        )
+        seconds = time.perf_counter() - start
+        if result.returncode != 0 or "Traceback" in result.stdout:
+            raise RuntimeError(
+                f"'ezconda {' '.join(args)}' failed:\n{result.stdout}{result.stderr}"
+            )
+        return seconds, result
+
+    def conda_calls(self) -> List[Dict]:
+
+        if not self.log.exists():
+            return []
+        with open(self.log) as f:
+            return [json.loads(line) for line in f]
+
+    def stub_startup(self, repeat: int = 5) -> float:
+        """Time it takes to start the stub, which is not in its logged times"""
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(
+                [str(self.bin_dir / "conda"), "--version"],
+                env={**self.env, fake_conda.LOG_VAR: ""},
+                capture_output=True,
+            )
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+
+def _setup_create(bench: Bench) -> List[str]:
+
+    return ["create", "-n", ENV_NAME, "extra-a", "extra-b"]
+
+
+def _setup_install(bench: Bench) -> List[str]:
+
+    bench.seed("extra-a")
+    return ["install", "-n", ENV_NAME, "extra-b"]
+
+
+def _setup_remove(bench: Bench) -> List[str]:
+
+    bench.seed("extra-a", "extra-b")
+    return ["remove", "-n", ENV_NAME, "extra-b"]
+
+
+def _setup_lock(bench: Bench) -> List[str]:
+
+    bench.seed("extra-a")
+    return ["lock", "-n", ENV_NAME]
+
+
+def _setup_summary(bench: Bench) -> List[str]:
+
+    bench.seed("extra-a")
+    return ["summary", "-n", ENV_NAME]
+
+
+def _setup_sync(bench: Bench) -> List[str]:
+
+    bench.seed("extra-a")
+    bench.ezconda("lock", "-n", ENV_NAME)
+    # the environment drifts away from the lock file
+    fake_conda.seed_env(bench.envs_dir, ENV_NAME, bench.size, ["extra-a", "drift"])
+    return ["sync", "-n", ENV_NAME, "--with", "lockfile"]
+
+
+SETUPS: Dict[Command, Callable[[Bench], List[str]]] = {
+    Command.create: _setup_create,
+    Command.install: _setup_install,
+    Command.remove: _setup_remove,
+    Command.lock: _setup_lock,
+    Command.summary: _setup_summary,
+    Command.sync: _setup_sync,
+}
+
+
+def run_benchmark(bench: Bench, command: Command, repeat: int, startup: float) -> Dict:
+    """Run a command `repeat` times, each time on a freshly set up environment"""
+
+    totals, ezconda_times, calls = [], [], 0
+    for _ in range(repeat):
+        bench.reset()
+        args = SETUPS[command](bench)
+        if bench.log.exists():
+            bench.log.unlink()
+
+        seconds, _ = bench.ezconda(*args)
+        conda_calls = bench.conda_calls()
+        conda_seconds = sum(c["seconds"] for c in conda_calls)
+        conda_seconds += startup * len(conda_calls)
+
+        totals.append(seconds)
+        ezconda_times.append(max(seconds - conda_seconds, 0.0))
+        calls = len(conda_calls)
+
+    return {
+        "command": command.value,
+        "size": bench.size,
+        "total": statistics.median(totals),
+        "min": min(totals),
+        "ezconda": statistics.median(ezconda_times),
+        "conda_calls": calls,
+    }
+
+
+def _git(*args: str) -> str:
+
+    result = subprocess.run(
+        ["git", *args], cwd=REPO_DIR, capture_output=True, text=True
+    )
+    return result.stdout.strip()
+
+
+def get_revision() -> str:
+    """Commit of the code being benchmarked, marked if ezconda has local changes"""
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    if _git("status", "--porcelain", "--", "ezconda"):
+        commit += "-dirty"
+    return commit
+
+
+def find_results(ref: str) -> Path:
+    """Results file from a path or a (prefix of a) commit"""
+
+    path = Path(ref)
+    if path.is_file():
+        return path
+    commit = _git("rev-parse", "--short", ref) or ref
+    matches = sorted(RESULTS_DIR.glob(f"{commit}*.json"))
+    if not matches:
+        console.print(f"[red]No benchmark results for '{ref}' in '{RESULTS_DIR}'")
+        raise typer.Exit(code=1)
+    return matches[0]
+
+
+def _key(result: Dict) -> Tuple[str, str, int]:
+
+    return result["mode"], result["command"], result["size"]
+
+
+def print_results(
+    results: List[Dict], baseline: Optional[Dict] = None, threshold: float = 20.0
+) -> int:
+    """Print the results, compared with a baseline; returns the number of regressions"""
+
+    base = {_key(r): r for r in baseline["results"]} if baseline else {}
+
+    table = Table(title=f"ezconda benchmarks")
+    table.add_column("Mode", style="magenta")
+    table.add_column("Command", style="magenta")
+    table.add_column("Packages", justify="right")
+    table.add_column("Total (s)", justify="right")
+    table.add_column("ezconda (s)", justify="right")
+    table.add_column("conda calls", justify="right")
+    if baseline:
+        table.add_column(f"vs {baseline['commit']}", justify="right")
+
+    regressions = 0
+    for result in results:
+        row = [
+            result["mode"],
+            result["command"],
+            f"{result['size']:,}",
+            f"{result['total']:.3f}",
+            f"{result['ezconda']:.3f}",
+            str(result["conda_calls"]),
+        ]
+        if baseline:
+            old = base.get(_key(result))
+            if old is None or not old["ezconda"]:
+                row.append("")
+            else:
+                change = 100 * (result["ezconda"] - old["ezconda"]) / old["ezconda"]
+                style = ""
+                if change > threshold:
+                    style = "red"
+                    regressions += 1
+                elif change < -threshold:
+                    style = "green"
+                row.append(
+                    f"[{style}]{change:+.0f}%[/]" if style else f"{change:+.0f}%"
+                )
+        table.add_row(*row)
+
+    console.print(table)
+    return regressions
+
+
+def main(
+    size: List[int] = typer.Option(
+        [10, 100, 1000, 10000],
+        "--size",
+        "-s",
+        help="Number of packages in the environment",
+    ),
+    command: List[Command] = typer.Option(
+        list(Command), "--command", "-c", help="Command to benchmark"
+    ),
+    mode: List[Mode] = typer.Option(
+        [Mode.prefix, Mode.commands],
+        "--mode",
+        "-m",
+        help="How ezconda reads environments",
+    ),
+    repeat: int = typer.Option(3, "--repeat", "-r", help="Runs of each benchmark"),
+    compare: Optional[str] = typer.Option(
+        None, "--compare", help="Commit or results file to compare with"
+    ),
+    threshold: float = typer.Option(
+        20.0, help="Slowdown (in %) of ezconda's own time reported as a regression"
+    ),
+    save: bool = typer.Option(True, help="Save the results to 'benchmarks/results'"),
+):
+    """Time ezconda commands end to end, with a stub conda on PATH."""
+
+    if sys.platform == "win32":
+        console.print("[red]The benchmarks need a POSIX system")
+        raise typer.Exit(code=1)
+
+    baseline = None
+    if compare is not None:
+        with open(find_results(compare)) as f:
+            baseline = json.load(f)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ezconda-bench-") as tmpdir:
+        startup = None
+        for m in mode:
+            for n in size:
+                bench = Bench(Path(tmpdir) / f"{m.value}-{n}", n, m)
+                if startup is None:
+                    startup = bench.stub_startup()
+                for c in command:
+                    with console.status(
+                        f"[magenta]{m.value}: {c.value} ({n:,} packages)"
+                    ):
+                        result = run_benchmark(bench, c, repeat, startup)
+                    results.append({"mode": m.value, **result})
+
+    regressions = print_results(results, baseline, threshold)
+
+    if save:
+        revision = get_revision()
+        RESULTS_DIR.mkdir(exist_ok=True)
+        results_file = RESULTS_DIR / f"{revision}.json"
+        with open(results_file, "w") as f:
+            json.dump(
+                {
+                    "commit": revision,
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "repeat": repeat,
+                    "stub_startup": startup,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        console.print(f"[bold green] :floppy_disk: Results saved to '{results_file}'")
+
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
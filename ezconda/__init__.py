@@ -1,4 +1,8 @@
-from importlib_metadata import version  # type: ignore
+def __getattr__(name):
+    # resolved on first use, so that forwarding a command to `ezconda daemon`
+    # does not import importlib_metadata
+    if name == "__version__":
+        from importlib_metadata import version  # type: ignore
 
-
-__version__ = version(__name__)
+        return version(__name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,4 @@
-from .main import app
+from .client import main
 
 
-app()
+main()
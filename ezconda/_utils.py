@@ -1,25 +1,206 @@
+import os
 import json
-import re
+import difflib
+import signal
+import tempfile
+import threading
 import subprocess
 import yaml
 import typer
 from pathlib import Path
-from typing import Optional, Dict, List
+from collections import deque
+from typing import Optional, Deque, Dict, List, Set, TYPE_CHECKING
 from textwrap import dedent
+from rich.markup import escape
 
+from .client import INTERRUPTED_EXIT_CODE
 from .console import console
+from .profiling import profiled
+from .solver import Solver
+from .files.repodata import RepodataIndex
+from .matchspec import (
+    index_dependencies,
+    parse_spec,
+    spec_name,
+    version_key,
+    version_matches,
+)
 
+if TYPE_CHECKING:
+    from rich.status import Status
+    from .snapshot import EnvSnapshot
 
+# use LibYAML bindings when PyYAML was built with them
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# sections of the '.yml' file that ezconda updates
+_UPDATED_SECTIONS = ("channels", "dependencies")
+
+
+# lines of output of a streamed command that are kept for the error message
+_TAIL_LINES = 100
+
+# processes started by run_command, which `ezconda daemon` stops when the
+# client that asked for the command is interrupted
+_processes: Set[subprocess.Popen] = set()
+_processes_lock = threading.Lock()
+_cancelled = threading.Event()
+
+
+def cancel_commands(timeout: float = 10) -> None:
+    """
+    Interrupt the processes started by `run_command` (killing those that do
+    not stop within `timeout` seconds), and make `run_command` exit instead of
+    starting new ones until `reset_cancelled` is called.
+    """
+
+    with _processes_lock:
+        _cancelled.set()
+        processes = list(_processes)
+
+    for process in processes:
+        process.send_signal(signal.SIGINT)
+    for process in processes:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def reset_cancelled() -> None:
+    """Let `run_command` start processes again after `cancel_commands`"""
+
+    _cancelled.clear()
+
+
+def _exit_if_cancelled() -> None:
+
+    if _cancelled.is_set():
+        raise typer.Exit(code=INTERRUPTED_EXIT_CODE)
+
+
+def _start_process(command: List[str], **kwargs) -> subprocess.Popen:
+
+    with _processes_lock:
+        _exit_if_cancelled()
+        process = subprocess.Popen(command, **kwargs)
+        _processes.add(process)
+    return process
+
+
+def _finish_process(process: subprocess.Popen) -> None:
+
+    with _processes_lock:
+        _processes.discard(process)
+
+
+def _run_process(
+    command: List[str], capture_output: bool, text: bool, env: Optional[Dict[str, str]]
+) -> subprocess.CompletedProcess:
+    """`subprocess.run`, for a process that `cancel_commands` can stop"""
+
+    pipe = subprocess.PIPE if capture_output else None
+    process = _start_process(command, stdout=pipe, stderr=pipe, text=text, env=env)
+    try:
+        with process:
+            try:
+                stdout, stderr = process.communicate()
+            except BaseException:
+                process.kill()
+                raise
+    finally:
+        _finish_process(process)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def _stream_command(
+    command: List[str], verbose: bool, env: Optional[Dict[str, str]], status: "Status"
+) -> subprocess.CompletedProcess:
+    """
+    Run a command and show its progress in the status as it writes output.
+    Only the last lines of output are kept, and returned as its stdout.
+    """
+
+    from .progress import SolverProgress
+
+    progress = SolverProgress()
+    tail: Deque[str] = deque(maxlen=_TAIL_LINES)
+    original = status.status
+
+    # stderr is merged into stdout, so the tail has the lines in order
+    process = _start_process(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        bufsize=1,
+        env=env,
+    )
+    try:
+        with process:
+            for line in process.stdout:
+                line = line.rstrip()
+                if not line:
+                    continue
+                tail.append(line)
+
+                message = progress.update(line)
+                if message is not None:
+                    status.update(f"[magenta]{escape(message)}")
+                if verbose and not progress.is_update(line):
+                    console.print(
+                        line, style="bold yellow", markup=False, highlight=False
+                    )
+    finally:
+        _finish_process(process)
+
+    status.update(original)
+    stdout = "\n".join(tail) + "\n" if tail else ""
+    return subprocess.CompletedProcess(command, process.returncode, stdout, "")
+
+
+@profiled("run_command", lambda command, *args, **kwargs: {"command": command})
 def run_command(
     command: List[str],
     verbose: bool = False,
     capture_output: bool = True,
     text: bool = True,
+    env: Optional[Dict[str, str]] = None,
+    status: Optional["Status"] = None,
+    check: bool = True,
 ):
-    output = subprocess.run(command, capture_output=capture_output, text=text)
+    """
+    Run a command and exit with its output if it fails (unless `check` is False).
+
+    With a `status`, the output is streamed into the status line by line and
+    only its last lines are kept in the returned stdout (and printed on
+    failure), so commands whose output is parsed must not pass one.
+    """
+
+    _exit_if_cancelled()
 
-    if output.returncode != 0:
-        console.print(f"[red]{str(output.stdout + output.stderr)}")
+    output = None
+    if command[0] in ("conda", "mamba"):
+        from .config import get_default_backend
+        from .backend import Backend, run_in_process
+
+        if get_default_backend() == Backend.inprocess:
+            output = run_in_process(command, capture_output, text, env)
+
+    if output is None and status is not None and capture_output and text:
+        output = _stream_command(command, verbose, env, status)
+        verbose = False
+
+    if output is None:
+        output = _run_process(command, capture_output, text, env)
+
+    # the command was stopped because the client of the daemon was interrupted
+    _exit_if_cancelled()
+
+    if output.returncode != 0 and check:
+        console.print(f"[red]{str((output.stdout or '') + (output.stderr or ''))}")
         raise typer.Exit()
 
     if verbose:
@@ -44,6 +225,7 @@ def create_initial_env_specs(
     return env_specs
 
 
+@profiled("spec validate")
 def get_validate_file_name(env_name: str, file: Optional[str] = None) -> Optional[str]:
     """
     Looks for a '.yml' file with the `env_name` specified. If file cannot
@@ -74,24 +256,168 @@ def get_validate_file_name(env_name: str, file: Optional[str] = None) -> Optiona
     return file
 
 
+def _decode_env_file(yaml_binary: bytes) -> str:
+
+    try:
+        return yaml_binary.decode("utf-8")
+    except UnicodeDecodeError:
+        return yaml_binary.decode("utf-16")  # NOQA
+
+
+@profiled("spec read", lambda file: {"file": file})
 def read_env_file(file: str) -> Dict:
     "Read '.yml' file and return a dict containing specifications in the file."
 
     with open(file, "rb") as f:
-        yaml_binary = f.read()
-        try:
-            yaml_stream = yaml_binary.decode("utf-8")
-        except UnicodeDecodeError:
-            yaml_stream = yaml_binary.decode("utf-16")  # NOQA
-        env_specs = yaml.safe_load(yaml_stream)
+        yaml_stream = _decode_env_file(f.read())
+        env_specs = yaml.load(yaml_stream, Loader=SafeLoader)
         return env_specs
 
 
+def _dump_yaml(data) -> str:
+
+    return yaml.dump(data, Dumper=SafeDumper, sort_keys=False)
+
+
+def _is_blank_or_comment(line: str) -> bool:
+
+    return not line.strip() or line.lstrip().startswith("#")
+
+
+def _node_end_line(node) -> int:
+    """Line after the last line of the node"""
+
+    # the end mark is on the next line (column 0) for block nodes
+    if node.end_mark.column == 0:
+        return node.end_mark.line
+    return node.end_mark.line + 1
+
+
+def _block_end(lines: List[str], start: int, end: int) -> int:
+    """End of a block, leaving out the blank and comment lines that follow it"""
+
+    while end > start + 1 and _is_blank_or_comment(lines[end - 1]):
+        end -= 1
+    return end
+
+
+def _update_sequence_lines(
+    lines: List[str], key_node, value_node, old_items: List, new_items: List
+) -> List[str]:
+    """
+    Lines for a block sequence with `new_items`, keeping the lines (and comments)
+    of the items that did not change.
+    """
+
+    items = value_node.value
+    # lines of each item, up to the next item
+    starts = [item.start_mark.line for item in items]
+    ends = starts[1:] + [_block_end(lines, starts[-1], _node_end_line(value_node))]
+    item_lines = [lines[start:end] for start, end in zip(starts, ends)]
+
+    first_line = lines[starts[0]]
+    indent = first_line[: len(first_line) - len(first_line.lstrip())]
+
+    # key and any comments before the first item
+    updated = lines[key_node.start_mark.line : starts[0]]
+    unused = list(range(len(old_items)))
+    for item in new_items:
+        match = next((i for i in unused if old_items[i] == item), None)
+        if match is not None:
+            unused.remove(match)
+            updated.extend(item_lines[match])
+        else:
+            updated.extend(
+                indent + line + "\n" for line in _dump_yaml([item]).splitlines()
+            )
+    return updated
+
+
+def update_env_file_text(text: str, old_specs: Dict, env_specs: Dict) -> Optional[str]:
+    """
+    Update the 'channels' and 'dependencies' sections of the '.yml' file text,
+    leaving everything else (comments, formatting, other sections) untouched.
+
+    Returns None if the file cannot be updated in place.
+    """
+
+    other_keys = set(old_specs) | set(env_specs)
+    if any(
+        old_specs.get(k) != env_specs.get(k)
+        for k in other_keys.difference(_UPDATED_SECTIONS)
+    ):
+        return None
+
+    root = yaml.compose(text, Loader=SafeLoader)
+    if not isinstance(root, yaml.MappingNode):
+        return None
+    nodes = {key.value: (key, value) for key, value in root.value}
+
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+
+    # replace sections from the bottom of the file, so line numbers stay valid
+    replacements = []
+    appended = []
+    for key in _UPDATED_SECTIONS:
+        old, new = old_specs.get(key), env_specs.get(key)
+        if old == new:
+            continue
+        if key not in nodes:
+            appended.append(_dump_yaml({key: new}))
+            continue
+
+        key_node, value_node = nodes[key]
+        start = key_node.start_mark.line
+        end = _block_end(lines, start, _node_end_line(value_node))
+
+        if new is None:
+            section = []
+        elif (
+            isinstance(value_node, yaml.SequenceNode)
+            and not value_node.flow_style
+            and value_node.value
+            and isinstance(new, list)
+            and new
+        ):
+            section = _update_sequence_lines(lines, key_node, value_node, old, new)
+        else:
+            section = _dump_yaml({key: new})
+        replacements.append((start, end, section))
+
+    for start, end, section in sorted(replacements, key=lambda r: r[0], reverse=True):
+        if isinstance(section, str):
+            section = section.splitlines(keepends=True)
+        lines[start:end] = section
+
+    return "".join(lines + appended)
+
+
+@profiled("spec write", lambda env_specs, file: {"file": file})
 def write_env_file(env_specs: Dict, file: str) -> None:
-    "Writes '.yml' file based on the specifications provided."
+    """
+    Writes '.yml' file based on the specifications provided.
+
+    An existing file is only written if the specifications changed, and then
+    only its 'channels' and 'dependencies' sections are updated.
+    """
+
+    out = None
+    if Path(file).is_file():
+        with open(file, "rb") as f:
+            text = _decode_env_file(f.read())
+        old_specs = yaml.load(text, Loader=SafeLoader)
+
+        if old_specs == env_specs:
+            return
+        if isinstance(old_specs, dict):
+            out = update_env_file_text(text, old_specs, env_specs)
+
+    if out is None:
+        out = _dump_yaml(env_specs)
 
     with open(file, "wb") as f:
-        out = yaml.safe_dump(env_specs, sort_keys=False)
         try:
             f.write(bytes(out, encoding="utf-8"))
         except TypeError:  # NOQA
@@ -105,31 +431,73 @@ def add_pkg_to_dependencies(env_specs: Dict, pkg_name: List[str]) -> Dict:
     If package/s does not exist, adds it to 'dependencies' section in 'yml' file.
     """
 
-    existing_packages = env_specs.get("dependencies")
+    dependencies = list(env_specs.get("dependencies") or [])
+    index = index_dependencies(dependencies)
 
-    # check if packages already exists
-    if existing_packages:
-        # create a list of existing packages without >,<,=
-        existing_packages_re = [re.findall(r"\w+", d)[0] for d in existing_packages]
+    for pkg in pkg_name:
+        name = spec_name(pkg)
 
-        for pkg in pkg_name:
-            # strip any >,<,= from the package name that the user provided
-            pkg_re = re.findall(r"\w+", pkg)[0]
+        # exit if package already exists in the env.yml file
+        if name in index:
+            console.print(
+                f"[yellow]'{name}' already exists. Skipping installation.\n"
+                f"[yellow]If you want to update {name}, use `update` instead."
+            )
+            raise typer.Exit()
 
-            # exit if package already exists in the env.yml file
-            if pkg_re in existing_packages_re:
-                console.print(
-                    f"[yellow]'{pkg_re}' already exists. Skipping installation.\n"
-                    f"[yellow]If you want to update {pkg_re}, use `update` instead."
-                )
-                raise typer.Exit()
+        index[name] = [len(dependencies)]
+        dependencies.append(pkg)
 
-        env_specs["dependencies"] = existing_packages + list(pkg_name)
-    else:
-        env_specs["dependencies"] = list(pkg_name)
+    env_specs["dependencies"] = dependencies
     return env_specs
 
 
+@profiled("package check")
+def check_package_specs(
+    pkg_name: List[str],
+    channels: Optional[List[str]] = None,
+    index: Optional[RepodataIndex] = None,
+) -> None:
+    """
+    Warn about packages and versions that are not in the channel data conda
+    has cached, with suggestions. Only the requested packages are looked up,
+    and the solver still has the final say.
+    """
+
+    if index is None:
+        # channel data that conda has updated is split again while the
+        # command goes on; until then the previous copy is used
+        index = RepodataIndex(background=True)
+
+    for pkg in pkg_name:
+        try:
+            spec = parse_spec(pkg)
+        except ValueError:
+            # left for the solver to report
+            continue
+        spec_channels = [spec.channel] if spec.channel else channels
+        if not index.has_channels(spec_channels):
+            continue
+
+        records = index.get(spec.name, spec_channels)
+
+        if not records:
+            message = f"[yellow]'{spec.name}' was not found in the cached channel data."
+            matches = difflib.get_close_matches(spec.name, index.names(spec_channels))
+            if matches:
+                message += f" Did you mean {', '.join(repr(m) for m in matches)}?"
+            console.print(message)
+
+        elif spec.version and not any(
+            version_matches(spec.version, r["version"]) in (True, None) for r in records
+        ):
+            versions = sorted({r["version"] for r in records}, key=version_key)
+            console.print(
+                f"[yellow]No cached version of '{spec.name}' matches '{spec.version}'. "
+                f"Latest versions: {', '.join(reversed(versions[-5:]))}"
+            )
+
+
 def add_new_channel_to_env_specs(env_specs: Dict, channel: Optional[str]) -> Dict:
     """Add new channel to the environment specifications, if it does not exist."""
 
@@ -149,73 +517,64 @@ def remove_pkg_from_dependencies(env_specs: Dict, pkg_name: List[str]) -> Dict:
     If package/s exist, remove it from 'dependencies' section in 'yml' file.
     """
 
-    existing_packages = env_specs.get("dependencies")
-
-    # check if packages exists in specifications
-    if existing_packages:
-        # create a list of existing packages without >,<,=
-        existing_packages_re = [re.findall(r"\w+", d)[0] for d in existing_packages]
-        for pkg in pkg_name:
-            # strip any >,<,= from the package name that the user provided
-            pkg_re = re.findall(r"\w+", pkg)[0]
-
-            # check if the package exists in the existing packages list
-            if pkg_re not in existing_packages_re:
-                console.print(
-                    f"[bold red]'{pkg}' is not listed in '{env_specs['name']}.yml' file!"
-                )
-                raise typer.Exit()
-
-            # this will only run if the package was found in the existing packages list
-            for ext_pkg_re, ext_pkg in zip(existing_packages_re, existing_packages):
-                if pkg_re == ext_pkg_re:
-                    existing_packages.remove(ext_pkg)
-                    existing_packages_re.remove(
-                        ext_pkg_re
-                    )  # need to remove it from this list as well otherwise zip will create an issue
-                    env_specs["dependencies"] = existing_packages
-
-    else:
+    if not env_specs.get("dependencies"):
         console.print(
             f"[bold red]There are no packages listed in '{env_specs['name']}.yml' file."
         )
         raise typer.Exit()
+
+    index = index_dependencies(env_specs["dependencies"])
+
+    removed = set()
+    for pkg in pkg_name:
+        name = spec_name(pkg)
+
+        # check if the package exists in the existing packages list
+        if name not in index:
+            console.print(
+                f"[bold red]'{pkg}' is not listed in '{env_specs['name']}.yml' file!"
+            )
+            raise typer.Exit()
+
+        # every entry of a package that is listed more than once
+        removed.update(index[name])
+
+    env_specs["dependencies"] = [
+        dep
+        for position, dep in enumerate(env_specs["dependencies"])
+        if position not in removed
+    ]
     return env_specs
 
 
-def update_channels_after_removal(env_specs: Dict, env_name: str) -> Dict:
+def update_channels_after_removal(env_specs: Dict, snapshot: "EnvSnapshot") -> Dict:
     """
     Updates channels in the environment specifications by looking at the exisiting channels in the environment.
     """
 
-    # get list of channels
-    p = subprocess.run(
-        ["conda", "list", "-n", env_name, "--json"], capture_output=True, text=True
-    )
-
     # identify unique ones and update channels in env_specs
-    complete_dict: List[Dict] = json.loads(p.stdout)
-    new_channels = list(set([d["channel"] for d in complete_dict]))
+    new_channels = snapshot.channels
     new_channels.append("defaults")  # 'defaults' needs to be added back?
     env_specs["channels"] = new_channels
     return env_specs
 
 
-def recheck_dependencies(env_specs: Dict, env_name: str) -> Dict:
+def recheck_dependencies(env_specs: Dict, snapshot: "EnvSnapshot") -> Dict:
     """
     Check if while removing a package, any dependent packages are also removed from env
     but not from .yml file. If so, remove them from .yml file
     """
-    p = subprocess.run(
-        ["conda", "list", "-n", env_name, "--json"], capture_output=True, text=True
-    )
-    complete_dict = json.loads(p.stdout)
-    all_pkgs = set([d["name"] for d in complete_dict])
+    all_pkgs = set(snapshot.package_names)
 
-    deps = env_specs["dependencies"]  # this may have dependencies with ">,<,=" symbols
-    deps_re = [re.findall(r"\w+", d)[0] for d in deps]  # removing the symbols
+    # package names without the version, build or channel
+    deps = index_dependencies(env_specs["dependencies"])
+    deps_names = {
+        name
+        for name, positions in deps.items()
+        if isinstance(env_specs["dependencies"][positions[0]], str)
+    }
 
-    rem_pkgs_to_be_removed_from_yml = set(deps_re) - all_pkgs
+    rem_pkgs_to_be_removed_from_yml = deps_names - all_pkgs
     if rem_pkgs_to_be_removed_from_yml:
         if "python" in rem_pkgs_to_be_removed_from_yml:
             rem_pkgs_to_be_removed_from_yml.remove("python")
@@ -224,3 +583,113 @@ def recheck_dependencies(env_specs: Dict, env_name: str) -> Dict:
         )
 
     return env_specs
+
+
+def get_dependent_packages(
+    pkg_name: List[str], snapshot: "EnvSnapshot", channels: List[str]
+) -> Dict[str, Set[str]]:
+    """
+    Find the installed packages that depend on each of the packages to remove.
+
+    This is answered from the reverse dependency index of the installed
+    packages, without involving the solver. `mamba repoquery whoneeds` is
+    only used when the environment prefix cannot be located.
+    """
+
+    installed_packages = set(snapshot.package_names)
+    # strip any >,<,= from the package names that the user provided
+    names = {pkg: spec_name(pkg) for pkg in pkg_name}
+    removed_packages = set(names.values())
+
+    required_by = {}
+    for pkg, name in names.items():
+        if snapshot.dependents is not None:
+            dependent_pkgs = snapshot.dependents.get(name, set())
+        else:
+            dependent_pkgs = whoneeds(pkg, channels)
+
+        # check if any of the installed packages (that are not being removed) require this as dep
+        intersection_pkgs = (dependent_pkgs & installed_packages) - removed_packages
+        if intersection_pkgs:
+            required_by[pkg] = intersection_pkgs
+    return required_by
+
+
+def confirm_dependent_removal(
+    required_by: Dict[str, Set[str]], dry_run: bool, status: "Status"
+) -> None:
+    """
+    Show the installed packages that will be removed along with each package
+    (from `get_dependent_packages`) and ask to continue, unless it is a dry run.
+    """
+
+    if not required_by:
+        return
+
+    from rich.tree import Tree
+
+    for pkg, dependent_pkgs in required_by.items():
+        tree = Tree(f"[bold yellow]{pkg} is required by[/]")
+        console.print(
+            f"[bold magenta] :warning: There are packages that depend on {pkg}\n"
+        )
+        console.print(
+            f"[bold magenta] :warning: Removing {pkg} will also remove them!\n"
+        )
+        for dep_pk in sorted(dependent_pkgs):
+            tree.add(f"[bold yellow]{dep_pk}[/]")
+        console.print(tree)
+    if not dry_run:
+        status.stop()
+        typer.confirm(f"Do you want to continue?", abort=True)
+        status.start()
+
+
+def whoneeds(pkg: str, channels: List[str]) -> Set[str]:
+    """Names of the packages in `channels` that depend on `pkg`"""
+
+    cmd = ["mamba", "repoquery", "whoneeds"]
+    for chn in channels:
+        cmd.append("-c")
+        cmd.append(chn)
+    cmd.append(f"{pkg}")
+    cmd.append("--json")
+
+    output = run_command(cmd, verbose=False)
+    formatted_output = json.loads(output.stdout)
+    return set([p["name"] for p in formatted_output["result"]["pkgs"]])
+
+
+def get_update_plan_command(
+    env_name: str, file: str, solver: Solver, frozen: Optional[List[Dict]] = None
+) -> List[str]:
+    """
+    Solver command that solves the conda dependencies of the file into a new
+    environment. `env update` has no dry-run, so the changes it would make are
+    found by comparing this solution with the installed packages.
+
+    `frozen` installed packages are pinned to their installed build, unless
+    the file has a specification for them.
+    """
+
+    env_specs = read_env_file(file)
+
+    # never created, the command is only run with '--dry-run'
+    plan_prefix = os.path.join(tempfile.gettempdir(), f"ezconda-plan-{env_name}")
+    cmd = [f"{solver.value}", "create", "-p", plan_prefix, "--override-channels"]
+    for chn in env_specs.get("channels", []):
+        cmd.append("-c")
+        cmd.append(chn)
+
+    dependencies = env_specs.get("dependencies") or []
+    specs = [dep for dep in dependencies if isinstance(dep, str)]
+    cmd.extend(specs)
+
+    specified = {spec_name(spec) for spec in specs}
+    for pkg in frozen or []:
+        if pkg["name"] not in specified and pkg.get("channel") != "pypi":
+            cmd.append(f"{pkg['name']}=={pkg['version']}={pkg['build_string']}")
+
+    if frozen is None and any(isinstance(dep, dict) for dep in dependencies):
+        console.print(f"[yellow]pip dependencies are not part of the dry-run")
+    return cmd
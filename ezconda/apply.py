@@ -0,0 +1,267 @@
+import os
+import tempfile
+import typer
+import tomlkit
+
+from tomlkit.exceptions import ParseError
+from typing import Dict, List, Optional, TYPE_CHECKING
+from pathlib import Path
+
+from .console import console
+from ._utils import (
+    get_validate_file_name,
+    read_env_file,
+    add_pkg_to_dependencies,
+    remove_pkg_from_dependencies,
+    write_env_file,
+    add_new_channel_to_env_specs,
+    check_package_specs,
+    update_channels_after_removal,
+    recheck_dependencies,
+    get_dependent_packages,
+    confirm_dependent_removal,
+    run_command,
+)
+from .solver import Solver
+from .config import get_default_solver
+from .summary import get_summary_for_revision, get_summary_for_update_plan
+from .experimental import write_lock_file
+from .snapshot import EnvSnapshot, get_snapshot
+from .matchspec import spec_name
+
+if TYPE_CHECKING:
+    from rich.status import Status
+
+
+# keys of a plan file and the command line options they are merged with
+_PLAN_KEYS = ("add", "remove", "channels")
+
+
+def read_plan_file(file: str) -> Dict[str, List[str]]:
+    """
+    Read a '.toml' plan file with lists of packages to 'add' and 'remove',
+    and 'channels' to search for the added packages.
+    """
+
+    with open(file, "r", encoding="utf-8") as f:
+        try:
+            plan = dict(tomlkit.load(f))
+        except ParseError as e:
+            console.print(f"[red]Could not read plan file '{file}': {e}")
+            raise typer.Exit(code=1)
+
+    unknown = set(plan).difference(_PLAN_KEYS)
+    if unknown:
+        console.print(
+            f"[red]Unknown key(s) in plan file '{file}': {', '.join(sorted(unknown))}. "
+            f"Expected {', '.join(_PLAN_KEYS)}"
+        )
+        raise typer.Exit(code=1)
+
+    for key in _PLAN_KEYS:
+        values = plan.setdefault(key, [])
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            console.print(
+                f"[red]'{key}' in plan file '{file}' must be a list of strings"
+            )
+            raise typer.Exit(code=1)
+        plan[key] = [str(v) for v in values]
+    return plan
+
+
+def merge_plan(
+    env_specs: Dict, add: List[str], remove: List[str], channels: List[str]
+) -> Dict:
+    """
+    Apply all edits of a plan to the environment specifications.
+
+    Removals are applied first, so a package can be removed and added back with
+    a different version (e.g. `--remove numpy --add numpy=1.22`).
+    """
+
+    if remove:
+        env_specs = remove_pkg_from_dependencies(env_specs, remove)
+    if add:
+        env_specs = add_pkg_to_dependencies(env_specs, add)
+    for channel in channels:
+        env_specs = add_new_channel_to_env_specs(env_specs, channel)
+    return env_specs
+
+
+def remove_leftover_packages(
+    env_name: str,
+    removed: List[str],
+    snapshot: EnvSnapshot,
+    solver: Solver,
+    verbose: bool,
+    status: "Status",
+) -> None:
+    """
+    Remove the packages that `env update --prune` left installed.
+
+    Pruning keeps a removed package when the remaining specifications still
+    need it, and the '.yml' file would then no longer describe the environment.
+    They are removed with `remove` (along with the packages that depend on
+    them, as confirmed before), and it is an error if any are still installed.
+    """
+
+    def _leftover() -> List[str]:
+        installed = set(snapshot.package_names)
+        return [pkg for pkg in removed if spec_name(pkg) in installed]
+
+    leftover = _leftover()
+    if not leftover:
+        return
+
+    status.update(f"[magenta]Removing {', '.join(leftover)}")
+    cmd = [f"{solver.value}", "remove", "-n", env_name, *leftover, "-y"]
+    run_command(cmd, verbose=verbose, status=status)
+    snapshot.invalidate()
+
+    leftover = _leftover()
+    if leftover:
+        console.print(
+            f"[red]Could not remove {', '.join(leftover)} from {env_name}; "
+            "the specifications were not updated"
+        )
+        raise typer.Exit(code=1)
+
+
+def apply(
+    plan_file: Optional[Path] = typer.Argument(
+        None, help="'.toml' file with the packages to 'add' and 'remove'"
+    ),
+    env_name: str = typer.Option(
+        ...,
+        "--name",
+        "-n",
+        prompt="Name of the environment to apply changes to",
+        help="Name of the environment to apply changes to",
+    ),
+    add: List[str] = typer.Option(
+        [], "--add", "-a", help="Package to install (can be repeated)"
+    ),
+    remove: List[str] = typer.Option(
+        [], "--remove", "-r", help="Package to remove (can be repeated)"
+    ),
+    file: Optional[str] = typer.Option(
+        None, "--file", "-f", help="'.yml' file to update with the changes"
+    ),
+    channel: List[str] = typer.Option(
+        [], "--channel", "-c", help="Additional channel to search for packages"
+    ),
+    solver: Solver = typer.Option(None, help="Solver to use", case_sensitive=False),
+    summary: bool = typer.Option(
+        True, "--summary", help="Show summary of changes made"
+    ),
+    verbose: Optional[bool] = typer.Option(
+        False, "--verbose", "-v", help="Display standard output from conda"
+    ),
+    lock: Optional[bool] = typer.Option(True, help="Write lockfile"),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Only show the changes that would be made and their download size",
+    ),
+):
+    """
+    Install and remove several packages at once.
+
+    All changes are solved together, and the environment file and lock file
+    are written once.
+    """
+
+    with console.status(f"[magenta]Validating file, packages, channels") as status:
+
+        add, remove, channels = list(add), list(remove), list(channel)
+        if plan_file is not None:
+            if not Path(plan_file).is_file():
+                console.print(f"[magenta]Could not locate '{plan_file}'")
+                raise typer.Exit()
+            plan = read_plan_file(plan_file)
+            add = plan["add"] + add
+            remove = plan["remove"] + remove
+            channels = plan["channels"] + channels
+
+        if not add and not remove:
+            console.print(f"[yellow]No packages to add or remove")
+            raise typer.Exit()
+
+        file = get_validate_file_name(env_name, file)
+
+        env_specs = read_env_file(file)
+        env_specs = merge_plan(env_specs, add, remove, channels)
+        if add:
+            check_package_specs(add, env_specs.get("channels"))
+
+        snapshot = get_snapshot(env_name)
+
+        if remove:
+            # packages that are added back are not removed from the environment
+            added = {spec_name(pkg) for pkg in add}
+            removed = [pkg for pkg in remove if spec_name(pkg) not in added]
+            required_by = get_dependent_packages(
+                removed, snapshot, env_specs["channels"]
+            )
+
+            confirm_dependent_removal(required_by, dry_run, status)
+
+        if solver is None:
+            solver = get_default_solver()
+
+        status.update(f"[magenta]Resolving & Applying changes using {solver.value}")
+
+        # the updated specifications are solved in one transaction from a
+        # temporary file, so the '.yml' file is only changed if the solve works
+        fd, plan_specs_file = tempfile.mkstemp(prefix=f"{env_name}-", suffix=".yml")
+        os.close(fd)
+        try:
+            write_env_file(env_specs, plan_specs_file)
+
+            if dry_run:
+                get_summary_for_update_plan(
+                    env_name, plan_specs_file, solver, snapshot.packages
+                )
+                return
+
+            cmd = [
+                f"{solver.value}",
+                "env",
+                "update",
+                "-n",
+                env_name,
+                "--file",
+                plan_specs_file,
+                "--prune",
+            ]
+            run_command(cmd, verbose=verbose, status=status)
+        finally:
+            os.unlink(plan_specs_file)
+
+        snapshot.invalidate()
+
+        if remove:
+            remove_leftover_packages(
+                env_name, removed, snapshot, solver, verbose, status
+            )
+            env_specs = update_channels_after_removal(env_specs, snapshot)
+            env_specs = recheck_dependencies(env_specs, snapshot)
+
+        console.print(
+            f"[bold green] :rocket: Applied {len(add)} additions and "
+            f"{len(remove)} removals to {env_name}"
+        )
+
+        status.update(f"[magenta]Writing specifications to {file}")
+        write_env_file(env_specs, file)
+        console.print(f"[bold green] :floppy_disk: Updated specifications in '{file}'")
+
+        if lock:
+            status.update(f"[magenta]Writing lock file")
+
+            write_lock_file(env_name, snapshot)
+
+        console.print(f"[bold green] :star: Done!")
+
+        if summary:
+            get_summary_for_revision(env_name, snapshot=snapshot)
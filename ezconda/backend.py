@@ -0,0 +1,102 @@
+import subprocess
+import threading
+
+from enum import Enum
+from typing import Dict, List, Optional
+
+
+class Backend(str, Enum):
+    """How solver commands are run"""
+
+    subprocess = "subprocess"
+    inprocess = "inprocess"
+
+
+# sub-commands that start other programs, so gain nothing from running in-process
+_SUBPROCESS_ONLY = ("run", "activate", "deactivate", "init", "shell")
+
+# sub-commands that solve, so take the `--solver` option
+_SOLVER_COMMANDS = (
+    ("create",),
+    ("install",),
+    ("update",),
+    ("upgrade",),
+    ("remove",),
+    ("uninstall",),
+    ("env", "create"),
+    ("env", "update"),
+)
+
+
+def conda_api_available() -> bool:
+    """Whether conda can be imported by this interpreter (e.g. ezconda is in 'base')"""
+
+    try:
+        from conda.cli.main import main_subshell  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def libmamba_available() -> bool:
+    """Whether the libmamba solver plugin for conda is installed"""
+
+    try:
+        import conda_libmamba_solver  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run_in_process(
+    command: List[str],
+    capture_output: bool = True,
+    text: bool = True,
+    env: Optional[Dict[str, str]] = None,
+) -> Optional[subprocess.CompletedProcess]:
+    """
+    Run a `conda ...` or `mamba ...` command with conda's Python API in this
+    process, so that repodata and solver state loaded by one command are
+    reused by the next. `mamba` commands use conda with the libmamba solver.
+
+    Returns None if the command cannot run in-process, e.g. conda is not
+    importable or `mamba` is asked for without the libmamba solver.
+
+    conda's configuration ('context') is global to the process and read from
+    its environment variables, so commands that need other environment
+    variables (`env`), or that are run from other threads (which would have
+    to wait for each other), also return None and run as subprocesses.
+    """
+
+    executable, *args = command
+    if executable not in ("conda", "mamba") or not args or args[0] in _SUBPROCESS_ONLY:
+        return None
+    if env is not None or threading.current_thread() is not threading.main_thread():
+        return None
+    if not conda_api_available():
+        return None
+    if executable == "mamba" and not libmamba_available():
+        return None
+
+    from conda.cli.main import main_subshell
+    from conda.common.io import captured
+    from conda.exceptions import conda_exception_handler
+
+    if executable == "mamba":
+        for subcommand in _SOLVER_COMMANDS:
+            if tuple(args[: len(subcommand)]) == subcommand:
+                n = len(subcommand)
+                args = [*args[:n], "--solver", "libmamba", *args[n:]]
+                break
+
+    if capture_output:
+        with captured() as c:
+            returncode = conda_exception_handler(main_subshell, *args)
+        stdout, stderr = c.stdout, c.stderr
+    else:
+        returncode = conda_exception_handler(main_subshell, *args)
+        stdout = stderr = None
+
+    if not text and capture_output:
+        stdout, stderr = stdout.encode(), stderr.encode()
+    return subprocess.CompletedProcess(command, returncode or 0, stdout, stderr)
@@ -0,0 +1,218 @@
+"""
+Entry point of the `ezconda` command.
+
+When `ezconda daemon` is running, commands are forwarded to it over a Unix
+socket; otherwise they run in this process. Only the standard library is
+imported before a command is forwarded.
+"""
+import os
+import sys
+import stat
+from typing import Dict, List, Optional
+
+
+DAEMON_SOCKET_VAR = "EZCONDA_DAEMON_SOCKET"
+NO_DAEMON_VAR = "EZCONDA_NO_DAEMON"
+
+# commands that always run in the calling process
+LOCAL_COMMANDS = ("daemon",)
+
+# exit code of a command that was interrupted with Ctrl-C
+INTERRUPTED_EXIT_CODE = 130
+
+
+def get_daemon_socket() -> Optional[str]:
+    """Path of the socket `ezconda daemon` listens on; None where unsupported"""
+
+    if sys.platform == "win32":
+        return None
+    if os.environ.get(DAEMON_SOCKET_VAR):
+        return os.environ[DAEMON_SOCKET_VAR]
+    # the socket is kept in a directory that only the user can access
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR")
+    return os.path.join(runtime_dir or "/tmp", f"ezconda-{os.getuid()}", "daemon.sock")
+
+
+def is_private_dir(path: str) -> bool:
+    """Whether the directory belongs to the user and nobody else can write to it"""
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISDIR(st.st_mode)
+        and st.st_uid == os.getuid()
+        and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    )
+
+
+def is_private_socket(socket_path: str) -> bool:
+    """Whether the socket and its directory belong to the user"""
+
+    try:
+        st = os.lstat(socket_path)
+    except OSError:
+        return False
+    return (
+        stat.S_ISSOCK(st.st_mode)
+        and st.st_uid == os.getuid()
+        and is_private_dir(os.path.dirname(socket_path) or ".")
+    )
+
+
+def get_peer_uid(sock) -> Optional[int]:
+    """
+    User id of the process at the other end of a Unix socket, or None if the
+    platform does not tell
+    """
+
+    import socket
+    import struct
+
+    if hasattr(socket, "SO_PEERCRED"):
+        # Linux: struct ucred {pid_t pid; uid_t uid; gid_t gid;}
+        creds = sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        return struct.unpack("3i", creds)[1]
+    if hasattr(socket, "LOCAL_PEERCRED"):
+        # macOS & BSD: struct xucred {u_int version; uid_t uid; short ngroups; ...}
+        size = struct.calcsize("2Ih16I")
+        creds = sock.getsockopt(0, socket.LOCAL_PEERCRED, size)
+        return struct.unpack_from("2I", creds)[1]
+    return None
+
+
+def send_message(sock, message: Dict, fds: Optional[List[int]] = None) -> None:
+    """Send a JSON message, optionally passing file descriptors along with it"""
+
+    import json
+    import socket
+    import array
+
+    data = json.dumps(message).encode() + b"\n"
+    if fds:
+        ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+        sent = sock.sendmsg([data], ancdata)
+        data = data[sent:]
+    # the daemon may already have run a short command and closed the
+    # connection, so sending nothing more would fail with a broken pipe
+    if data:
+        sock.sendall(data)
+
+
+def read_line(sock, data: bytes = b"") -> bytes:
+    """Read from the socket up to the end of the line (or the connection)"""
+
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def connect(socket_path: Optional[str] = None):
+    """Connected socket of the running daemon, or None if there is none"""
+
+    socket_path = socket_path or get_daemon_socket()
+    if socket_path is None or not os.path.exists(socket_path):
+        return None
+
+    # the environment and terminal of the command are sent to the daemon,
+    # so only a daemon of the same user is trusted with them
+    if not is_private_socket(socket_path):
+        sys.stderr.write(
+            f"ezconda: ignoring daemon socket '{socket_path}' - it, or its "
+            f"directory, belongs to another user or can be written by others\n"
+        )
+        return None
+
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        # stale socket of a daemon that is no longer running
+        sock.close()
+        return None
+
+    peer_uid = get_peer_uid(sock)
+    if peer_uid is not None and peer_uid != os.getuid():
+        sock.close()
+        sys.stderr.write(
+            f"ezconda: ignoring daemon socket '{socket_path}' - "
+            f"the daemon runs as another user\n"
+        )
+        return None
+    return sock
+
+
+def cancel_in_daemon(sock) -> int:
+    """
+    Ask the daemon to stop the running command after Ctrl-C, and wait a
+    little for its processes to stop writing to the terminal.
+    """
+
+    try:
+        send_message(sock, {"cancel": True})
+        sock.settimeout(10)
+        read_line(sock)
+    except (OSError, KeyboardInterrupt):
+        # the daemon went away, did not stop in time, or Ctrl-C was pressed again
+        pass
+    return INTERRUPTED_EXIT_CODE
+
+
+def run_in_daemon(argv: List[str], socket_path: Optional[str] = None) -> Optional[int]:
+    """
+    Run a command in the daemon, with this process's working directory,
+    environment variables, stdin, stdout and stderr.
+    Returns the exit code, or None if no daemon is running.
+    """
+
+    import json
+
+    sock = connect(socket_path)
+    if sock is None:
+        return None
+
+    with sock:
+        request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+        try:
+            send_message(sock, request, fds=[0, 1, 2])
+        except OSError:
+            # e.g. stdin is closed; nothing was run yet
+            return None
+
+        try:
+            response = read_line(sock)
+        except KeyboardInterrupt:
+            return cancel_in_daemon(sock)
+
+    if not response:
+        sys.stderr.write("ezconda daemon stopped before the command finished\n")
+        return 1
+    return json.loads(response)["exit"]
+
+
+def main() -> None:
+    """Run `ezconda` in the daemon if it is running, otherwise in this process"""
+
+    argv = sys.argv[1:]
+    if (
+        argv
+        and argv[0] not in LOCAL_COMMANDS
+        and not os.environ.get(NO_DAEMON_VAR)
+        # shell completion
+        and not os.environ.get("_EZCONDA_COMPLETE")
+    ):
+        exit_code = run_in_daemon(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    from .main import app
+
+    app()
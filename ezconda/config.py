@@ -4,32 +4,45 @@ from typing import Optional, Dict
 import tomlkit
 
 from .solver import Solver
+from .backend import Backend, conda_api_available
 
 from .console import console
+from .profiling import profiled
 
 
 # get ezconda config file
 app_dir = typer.get_app_dir("ezconda")
 config_file: Path = Path(app_dir) / "config.toml"
 
+# (config file, mtime, size) -> configs of the last config file read
+_configs_cache: Dict = {}
 
+
+@profiled("config load")
 def check_configs(
     app_dir: str = app_dir, config_file: Path = config_file
 ) -> Optional[Dict]:
     """
     Check app config file for user settings.
     Retruns a dict of configs if they exist.
+    The file is only parsed again when it changes.
     """
 
     # check if directory exists
     if Path(app_dir).is_dir():
         # check if config file exists
         if config_file.is_file():
-            with open(config_file, "r") as f:
-                configs = tomlkit.load(f)
-            return configs
+            stat = config_file.stat()
+            key = (str(config_file), stat.st_mtime_ns, stat.st_size)
+            if key not in _configs_cache:
+                with open(config_file, "r") as f:
+                    configs = tomlkit.load(f)
+                _configs_cache.clear()
+                _configs_cache[key] = configs
+            return _configs_cache[key]
 
 
+@profiled("config load")
 def make_and_read_config_file(
     app_dir: str = app_dir, config_file: Path = config_file
 ) -> Dict:
@@ -70,6 +83,17 @@ def get_default_solver() -> Solver:
     return solver
 
 
+def get_default_backend() -> Backend:
+    """Checks config file for the backend that runs solver commands.
+    If it is not set, solver commands are run as subprocesses.
+    """
+    config = check_configs()
+
+    if config and config.get("backend") is not None:
+        return Backend(config["backend"])
+    return Backend.subprocess
+
+
 def config(
     solver: Solver = typer.Option(
         None,
@@ -77,6 +101,12 @@ def config(
         help="Set default solver",
         case_sensitive=False,
     ),
+    backend: Backend = typer.Option(
+        None,
+        "--backend",
+        help="Run solver commands as subprocesses or in-process with conda's Python API",
+        case_sensitive=False,
+    ),
     show: bool = typer.Option(False, "--show", help="Show current config"),
 ):
     """
@@ -87,6 +117,15 @@ def config(
     if solver:
         configs.update({"solver": solver})
 
+    if backend:
+        if backend == Backend.inprocess and not conda_api_available():
+            console.print(
+                f"[yellow]conda can't be imported by this Python; solver commands "
+                f"will keep running as subprocesses until ezconda is installed "
+                f"in the same environment as conda"
+            )
+        configs.update({"backend": backend})
+
     with open(config_file, "w") as f:
         tomlkit.dump(configs, f)
 
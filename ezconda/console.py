@@ -1,4 +1,27 @@
+import os
+
+from typing import IO, Optional
 from rich.console import Console
 
 
 console = Console()
+
+
+def _env_int(name: str) -> Optional[int]:
+
+    value = os.environ.get(name, "")
+    return int(value) if value.isdigit() else None
+
+
+def reset_console(file: Optional[IO[str]] = None) -> None:
+    """
+    Point `console` at `file` (the current standard output when not given)
+    and detect the size and color support of the terminal again, as creating
+    the console does. Used by `ezconda daemon` for the streams of each client.
+    """
+
+    console.file = file
+    console.size = (_env_int("COLUMNS"), _env_int("LINES"))
+    console._color_system = console._detect_color_system()
+    console.no_color = os.environ.get("NO_COLOR", "") != ""
+    console.is_interactive = console.is_terminal and not console.is_dumb_terminal
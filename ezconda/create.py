@@ -12,6 +12,7 @@ from ._utils import create_initial_env_specs, write_env_file, read_env_file, run
 from .solver import Solver
 from .summary import get_summary_for_revision
 from .experimental import write_lock_file
+from .snapshot import get_snapshot
 from .config import get_default_solver
 
 
@@ -102,7 +103,8 @@ def create(
                     "-y",
                 ]
 
-            run_command(cmd, verbose=verbose)
+            run_command(cmd, verbose=verbose, status=status)
+            snapshot = get_snapshot(name)
 
             console.print(f"[bold green] :rocket: Created '{name}' environment")
 
@@ -117,15 +119,16 @@ def create(
             ):  # only write lock file if packages are mentioned during env creation
                 status.update(f"[magenta]Writing lock file")
 
-                write_lock_file(name)
+                write_lock_file(name, snapshot)
 
         if summary:
-            get_summary_for_revision(name)
+            get_summary_for_revision(name, snapshot=snapshot)
 
     elif Path(file).exists():
         # create from lock file
         if file.endswith(".lock"):
             name = read_lock_file_and_install(file, solver, verbose, name)
+            snapshot = get_snapshot(name)
         else:
             # create from yml spec file
             with console.status(
@@ -133,22 +136,23 @@ def create(
             ) as status:
 
                 cmd = [f"{solver.value}", "env", "create", "--file", file]
-                run_command(cmd, verbose=verbose)
+                run_command(cmd, verbose=verbose, status=status)
 
                 # get env name from yml file
                 name = read_env_file(file)["name"]
+                snapshot = get_snapshot(name)
                 console.print(f"[bold green] :rocket: Created '{name}' environment")
 
                 if (
                     lock
                 ):  # only write lock file if packages are mentioned during env creation
                     status.update(f"[magenta]Writing lock file")
-                    write_lock_file(name)
+                    write_lock_file(name, snapshot)
 
         console.print(f"[bold green] :star: Done!")
 
         if summary:
-            get_summary_for_revision(name)
+            get_summary_for_revision(name, snapshot=snapshot)
 
     else:
         if not Path(file).is_file():
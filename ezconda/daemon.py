@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import array
+import socket
+import threading
+import traceback
+import typer
+
+from importlib import import_module
+from typing import Dict, List, Tuple
+
+from .backend import Backend, conda_api_available
+from ._utils import cancel_commands, reset_cancelled
+from .client import (
+    DAEMON_SOCKET_VAR,
+    INTERRUPTED_EXIT_CODE,
+    connect,
+    get_daemon_socket,
+    get_peer_uid,
+    is_private_dir,
+    read_line,
+    send_message,
+)
+from .config import get_default_backend
+from .console import console, reset_console
+from .snapshot import keep_snapshots
+
+
+# stdin, stdout and stderr
+_STD_FDS = (0, 1, 2)
+
+
+def _receive_request(conn: socket.socket) -> Tuple[Dict, List[int]]:
+    """
+    Read a request and the file descriptors sent with it. The descriptors are
+    closed again when the request cannot be read.
+    """
+
+    fds = array.array("i")
+    data, ancdata, _, _ = conn.recvmsg(
+        65536, socket.CMSG_SPACE(len(_STD_FDS) * fds.itemsize)
+    )
+    for level, kind, fd_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(fd_data[: len(fd_data) - len(fd_data) % fds.itemsize])
+    try:
+        data = read_line(conn, data)
+        return json.loads(data), list(fds)
+    except (OSError, ValueError):
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def _detach_client_streams() -> None:
+    """Point stdin, stdout and stderr at /dev/null instead of the client's terminal"""
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in _STD_FDS:
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+class _CancelWatcher:
+    """
+    Stops the running command when its client asks for it (after Ctrl-C) or
+    goes away: the client's terminal is detached from the daemon, so nothing
+    more is written to it, and the processes of the command are interrupted.
+    """
+
+    def __init__(self, conn: socket.socket) -> None:
+
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.finished = False
+        self.cancelled = False
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+        self.thread.start()
+
+    def _watch(self) -> None:
+
+        try:
+            # the client sends nothing else while the command runs
+            self.conn.recv(1)
+        except OSError:
+            pass
+
+        with self.lock:
+            if self.finished:
+                return
+            self.cancelled = True
+            _detach_client_streams()
+        cancel_commands()
+
+    def finish(self) -> None:
+        """Mark the command as done; it can no longer be cancelled after this"""
+
+        with self.lock:
+            self.finished = True
+
+    def stop(self) -> None:
+        """Wake the watching thread up and wait for it"""
+
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.thread.join()
+
+
+def _exit_code(code) -> int:
+
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_request(
+    command, request: Dict, fds: List[int], watcher: _CancelWatcher
+) -> int:
+    """
+    Run a command as if it was started by the client: with the client's
+    working directory, environment variables, stdin, stdout and stderr.
+    """
+
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    streams = (sys.stdin, sys.stdout, sys.stderr)
+    saved_fds = [os.dup(fd) for fd in _STD_FDS]
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        # the client's streams replace ours for the processes conda is run in,
+        # and new file objects are opened on them for this process
+        for fd, client_fd in zip(_STD_FDS, fds):
+            os.dup2(client_fd, fd)
+
+        try:
+            sys.stdin = open(0, "r", closefd=False)
+            sys.stdout = open(
+                1, "w", buffering=1 if os.isatty(1) else -1, closefd=False
+            )
+            sys.stderr = open(2, "w", buffering=1, closefd=False)
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+            # detect the size and color support of the client's terminal
+            reset_console(sys.stdout)
+
+            command.main(args=request["argv"], prog_name="ezconda")
+        except SystemExit as e:
+            return _exit_code(e.code)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+    finally:
+        watcher.finish()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdin, sys.stdout, sys.stderr = streams
+        for fd, saved_fd in zip(_STD_FDS, saved_fds):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+        for fd in fds:
+            os.close(fd)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+        reset_console()
+
+
+def _load_commands():
+    """Import every command up front and keep environment snapshots between commands"""
+
+    from .main import app, LAZY_COMMANDS
+
+    command = typer.main.get_command(app)
+    for name in LAZY_COMMANDS:
+        command.get_command(None, name)
+    # modules that commands import on first use
+    for module in ("yaml", "tomlkit", "rich.tree", "rich.table"):
+        import_module(module)
+
+    # conda itself, when solver commands run in this process
+    if get_default_backend() == Backend.inprocess and conda_api_available():
+        import_module("conda.cli.conda_argparse")
+
+    keep_snapshots()
+    return command
+
+
+def serve(socket_path: str) -> None:
+    """Serve commands on the socket, one at a time, until asked to stop"""
+
+    command = _load_commands()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # only the current user may connect
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    server.listen()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                peer_uid = get_peer_uid(conn)
+                if peer_uid is not None and peer_uid != os.getuid():
+                    continue
+
+                try:
+                    request, fds = _receive_request(conn)
+                except (OSError, ValueError):
+                    continue
+
+                if request.get("stop"):
+                    for fd in fds:
+                        os.close(fd)
+                    send_message(conn, {"exit": 0})
+                    break
+
+                reset_cancelled()
+                watcher = _CancelWatcher(conn)
+                exit_code = _run_request(command, request, fds, watcher)
+                if watcher.cancelled:
+                    exit_code = INTERRUPTED_EXIT_CODE
+                try:
+                    send_message(conn, {"exit": exit_code})
+                except OSError:
+                    # the client went away
+                    pass
+                watcher.stop()
+    finally:
+        server.close()
+        os.unlink(socket_path)
+
+
+def daemon(
+    stop: bool = typer.Option(False, "--stop", help="Stop the running daemon"),
+):
+    """
+    Run a background process that serves ezconda commands.
+
+    While it is running, `ezconda` forwards every command to it, so commands
+    skip starting Python and importing their dependencies, and reuse the
+    environments and files read by earlier commands.
+    """
+
+    socket_path = get_daemon_socket()
+    if socket_path is None or not hasattr(socket, "AF_UNIX"):
+        console.print(f"[red]'ezconda daemon' is not supported on {sys.platform}")
+        raise typer.Exit(code=1)
+
+    sock = connect(socket_path)
+
+    if stop:
+        if sock is None:
+            console.print(f"[magenta]ezconda daemon is not running")
+            raise typer.Exit()
+        with sock:
+            send_message(sock, {"stop": True})
+            read_line(sock)
+        console.print(f"[bold green] :stop_sign: Stopped ezconda daemon")
+        return
+
+    if sock is not None:
+        sock.close()
+        console.print(f"[magenta]ezconda daemon is already running on '{socket_path}'")
+        raise typer.Exit()
+
+    # the socket is only created in a directory that nobody else can write to
+    socket_dir = os.path.dirname(socket_path) or "."
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    if not is_private_dir(socket_dir):
+        console.print(
+            f"[red]'{socket_dir}' belongs to another user or can be written by "
+            f"others; set {DAEMON_SOCKET_VAR} to a socket in a private directory"
+        )
+        raise typer.Exit(code=1)
+
+    if os.path.exists(socket_path):
+        # left behind by a daemon that did not shut down cleanly
+        os.unlink(socket_path)
+
+    console.print(f"[bold green] :zap: ezconda daemon listening on '{socket_path}'")
+    try:
+        serve(socket_path)
+    except KeyboardInterrupt:
+        pass
+    console.print(f"[bold green] :stop_sign: Stopped ezconda daemon")
@@ -1,33 +1,287 @@
+import os
+import json
+import time
+import tempfile
 import typer
+from pathlib import Path
+from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from rich.table import Table
+
 from ..console import console
-from ..files.lockfile import LockFile
+from ..files.lockfile import LockFile, Platform, with_artifact_info
+from ..files.prefix import list_env_prefixes, read_cached_package_record
+from ..snapshot import EnvSnapshot
+from .._utils import get_validate_file_name, read_env_file, run_command
+from ..solver import Solver
+from ..config import get_default_solver
 
 
-__all__ = ["write_lock_file", "lock"]
+__all__ = [
+    "write_lock_file",
+    "write_lock_files",
+    "write_platform_lock_files",
+    "lock",
+]
 
 
-def write_lock_file(env_name: str) -> None:
+def write_lock_file(
+    env_name: str,
+    snapshot: Optional[EnvSnapshot] = None,
+    lockfile_dir: Optional[Path] = None,
+) -> Path:
     """
     Writes a lock file for the environment specified.
     """
 
     lockfile = LockFile()
-    lockfile.write_lockfile(env_name)
+    return lockfile.write_lockfile(env_name, snapshot, lockfile_dir)
+
+
+def find_environments_to_lock(directory: Optional[Path] = None) -> Dict[str, Path]:
+    """
+    Find environments to lock and the directory to write each lock file to.
+
+    Without a directory, every environment is locked into the current directory.
+    With a directory, only environments that have a matching '<name>.yml' file
+    somewhere in the directory tree are locked, next to their '.yml' file.
+    """
+
+    env_names = list_env_prefixes()
+
+    if directory is None:
+        return {env_name: Path(".") for env_name in env_names}
+
+    environments = {}
+    for specfile in sorted(Path(directory).rglob("*.yml")):
+        if specfile.stem in env_names and specfile.stem not in environments:
+            environments[specfile.stem] = specfile.parent
+    return environments
+
+
+def write_lock_files(environments: Dict[str, Path], workers: int) -> List[Dict]:
+    """
+    Write lock files for many environments concurrently with a bounded pool
+    of workers and return the outcome and timing for each environment.
+    """
+
+    def _lock(env_name: str) -> Dict:
+
+        start = time.perf_counter()
+        try:
+            lockfile_name = write_lock_file(
+                env_name, lockfile_dir=environments[env_name]
+            )
+            status = "locked"
+        except Exception as error:
+            # e.g. a broken 'conda-meta' record; the other environments are
+            # still locked and the failure is reported in the table
+            lockfile_name = None
+            status = "failed"
+            if not isinstance(error, typer.Exit):
+                status += f" ({type(error).__name__}: {error})"
+
+        return {
+            "name": env_name,
+            "lockfile": lockfile_name,
+            "status": status,
+            "seconds": time.perf_counter() - start,
+        }
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_lock, environments))
+
+
+def solve_for_platform(
+    env_specs: Dict, platform: Platform, solver: Solver
+) -> List[Dict]:
+    """
+    Solve the environment specifications for `platform` without installing
+    anything and return the packages that would be installed.
+    """
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the prefix does not exist, so the dry-run solves for a new environment
+        cmd = [
+            f"{solver.value}",
+            "create",
+            "-p",
+            str(Path(tmpdir) / "env"),
+            "--dry-run",
+            "--json",
+            "--override-channels",
+        ]
+        for chn in env_specs.get("channels", []):
+            cmd.append("-c")
+            cmd.append(chn)
+        # pip dependencies cannot be solved for other platforms
+        cmd.extend(
+            dep for dep in env_specs.get("dependencies", []) if isinstance(dep, str)
+        )
+
+        output = run_command(cmd, env={**os.environ, "CONDA_SUBDIR": platform.value})
+
+    actions = json.loads(output.stdout).get("actions", {})
+    packages = sorted(actions.get("LINK", []), key=lambda pkg: pkg["name"])
+
+    # 'LINK' actions have no file name or checksums: packages that are not in
+    # the package cache have them in the 'FETCH' actions, and cached packages
+    # in the repodata record of the cache
+    records = list(actions.get("FETCH", []))
+    fetched = {record["name"] for record in records}
+    for pkg in packages:
+        if pkg["name"] not in fetched:
+            record = read_cached_package_record(pkg)
+            if record is not None:
+                records.append(record)
+    packages = list(with_artifact_info(packages, records))
+
+    # a guessed file name may not exist on the channel (e.g. '.conda' only builds)
+    unknown = [pkg["dist_name"] for pkg in packages if "fn" not in pkg]
+    if unknown:
+        console.print(
+            f"[red]Could not find the package files of {', '.join(unknown)} "
+            f"for {platform.value}; the lock file was not written"
+        )
+        raise typer.Exit(code=1)
+    return packages
+
+
+def write_platform_lock_files(
+    env_name: str,
+    env_specs: Dict,
+    platforms: List[Platform],
+    solver: Solver,
+    lockfile_dir: Optional[Path] = None,
+) -> List[Dict]:
+    """
+    Write a lock file for each platform from the environment specifications.
+
+    Every platform is solved in its own solver process and all of them run
+    at the same time, so this takes about as long as the slowest solve.
+    """
+
+    def _lock(platform: Platform) -> Dict:
+
+        start = time.perf_counter()
+        packages = solve_for_platform(env_specs, platform, solver)
+        lockfile_name = LockFile().write_platform_lockfile(
+            env_name, platform, packages, lockfile_dir
+        )
+
+        return {
+            "name": f"{env_name} ({platform.value})",
+            "lockfile": lockfile_name,
+            "status": "locked",
+            "seconds": time.perf_counter() - start,
+        }
+
+    with ThreadPoolExecutor(max_workers=len(platforms) or 1) as executor:
+        return list(executor.map(_lock, platforms))
+
+
+def print_lock_timings(results: List[Dict]) -> None:
+    """Print a table with the lock file and time taken for each environment."""
+
+    table = Table(title="Lock files")
+    table.add_column("Environment", style="magenta")
+    table.add_column("Lock file")
+    table.add_column("Status")
+    table.add_column("Time (s)", justify="right")
+
+    for result in sorted(results, key=lambda r: r["seconds"], reverse=True):
+        status_style = "green" if result["status"] == "locked" else "red"
+        table.add_row(
+            result["name"],
+            str(result["lockfile"] or ""),
+            f"[{status_style}]{result['status']}[/]",
+            f"{result['seconds']:.2f}",
+        )
+
+    console.print(table)
 
 
 def lock(
-    env_name: str = typer.Option(
-        ...,
+    env_name: Optional[str] = typer.Option(
+        None,
         "--name",
         "-n",
-        prompt="Name of the environment",
         help="Name of the environment to generate lock file for",
     ),
+    all_envs: bool = typer.Option(
+        False,
+        "--all",
+        help="Generate lock files for all environments",
+    ),
+    directory: Optional[Path] = typer.Option(
+        None,
+        "--dir",
+        help="With '--all', only lock environments that have a '<name>.yml' file in this directory tree",
+    ),
+    workers: int = typer.Option(
+        min(8, os.cpu_count() or 1),
+        "--workers",
+        "-j",
+        help="Number of environments to lock concurrently with '--all'",
+    ),
+    platforms: Optional[List[Platform]] = typer.Option(
+        None,
+        "--platform",
+        "-p",
+        help="Solve the '.yml' file and generate a lock file for this platform (can be repeated)",
+        case_sensitive=False,
+    ),
+    file: Optional[str] = typer.Option(
+        None, "--file", "-f", help="'.yml' file to solve with '--platform'"
+    ),
+    solver: Solver = typer.Option(
+        None, help="Solver to use with '--platform'", case_sensitive=False
+    ),
 ) -> None:
     """
     Generate lock file for a conda environment
     """
-    with console.status(f"[magenta]Writing lock file"):
-        write_lock_file(env_name)
+    if directory is not None and not all_envs:
+        console.print("[red]'--dir' can only be used with '--all'")
+        raise typer.Exit(code=1)
+
+    if platforms:
+        if env_name is None:
+            env_name = typer.prompt("Name of the environment")
+
+        with console.status(f"[magenta]Solving for {len(platforms)} platform(s)"):
+            file = get_validate_file_name(env_name, file)
+            env_specs = read_env_file(file)
+
+            if any(
+                not isinstance(dep, str) for dep in env_specs.get("dependencies", [])
+            ):
+                console.print(
+                    "[yellow]pip dependencies are not included in platform lock files"
+                )
+
+            if solver is None:
+                solver = get_default_solver()
+
+            results = write_platform_lock_files(
+                env_name, env_specs, list(dict.fromkeys(platforms)), solver
+            )
+
+        print_lock_timings(results)
+
+    elif all_envs:
+        with console.status(f"[magenta]Writing lock files"):
+            environments = find_environments_to_lock(directory)
+            results = write_lock_files(environments, max(1, workers))
+
+        print_lock_timings(results)
+
+    else:
+        if env_name is None:
+            env_name = typer.prompt("Name of the environment")
+
+        with console.status(f"[magenta]Writing lock file"):
+            write_lock_file(env_name)
 
     console.print(f"[bold green] :star: Done!")
@@ -0,0 +1,79 @@
+import typer
+
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from .console import console
+from .files.fetch import (
+    DEFAULT_FETCH_WORKERS,
+    fetch_packages,
+    needs_conda_network_config,
+)
+from .files.lockfile import LockFile, get_package_downloads
+from .files.prefix import get_writable_pkgs_dir, read_condarc
+
+
+def fetch(
+    lock_file: Path = typer.Argument(..., help="Lock file to download packages for"),
+    workers: int = typer.Option(
+        DEFAULT_FETCH_WORKERS,
+        "--workers",
+        "-j",
+        help="Number of packages to download concurrently",
+    ),
+    pkgs_dir: Optional[Path] = typer.Option(
+        None,
+        "--pkgs-dir",
+        help="Package cache to download into (defaults to conda's package cache)",
+    ),
+):
+    """
+    Download the packages in a lock file into the package cache.
+
+    Creating an environment from the lock file afterwards only needs to
+    extract and link the packages.
+    """
+
+    if not lock_file.is_file():
+        console.print(f"[magenta]Could not locate '{lock_file}'")
+        raise typer.Exit()
+
+    if pkgs_dir is None:
+        pkgs_dir = get_writable_pkgs_dir()
+        if pkgs_dir is None:
+            console.print(f"[red]None of conda's package caches can be written to")
+            raise typer.Exit(code=1)
+
+    with console.status(f"[magenta]Downloading packages into '{pkgs_dir}'"):
+        doc = LockFile().read_lock_file(lock_file)
+        config = read_condarc()
+        downloads, skipped = [], []
+        for download in get_package_downloads(doc["packages"]):
+            if needs_conda_network_config(download["url"], config):
+                skipped.append(download)
+            else:
+                downloads.append(download)
+        results = fetch_packages(downloads, pkgs_dir, workers)
+
+    counts = Counter(r["status"] for r in results)
+
+    for result in results:
+        if result["status"] == "failed":
+            console.print(f"[red]Failed to download {result['url']}: {result['error']}")
+
+    console.print(
+        f"[bold green] :package: {counts['downloaded'] + counts['resumed']} downloaded "
+        f"({counts['resumed']} resumed), {counts['cached']} already cached"
+    )
+
+    if skipped:
+        console.print(
+            f"[yellow]{len(skipped)} packages need conda's proxy, SSL or channel "
+            f"credential settings and are left for conda to download"
+        )
+
+    if counts["failed"]:
+        raise typer.Exit(code=1)
+
+    console.print(f"[bold green] :star: Done!")
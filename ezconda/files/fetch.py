@@ -0,0 +1,227 @@
+import os
+import hashlib
+import fnmatch
+import threading
+
+from pathlib import Path
+from http.client import HTTPException
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from ..console import console
+
+
+CHUNK_SIZE = 1024 * 1024
+PARTIAL_SUFFIX = ".partial"
+DEFAULT_FETCH_WORKERS = 8
+
+_urls_txt_lock = threading.Lock()
+
+# conda settings for its downloads that urllib does not know about
+_NETWORK_SETTINGS = ("proxy_servers", "client_ssl_cert", "client_ssl_cert_key")
+
+
+class ChecksumError(Exception):
+    """Downloaded package does not match the checksum in the lock file"""
+
+
+def file_checksum(path: Path, algorithm: str) -> str:
+
+    checksum = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def verify_checksums(
+    path: Path, md5: Optional[str] = None, sha256: Optional[str] = None
+) -> bool:
+    """Check the file against the checksums that are known, sha256 first"""
+
+    if sha256:
+        return file_checksum(path, "sha256") == sha256
+    if md5:
+        return file_checksum(path, "md5") == md5
+    return True
+
+
+def add_to_urls_txt(pkgs_dir: Path, urls: List[str]) -> None:
+    """
+    Record where the packages in the cache came from in 'urls.txt',
+    conda uses it to match cached packages to their channel.
+    """
+
+    urls_txt = Path(pkgs_dir) / "urls.txt"
+    with _urls_txt_lock:
+        known_urls = set()
+        if urls_txt.is_file():
+            with open(urls_txt, "r", encoding="utf-8") as f:
+                known_urls = {line.strip() for line in f}
+
+        new_urls = [url for url in urls if url not in known_urls]
+        if new_urls:
+            with open(urls_txt, "a", encoding="utf-8") as f:
+                f.writelines(url + "\n" for url in new_urls)
+
+
+def needs_conda_network_config(url: str, config: Dict) -> bool:
+    """
+    Whether only conda can download the url: it needs conda's proxy, SSL or
+    channel credential settings (from the conda `config`), or is not an
+    http(s) or file url.
+    """
+
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https", "file"):
+        return True
+    if parsed.scheme == "file":
+        return False
+    # credentials in the url, or an anaconda.org token
+    if parsed.username or "/t/" in parsed.path:
+        return True
+
+    if any(config.get(key) for key in _NETWORK_SETTINGS):
+        return True
+    if os.environ.get("CONDA_SSL_VERIFY", "true").lower() != "true":
+        return True
+    if config.get("ssl_verify", True) is not True:
+        # disabled, or a custom CA bundle
+        return True
+
+    for settings in config.get("channel_settings") or []:
+        channel = str(settings.get("channel", ""))
+        if settings.get("auth") and (
+            fnmatch.fnmatch(url, f"{channel}/*") or f"/{channel}/" in url
+        ):
+            return True
+    return False
+
+
+def download_package(
+    url: str,
+    pkgs_dir: Path,
+    md5: Optional[str] = None,
+    sha256: Optional[str] = None,
+    timeout: float = 60,
+) -> str:
+    """
+    Download a package into the package cache and return what was done:
+    'cached', 'downloaded' or 'resumed'.
+
+    Packages already in the cache are not downloaded again, unless they do not
+    match the checksums. An interrupted download is kept as '<file>.partial'
+    and resumed from where it stopped, if the server supports range requests.
+    """
+
+    target = Path(pkgs_dir) / url.rsplit("/", 1)[-1]
+    if target.is_file():
+        if verify_checksums(target, md5, sha256):
+            return "cached"
+        target.unlink()
+
+    partial = target.with_name(target.name + PARTIAL_SUFFIX)
+    offset = partial.stat().st_size if partial.is_file() else 0
+
+    request = Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        # the partial file is already complete (or invalid), start over
+        if e.code != 416:
+            raise
+        partial.unlink()
+        offset = 0
+        response = urlopen(Request(url), timeout=timeout)
+
+    with response:
+        # servers (and file:// urls) that ignore the range send the whole file
+        resumed = offset > 0 and getattr(response, "status", None) == 206
+        with open(partial, "ab" if resumed else "wb") as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+
+    if not verify_checksums(partial, md5, sha256):
+        partial.unlink()
+        raise ChecksumError(f"Checksum of '{url}' does not match the lock file")
+
+    os.replace(partial, target)
+    return "resumed" if resumed else "downloaded"
+
+
+def fetch_packages(
+    downloads: List[Dict],
+    pkgs_dir: Path,
+    workers: int = DEFAULT_FETCH_WORKERS,
+) -> List[Dict]:
+    """
+    Download packages into the package cache concurrently.
+
+    Each download is a dict with the 'url' and optionally the 'md5' and 'sha256'
+    of the package. Returns the url and status of each download, with the error
+    for downloads that failed.
+    """
+
+    pkgs_dir = Path(pkgs_dir)
+    pkgs_dir.mkdir(parents=True, exist_ok=True)
+
+    def _fetch(download: Dict) -> Dict:
+
+        try:
+            status = download_package(
+                download["url"],
+                pkgs_dir,
+                md5=download.get("md5"),
+                sha256=download.get("sha256"),
+            )
+            error = None
+        except (OSError, ValueError, HTTPException, ChecksumError) as e:
+            status = "failed"
+            error = str(e)
+
+        return {"url": download["url"], "status": status, "error": error}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(_fetch, downloads))
+
+    add_to_urls_txt(pkgs_dir, [r["url"] for r in results if r["status"] != "failed"])
+
+    return results
+
+
+def prefetch_packages(downloads: List[Dict]) -> None:
+    """
+    Download packages into the first writable package cache before conda
+    installs them, so that conda only extracts and links them.
+
+    This is only a head start: packages that need conda's network settings are
+    skipped, and anything that fails here is left for conda to download.
+    """
+
+    from .prefix import get_writable_pkgs_dir, read_condarc
+
+    try:
+        pkgs_dir = get_writable_pkgs_dir()
+        if pkgs_dir is None:
+            return
+        config = read_condarc()
+        downloads = [
+            d for d in downloads if not needs_conda_network_config(d["url"], config)
+        ]
+        results = fetch_packages(downloads, pkgs_dir) if downloads else []
+    except (OSError, ValueError, ChecksumError) as e:
+        console.print(f"[yellow]Skipped downloading packages ahead of conda: {e}")
+        return
+
+    failed = [r for r in results if r["status"] == "failed"]
+    if failed:
+        console.print(
+            f"[yellow]Skipped downloading {len(failed)} package(s) ahead of conda "
+            f"({failed[0]['error']}); conda downloads them instead"
+        )
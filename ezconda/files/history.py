@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import hashlib
+import typer
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+_SEP_PAT = re.compile(rb"==>\s*(.+?)\s*<==")
+_PKG_EXTENSIONS = (".tar.bz2", ".conda")
+_UNKNOWN_CHANNEL = "<unknown>"
+
+# revision offsets are cached between invocations, keyed by the history file path
+history_cache_dir: Path = Path(typer.get_app_dir("ezconda")) / "cache" / "history"
+
+
+def _dist_str_to_quad(dist_str: str) -> Tuple[str, str, str, str]:
+    """Split 'channel::name-version-build' the same way conda does."""
+
+    for ext in _PKG_EXTENSIONS:
+        if dist_str.endswith(ext):
+            dist_str = dist_str[: -len(ext)]
+    if "::" in dist_str:
+        channel, dist_str = dist_str.split("::", 1)
+    else:
+        channel = _UNKNOWN_CHANNEL
+    name, version, build = dist_str.rsplit("-", 2)
+    return name, version, build, channel
+
+
+def _revision_event(rev: int, date: str, content: set) -> Dict:
+    """
+    Build the install/upgrade/downgrade/remove event for a revision,
+    identical to an entry of `conda list --revision --json`.
+    """
+
+    event = {
+        "date": date,
+        "rev": rev,
+        "install": [],
+        "remove": [],
+        "upgrade": [],
+        "downgrade": [],
+    }
+
+    if any(line.startswith(("-", "+")) for line in content):
+        added = {}
+        removed = {}
+        for pkg in content:
+            name, version, build, channel = _dist_str_to_quad(pkg[1:])
+            if pkg.startswith("+"):
+                added[name.lower()] = (version, build, channel)
+            elif pkg.startswith("-"):
+                removed[name.lower()] = (version, build, channel)
+
+        changed = set(added) & set(removed)
+        for name in sorted(changed):
+            old = removed[name]
+            new = added[name]
+            details = {
+                "old": "-".join((name,) + old),
+                "new": "-".join((name,) + new),
+            }
+            if new > old:
+                event["upgrade"].append(details)
+            else:
+                event["downgrade"].append(details)
+
+        for name in sorted(set(removed) - changed):
+            event["remove"].append("-".join((name,) + removed[name]))
+
+        for name in sorted(set(added) - changed):
+            event["install"].append("-".join((name,) + added[name]))
+    else:
+        for pkg in sorted(content):
+            event["install"].append(pkg)
+
+    return event
+
+
+class CondaHistory:
+    """
+    Reader for '<prefix>/conda-meta/history'.
+
+    The byte offset of every revision header is indexed once and cached on
+    disk. The history file is append-only, so later reads only scan what was
+    appended since, and a single revision is read with one seek.
+    """
+
+    def __init__(self, prefix: Path, cache_dir: Path = history_cache_dir) -> None:
+
+        self.path = Path(prefix) / "conda-meta" / "history"
+        key = hashlib.sha1(str(self.path.resolve()).encode("utf-8")).hexdigest()
+        self.cache_file = Path(cache_dir) / f"{key}.json"
+        self._offsets: Optional[List[int]] = None
+        self._size = 0
+
+    def exists(self) -> bool:
+
+        return self.path.is_file()
+
+    def _load_cached_offsets(self, size: int) -> Tuple[List[int], int]:
+        """Return cached offsets that are still valid and where to resume scanning."""
+
+        try:
+            with open(self.cache_file, "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return [], 0
+
+        offsets = cached.get("offsets", [])
+        if not offsets or cached.get("size", 0) > size:
+            return [], 0
+
+        # make sure the file was appended to and not rewritten
+        with open(self.path, "rb") as f:
+            f.seek(offsets[-1])
+            if not _SEP_PAT.match(f.readline().strip()):
+                return [], 0
+
+        # re-scan the last revision, it may have been written to since
+        return offsets[:-1], offsets[-1]
+
+    def _save_offsets(self) -> None:
+
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_file, "w") as f:
+                json.dump({"size": self._size, "offsets": self._offsets}, f)
+        except OSError:
+            # caching is only an optimization
+            pass
+
+    @property
+    def offsets(self) -> List[int]:
+        """Byte offsets of the revision headers in the history file"""
+
+        if self._offsets is None:
+            size = os.stat(self.path).st_size
+            offsets, position = self._load_cached_offsets(size)
+
+            with open(self.path, "rb") as f:
+                f.seek(position)
+                for line in iter(f.readline, b""):
+                    if _SEP_PAT.match(line.strip()):
+                        offsets.append(position)
+                    position += len(line)
+
+            self._offsets = offsets
+            self._size = position
+            self._save_offsets()
+        return self._offsets
+
+    def __len__(self) -> int:
+
+        return len(self.offsets)
+
+    def read_revision(self, revision_no: int = -1) -> Dict:
+        """
+        Read a single revision (negative numbers count from the latest).
+        Raises IndexError if the revision does not exist.
+        """
+
+        offsets = self.offsets
+        start = offsets[revision_no]
+        rev = revision_no % len(offsets)
+        end = offsets[rev + 1] if rev + 1 < len(offsets) else self._size
+
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            lines = f.read(end - start).decode("utf-8").splitlines()
+
+        date = ""
+        content = set()
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            m = _SEP_PAT.match(line.encode("utf-8"))
+            if m:
+                date = m.group(1).decode("utf-8")
+            else:
+                content.add(line)
+
+        return _revision_event(rev, date, content)
@@ -1,86 +1,359 @@
 from textwrap import dedent
 import tomlkit
 import os
+import re
 import sys
-import json
+import itertools
 import platform
 import tempfile
 import typer
 
+from enum import Enum
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Dict, Optional
-
-from tomlkit.toml_document import TOMLDocument
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+    TYPE_CHECKING,
+)
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
 
 from ..console import console
+from ..profiling import profiled
 from ..solver import Solver
+from ..snapshot import EnvSnapshot, get_snapshot
 from .._utils import run_command
+from .fetch import prefetch_packages
+from .prefix import (
+    get_prefix_python,
+    read_pypi_direct_urls,
+    resolve_env_prefix,
+)
+
+if TYPE_CHECKING:
+    from rich.status import Status
+
+
+class Platform(str, Enum):
+    linux_64 = "linux-64"
+    linux_aarch64 = "linux-aarch64"
+    linux_ppc64le = "linux-ppc64le"
+    osx_64 = "osx-64"
+    osx_arm64 = "osx-arm64"
+    win_64 = "win-64"
+
+
+# system information recorded in lock files generated for each platform
+PLATFORM_SYSTEMS = {
+    Platform.linux_64: {
+        "platform": "linux",
+        "architecture": "64bit",
+        "machine": "x86_64",
+    },
+    Platform.linux_aarch64: {
+        "platform": "linux",
+        "architecture": "64bit",
+        "machine": "aarch64",
+    },
+    Platform.linux_ppc64le: {
+        "platform": "linux",
+        "architecture": "64bit",
+        "machine": "ppc64le",
+    },
+    Platform.osx_64: {
+        "platform": "darwin",
+        "architecture": "64bit",
+        "machine": "x86_64",
+    },
+    Platform.osx_arm64: {
+        "platform": "darwin",
+        "architecture": "64bit",
+        "machine": "arm64",
+    },
+    Platform.win_64: {"platform": "win32", "architecture": "64bit", "machine": "AMD64"},
+}
+
+
+def get_current_system() -> Dict[str, str]:
+    """System information of the current machine, as recorded in lock files."""
+
+    return {
+        "platform": sys.platform,
+        "architecture": platform.architecture()[0],
+        "machine": platform.machine(),
+    }
+
+
+# parsed lock files, keyed by (path, mtime, size)
+_lock_file_cache: Dict[Tuple[str, int, int], Dict] = {}
+
+
+def _to_plain(value):
+    """Convert a tomlkit item into plain python types"""
+
+    if isinstance(value, Mapping):
+        return {str(k): _to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, str):
+        return str(value)
+    return value
+
+
+def load_lock_file(lock_file: Union[str, Path]) -> Dict:
+    """
+    Parse a lock file into plain dicts and lists, for reading only.
 
+    Uses `tomllib` (or `tomli`) when available, which is much faster than
+    building a `tomlkit` document. The result is cached until the file changes,
+    so it is shared between callers and must not be modified.
+    """
 
-class LockFile:
+    path = Path(lock_file).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+
+    if key not in _lock_file_cache:
+        with open(path, "rb") as f:
+            content = f.read().decode("utf-8")
+
+        if tomllib is not None:
+            doc = tomllib.loads(content)
+        else:
+            doc = _to_plain(tomlkit.loads(content))
+
+        # lock files with a channel table are read as if every package
+        # carried its own channel, like older lock files
+        doc["packages"] = expand_packages(doc)
+
+        # forget older versions of the same file
+        for cached_key in [k for k in _lock_file_cache if k[0] == key[0]]:
+            del _lock_file_cache[cached_key]
+        _lock_file_cache[key] = doc
+
+    return _lock_file_cache[key]
+
+
+# fields shared by all packages from the same channel and platform,
+# stored once in the channel table of the lock file
+_CHANNEL_FIELDS = ("base_url", "channel", "platform")
+# fields that are not stored, as they can be derived from the others
+_EXPANDED_FIELDS = _CHANNEL_FIELDS + ("dist_name",)
+# package file name and checksums, copied from the package records
+_ARTIFACT_FIELDS = ("fn", "md5", "sha256")
+
+_BARE_KEY_RE = re.compile(r"[A-Za-z0-9_-]+")
+_PLAIN_STRING_RE = re.compile(r'[^"\\\x00-\x1f\x7f]*')
+
+
+def _toml_key(key: str) -> str:
+
+    if _BARE_KEY_RE.fullmatch(key):
+        return key
+    return tomlkit.key(key).as_string()
+
+
+def _toml_value(value) -> str:
+    """Format a value exactly as `tomlkit` does"""
+
+    if isinstance(value, str) and _PLAIN_STRING_RE.fullmatch(value):
+        return f'"{value}"'
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return tomlkit.item(value).as_string()
+
+
+def _write_table(f: TextIO, header: str, table: Dict) -> None:
+
+    f.write(f"{header}\n")
+    for key, value in table.items():
+        f.write(f"{_toml_key(key)} = {_toml_value(value)}\n")
+
+
+def compact_packages(packages: Iterable[Dict], channels: List[Dict]) -> Iterator[Dict]:
+    """
+    Packages as stored in the lock file, referring to their channel by index.
+
+    The `base_url`, `channel` and `platform` of every package are moved into
+    `channels`, which is filled in as the packages are consumed.
+    """
+
+    index = {}
+    for pkg in packages:
+        channel = tuple(pkg[field] for field in _CHANNEL_FIELDS)
+        if channel not in index:
+            index[channel] = len(channels)
+            channels.append(dict(zip(_CHANNEL_FIELDS, channel)))
+
+        compact = {
+            "name": pkg["name"],
+            "version": pkg["version"],
+            "build_string": pkg["build_string"],
+            "channel": index[channel],
+        }
+        compact.update(
+            (k, v)
+            for k, v in pkg.items()
+            if k not in compact and k not in _EXPANDED_FIELDS
+        )
+        yield compact
+
+
+def expand_packages(doc: Dict) -> List[Dict]:
+    """Packages from a lock file (any format) with all their fields"""
+
+    if "channels" not in doc:
+        return doc.get("packages", [])
+
+    channels = doc["channels"]
+    return [
+        {
+            **pkg,
+            **channels[pkg["channel"]],
+            "dist_name": f"{pkg['name']}-{pkg['version']}-{pkg['build_string']}",
+        }
+        for pkg in doc.get("packages", [])
+    ]
 
-    _MIN_EZCONDA_VERSION = "0.4.0"
 
-    def __init__(self) -> None:
+def write_lock_file_stream(
+    f: TextIO,
+    version: Dict,
+    system: Dict,
+    env_name: str,
+    packages: Iterable[Dict],
+) -> None:
+    """
+    Write a lock file one package at a time, without building a document.
 
-        self.doc = TOMLDocument()
+    Keys and values are formatted by `tomlkit`, so the output reads the same as
+    a document dumped by `tomlkit`.
+    """
 
-    def _add_version_info(self) -> None:
+    channels = []
+    packages = compact_packages(packages, channels)
+    first_package = next(packages, None)
 
-        version = tomlkit.table()
-        version.add("ezconda-min-version", self._MIN_EZCONDA_VERSION)
+    # tomlkit writes empty arrays of tables as inline arrays on top
+    if first_package is None:
+        f.write("packages = []\nchannels = []\n\n")
 
-        self.doc.add("version", version)
+    _write_table(f, "[version]", version)
+    f.write("\n")
+    _write_table(f, "[system]", system)
+    f.write("\n")
+    _write_table(f, "[environment]", {"name": env_name})
 
-    def _add_system_info(self) -> None:
+    if first_package is not None:
+        for package in itertools.chain([first_package], packages):
+            f.write("\n")
+            _write_table(f, "[[packages]]", package)
 
-        system = tomlkit.table()
-        system.add("platform", sys.platform)
-        system.add("architecture", platform.architecture()[0])
-        system.add("machine", platform.machine())
+        # channels are only known once all packages are written
+        for channel in channels:
+            f.write("\n")
+            _write_table(f, "[[channels]]", channel)
 
-        self.doc.add("system", system)
 
-    def _add_current_packages(self, env_name: str) -> Dict:
-        """Get current installed packages in the named environment"""
+def _profiled_env(lock_file, env_name: str, *args, **kwargs) -> Dict:
 
-        cmd = ["conda", "list", "-n", env_name, "--json"]
+    return {"env": env_name}
 
-        result = run_command(cmd, verbose=False)
 
-        packages = json.loads(result.stdout)
+class LockFile:
 
-        # store environment name
-        _env_table = tomlkit.table()
-        _env_table.add("name", env_name)
+    # version of the lock file format, checked when reading lock files;
+    # 2 introduced the channel table (files without it are version 1)
+    _LOCK_VERSION = 2
+    # only for people reading the file
+    _MIN_EZCONDA_VERSION = "0.9.0"
 
-        self.doc.add("environment", _env_table)
-        self.doc.add("packages", packages)
+    def _with_artifact_info(self, snapshot: EnvSnapshot) -> Iterator[Dict]:
 
-    def generate_lockfile(self, env_name: str) -> None:
+        pypi_direct_urls = None
+        if snapshot.records is not None:
+            pypi_direct_urls = read_pypi_direct_urls(snapshot.prefix, snapshot.records)
 
-        self._add_version_info()
-        self._add_system_info()
-        self._add_current_packages(env_name)
+        return with_artifact_info(snapshot.packages, snapshot.records, pypi_direct_urls)
 
-    def write_lockfile(self, env_name: str) -> None:
+    def _write(
+        self,
+        env_name: str,
+        system: Dict[str, str],
+        packages: Iterable[Dict],
+        lockfile_dir: Optional[Path] = None,
+    ) -> Path:
 
-        self.generate_lockfile(env_name)
+        lockfile_name = Path(
+            f"{env_name}-{system['platform']}-{system['machine']}.lock"
+        )
+        if lockfile_dir is not None:
+            lockfile_name = Path(lockfile_dir) / lockfile_name
 
-        lockfile_name = f"{env_name}-{sys.platform}-{platform.machine()}.lock"
+        version = {
+            "ezconda-min-version": self._MIN_EZCONDA_VERSION,
+            "lock-version": self._LOCK_VERSION,
+        }
+        system = {
+            "platform": system["platform"],
+            "architecture": system["architecture"],
+            "machine": system["machine"],
+        }
 
         with open(lockfile_name, "w") as f:
-            tomlkit.dump(self.doc, f)
+            write_lock_file_stream(f, version, system, env_name, packages)
 
         console.print(f"[bold green] :lock: Lock file '{lockfile_name}' generated")
 
-    def read_lock_file(self, lock_file: str) -> TOMLDocument:
+        return lockfile_name
 
-        with open(lock_file, "r") as f:
-            doc = tomlkit.loads(f.read())
-        return doc
+    @profiled("lockfile generation", _profiled_env)
+    def write_lockfile(
+        self,
+        env_name: str,
+        snapshot: Optional[EnvSnapshot] = None,
+        lockfile_dir: Optional[Path] = None,
+    ) -> Path:
 
-    def verify_lock_file_contents(self, doc: TOMLDocument) -> None:
+        if snapshot is None:
+            snapshot = get_snapshot(env_name)
+
+        return self._write(
+            env_name,
+            get_current_system(),
+            self._with_artifact_info(snapshot),
+            lockfile_dir,
+        )
+
+    @profiled("lockfile generation", _profiled_env)
+    def write_platform_lockfile(
+        self,
+        env_name: str,
+        platform: Platform,
+        packages: Iterable[Dict],
+        lockfile_dir: Optional[Path] = None,
+    ) -> Path:
+
+        return self._write(env_name, PLATFORM_SYSTEMS[platform], packages, lockfile_dir)
+
+    def read_lock_file(self, lock_file: str) -> Dict:
+
+        return load_lock_file(lock_file)
+
+    def verify_lock_file_contents(self, doc: Dict) -> None:
 
         # check contents
         if "version" not in doc or "system" not in doc:
@@ -102,15 +375,27 @@ class LockFile:
             )
             raise typer.Exit()
 
+        # lock files in a newer format may use fields this version ignores
+        lock_version = doc["version"].get("lock-version", 1)
+        if lock_version > self._LOCK_VERSION:
+            console.print(
+                dedent(
+                    f"""
+                    [bold red]Lock file was generated by a newer version of ezconda.[/]
+
+                    It uses lock file format {lock_version}, this version of ezconda reads up to {self._LOCK_VERSION}. To upgrade ezconda:
+
+                    [bold green]pip install --upgrade ezconda[/]
+                    """
+                )
+            )
+            raise typer.Exit()
+
         # get system info from lock file
         system = doc["system"]
 
         # get current system info
-        _current_system = {
-            "platform": sys.platform,
-            "architecture": platform.architecture()[0],
-            "machine": platform.machine(),
-        }
+        _current_system = get_current_system()
 
         if system != _current_system:
             console.print(
@@ -127,6 +412,231 @@ class LockFile:
             raise typer.Exit()
 
 
+def with_artifact_info(
+    packages: Iterable[Dict],
+    records: Optional[List[Dict]],
+    pypi_direct_urls: Optional[Dict[str, Dict]] = None,
+) -> Iterator[Dict]:
+    """
+    Add the package file name and checksums from the package records
+    (conda-meta records or solver 'FETCH' actions) to the packages,
+    and the direct URL (and sha256) that pip packages were installed from.
+    """
+
+    artifacts = {record["name"]: record for record in records or []}
+    pypi_direct_urls = pypi_direct_urls or {}
+    for pkg in packages:
+        if pkg["channel"].startswith("pypi"):
+            if pkg["name"] in pypi_direct_urls:
+                pkg = dict(pkg, **pypi_direct_urls[pkg["name"]])
+        elif pkg["name"] in artifacts:
+            record = artifacts[pkg["name"]]
+            pkg = dict(pkg)
+            pkg.update((k, record[k]) for k in _ARTIFACT_FIELDS if record.get(k))
+        yield pkg
+
+
+def get_package_url(pkg: Dict) -> str:
+    """URL of the package file for a package in the lock file"""
+
+    if "fn" in pkg:
+        return f"{pkg['base_url']}/{pkg['platform']}/{pkg['fn']}"
+
+    # older lock files do not have the file name, so the extension is a guess
+    url = f"{pkg['base_url']}/{pkg['platform']}/{pkg['dist_name']}"
+    if url.startswith("https://repo.anaconda.com"):
+        return url + ".conda"
+    return url + ".tar.bz2"
+
+
+def get_package_downloads(packages: List[Dict]) -> List[Dict]:
+    """URL and checksums (if recorded) of every conda package in `packages`"""
+
+    return [
+        {
+            "url": get_package_url(pkg),
+            "md5": pkg.get("md5"),
+            "sha256": pkg.get("sha256"),
+        }
+        for pkg in packages
+        if not pkg["channel"].startswith("pypi")
+    ]
+
+
+def get_package_key(pkg: Dict) -> Tuple[str, str, str, str]:
+    """Identifies a package by name, version, build and channel"""
+
+    return (pkg["name"], pkg["version"], pkg["build_string"], pkg["channel"])
+
+
+def get_lock_file_changes(doc: Dict, snapshot: EnvSnapshot) -> Dict[str, List[Dict]]:
+    """
+    Packages to add, remove and change in the environment to match the lock file.
+
+    'added' and 'changed' hold the packages from the lock file, 'removed'
+    holds the installed packages that are not in the lock file.
+    """
+
+    locked = {pkg["name"]: pkg for pkg in doc.get("packages", [])}
+    installed = {pkg["name"]: pkg for pkg in snapshot.packages}
+
+    return {
+        "added": [pkg for name, pkg in locked.items() if name not in installed],
+        "removed": [pkg for name, pkg in installed.items() if name not in locked],
+        "changed": [
+            pkg
+            for name, pkg in locked.items()
+            if name in installed
+            and get_package_key(pkg) != get_package_key(installed[name])
+        ],
+    }
+
+
+def get_explicit_line(download: Dict) -> str:
+    """Line for the package in an '@EXPLICIT' file, with its checksum if known"""
+
+    # md5 is understood by all conda and mamba versions, sha256 by newer ones
+    if download.get("md5"):
+        return f"{download['url']}#{download['md5']}"
+    if download.get("sha256"):
+        return f"{download['url']}#sha256:{download['sha256']}"
+    return download["url"]
+
+
+def run_explicit_command(
+    cmd: List[str],
+    downloads: List[Dict],
+    verbose: bool,
+    status: Optional["Status"] = None,
+) -> None:
+    """
+    Run a conda `create` or `install` command with an '@EXPLICIT' file
+    containing the package urls in `downloads`.
+    """
+
+    # download packages in parallel, so that conda only extracts and links them
+    prefetch_packages(downloads)
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        temp_file_name = f.name
+        f.write(bytes("@EXPLICIT\n", "utf-8"))
+        f.writelines([bytes(get_explicit_line(d) + "\n", "utf-8") for d in downloads])
+        f.flush()
+
+        run_command([*cmd, "--file", f"{f.name}", "-y"], verbose=verbose, status=status)
+
+    # delete the file only here - issue with windows when delete=True in NamedTemporaryFile
+    # Windows does not allow processes other than the one used to create
+    # the NamedTemporaryFile to access the file when using delete=True (the default).
+    os.unlink(temp_file_name)
+
+
+def get_pip_requirement(pkg: Dict) -> str:
+    """
+    Requirement for a pip package: its direct URL if it was installed from one
+    (e.g. a local wheel, which is not on the index), else its pinned version
+    """
+
+    if pkg.get("url"):
+        return f"{pkg['name']} @ {pkg['url']}"
+    return f"{pkg['name']}=={pkg['version']}"
+
+
+def get_pip_requirements(packages: Iterable[Dict]) -> List[str]:
+    """Pinned requirements for the pip packages, with hashes if all have one"""
+
+    pypi_packages = [pkg for pkg in packages if pkg["channel"].startswith("pypi")]
+
+    # pip requires a hash for every requirement as soon as one has a hash;
+    # the hash is of the archive at the direct URL, so it needs the URL too
+    use_hashes = all(pkg.get("url") and pkg.get("sha256") for pkg in pypi_packages)
+
+    return [
+        get_pip_requirement(pkg)
+        + (f" --hash=sha256:{pkg['sha256']}" if use_hashes else "")
+        for pkg in pypi_packages
+    ]
+
+
+def get_pip_command(env_name: str, solver: Solver) -> List[str]:
+    """Command to run pip with the python of the environment"""
+
+    prefix = resolve_env_prefix(env_name)
+    if prefix is None:
+        return [f"{solver.value}", "run", "-n", env_name, "python", "-m", "pip"]
+    return [str(get_prefix_python(prefix)), "-m", "pip"]
+
+
+def install_pip_packages(
+    env_name: str,
+    packages: Iterable[Dict],
+    solver: Solver,
+    verbose: bool,
+    status: Optional["Status"] = None,
+) -> None:
+    """
+    Install the pip packages with the python of the environment in one step.
+
+    The lock file pins every dependency, so pip does not resolve dependencies.
+    """
+
+    requirements = get_pip_requirements(packages)
+    if not requirements:
+        return
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as f:
+        temp_file_name = f.name
+        f.writelines([bytes(req + "\n", "utf-8") for req in requirements])
+        f.flush()
+
+        cmd = [*get_pip_command(env_name, solver), "install", "--no-deps"]
+        cmd.extend(["-r", f"{f.name}"])
+        run_command(cmd, verbose=verbose, status=status)
+
+    os.unlink(temp_file_name)
+
+
+def apply_lock_file_changes(
+    env_name: str,
+    changes: Dict[str, List[Dict]],
+    solver: Solver,
+    verbose: bool,
+    status: Optional["Status"] = None,
+) -> None:
+    """
+    Apply only the difference between the environment and the lock file.
+
+    Stale packages are removed without solving, and new or changed packages
+    are installed from their explicit urls, which replaces the installed
+    package with the same name. pip packages are handled the same way by pip.
+    """
+
+    pypi_removed = [
+        pkg["name"] for pkg in changes["removed"] if pkg["channel"].startswith("pypi")
+    ]
+    if pypi_removed:
+        cmd = [*get_pip_command(env_name, solver), "uninstall", "-y", *pypi_removed]
+        run_command(cmd, verbose=verbose, status=status)
+
+    removed = [
+        pkg["name"]
+        for pkg in changes["removed"]
+        if not pkg["channel"].startswith("pypi")
+    ]
+    if removed:
+        cmd = [f"{solver.value}", "remove", "-n", env_name, "--force", *removed, "-y"]
+        run_command(cmd, verbose=verbose, status=status)
+
+    downloads = get_package_downloads(changes["added"] + changes["changed"])
+    if downloads:
+        cmd = [f"{solver.value}", "install", "-n", env_name]
+        run_explicit_command(cmd, downloads, verbose, status)
+
+    install_pip_packages(
+        env_name, changes["added"] + changes["changed"], solver, verbose, status
+    )
+
+
 def read_lock_file_and_install(
     lock_file: str,
     solver: Solver,
@@ -148,45 +658,17 @@ def read_lock_file_and_install(
         if env_name is None:
             env_name = complete_specs["environment"]["name"]
 
-        explicit_specs = [
-            f"{pkg['base_url']}/{pkg['platform']}/{pkg['dist_name']}"
-            for pkg in complete_specs["packages"]
-            if not pkg["channel"].startswith("pypi")
-        ]
-
-        explicit_specs = [
-            spec + ".conda"
-            if spec.startswith("https://repo.anaconda.com")
-            else spec + ".tar.bz2"
-            for spec in explicit_specs
-        ]
-
-        with tempfile.NamedTemporaryFile(delete=False) as f:
-            temp_file_name = f.name
-            f.write(bytes("@EXPLICIT\n", "utf-8"))
-            f.writelines([bytes(specs + "\n", "utf-8") for specs in explicit_specs])
-            f.flush()
-
-            status.update(f"[magenta]Creating new conda environment {env_name}")
-
-            cmd = [
-                f"{solver.value}",
-                "create",
-                "-n",
-                env_name,
-                "--file",
-                f"{f.name}",
-                "-y",
-            ]
-
-            result = run_command(cmd, verbose=verbose)
-
-        # delete the file only here - issue with windows when delete=True in NamedTemporaryFile
-        # Windows does not allow processes other than the one used to create 
-        # the NamedTemporaryFile to access the file when using delete=True (the default).
-        os.unlink(temp_file_name)
-
-        # TODO: Add installation for pypi channels/packages
+        status.update(f"[magenta]Creating new conda environment {env_name}")
+
+        cmd = [f"{solver.value}", "create", "-n", env_name]
+        run_explicit_command(
+            cmd, get_package_downloads(complete_specs["packages"]), verbose, status
+        )
+
+        status.update(f"[magenta]Installing pip packages")
+        install_pip_packages(
+            env_name, complete_specs["packages"], solver, verbose, status
+        )
 
         console.print(
             f"[bold green] :rocket: Created '{env_name}' environment from lock file",
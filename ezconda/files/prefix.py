@@ -0,0 +1,494 @@
+import os
+import re
+import sys
+import json
+import shutil
+
+from pathlib import Path
+from email.message import Message
+from email.parser import HeaderParser
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+_TOKEN_RE = re.compile(r"/t/[^/]+")
+_DEP_NAME_RE = re.compile(r"[^\s=<>!~\[]+")
+_PKG_EXTENSIONS = (".tar.bz2", ".conda")
+_PYPI_ANCHOR_ENDINGS = (".dist-info/RECORD", ".egg-info/PKG-INFO", ".egg-info")
+KNOWN_SUBDIRS = (
+    "noarch",
+    "emscripten-wasm32",
+    "freebsd-64",
+    "linux-32",
+    "linux-64",
+    "linux-aarch64",
+    "linux-armv6l",
+    "linux-armv7l",
+    "linux-ppc64",
+    "linux-ppc64le",
+    "linux-riscv64",
+    "linux-s390x",
+    "osx-64",
+    "osx-arm64",
+    "wasi-wasm32",
+    "win-32",
+    "win-64",
+    "win-arm64",
+    "zos-z",
+)
+
+
+def get_root_prefix() -> Optional[Path]:
+    """
+    Locate the root ('base') prefix of the conda installation without
+    starting conda, using the variables set by an activated shell or the
+    location of the `conda` executable on PATH.
+    """
+
+    for var in ("CONDA_ROOT", "MAMBA_ROOT_PREFIX"):
+        if os.environ.get(var):
+            return Path(os.environ[var])
+
+    conda_exe = os.environ.get("CONDA_EXE") or shutil.which("conda")
+    if conda_exe:
+        # <root>/bin/conda, <root>/condabin/conda or <root>\Scripts\conda.exe
+        root = Path(conda_exe).resolve().parent.parent
+        if (root / "conda-meta").is_dir():
+            return root
+    return None
+
+
+def get_envs_dirs() -> List[Path]:
+    """Directories that conda searches for named environments, in order."""
+
+    envs_dirs = []
+    for var in ("CONDA_ENVS_PATH", "CONDA_ENVS_DIRS"):
+        if os.environ.get(var):
+            envs_dirs.extend(Path(p) for p in os.environ[var].split(os.pathsep) if p)
+
+    root = get_root_prefix()
+    if root:
+        envs_dirs.append(root / "envs")
+    envs_dirs.append(Path.home() / ".conda" / "envs")
+    return envs_dirs
+
+
+def get_pkgs_dirs() -> List[Path]:
+    """Package cache directories that conda uses, in order."""
+
+    if os.environ.get("CONDA_PKGS_DIRS"):
+        return [Path(p) for p in os.environ["CONDA_PKGS_DIRS"].split(",") if p]
+
+    pkgs_dirs = []
+    root = get_root_prefix()
+    if root:
+        pkgs_dirs.append(root / "pkgs")
+    pkgs_dirs.append(Path.home() / ".conda" / "pkgs")
+    return pkgs_dirs
+
+
+def get_writable_pkgs_dir() -> Optional[Path]:
+    """First package cache that can be written to, like conda picks it"""
+
+    for pkgs_dir in get_pkgs_dirs():
+        try:
+            pkgs_dir.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            continue
+        urls_txt = pkgs_dir / "urls.txt"
+        if os.access(pkgs_dir, os.W_OK) and (
+            not urls_txt.exists() or os.access(urls_txt, os.W_OK)
+        ):
+            return pkgs_dir
+    return None
+
+
+def get_condarc_files() -> List[Path]:
+    """Configuration files that conda reads, in the order it reads them"""
+
+    home = Path.home()
+    xdg_config = Path(os.environ.get("XDG_CONFIG_HOME") or home / ".config")
+    dirs = [Path("/etc/conda"), Path("/var/lib/conda")]
+    root = get_root_prefix()
+    if root:
+        dirs.append(root)
+    dirs.extend([xdg_config / "conda", home / ".conda"])
+
+    files = [d / name for d in dirs for name in (".condarc", "condarc")]
+    files.append(home / ".condarc")
+    if os.environ.get("CONDA_PREFIX"):
+        files.append(Path(os.environ["CONDA_PREFIX"]) / ".condarc")
+    if os.environ.get("CONDARC"):
+        files.append(Path(os.environ["CONDARC"]))
+    return [f for f in files if f.is_file()]
+
+
+def read_condarc() -> Dict:
+    """Settings from conda's configuration files; later files take precedence"""
+
+    import yaml
+
+    config = {}
+    for condarc in get_condarc_files():
+        try:
+            with open(condarc, "r", encoding="utf-8") as f:
+                settings = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError):
+            continue
+        if isinstance(settings, dict):
+            config.update(settings)
+    return config
+
+
+def read_cached_package_record(
+    pkg: Dict, pkgs_dirs: Optional[List[Path]] = None
+) -> Optional[Dict]:
+    """
+    Repodata record ('info/repodata_record.json') of a package that is
+    extracted in a package cache, if it was downloaded from the same channel.
+    """
+
+    for pkgs_dir in get_pkgs_dirs() if pkgs_dirs is None else pkgs_dirs:
+        record_file = (
+            Path(pkgs_dir) / pkg["dist_name"] / "info" / "repodata_record.json"
+        )
+        try:
+            with open(record_file, "rb") as f:
+                record = json.loads(f.read())
+        except (OSError, ValueError):
+            continue
+        if record.get("url", "").startswith(f"{pkg['base_url']}/"):
+            return record
+    return None
+
+
+def get_known_prefixes() -> List[Path]:
+    """Prefixes registered in '~/.conda/environments.txt'."""
+
+    environments_txt = Path.home() / ".conda" / "environments.txt"
+    if not environments_txt.is_file():
+        return []
+    with open(environments_txt, "r") as f:
+        return [Path(line.strip()) for line in f if line.strip()]
+
+
+def resolve_env_prefix(env_name: str) -> Optional[Path]:
+    """
+    Resolve an environment name (or path) to its prefix.
+    Returns None if the environment cannot be located without asking conda.
+    """
+
+    if env_name == "base":
+        return get_root_prefix()
+
+    if os.sep in env_name or (os.altsep and os.altsep in env_name):
+        prefix = Path(env_name).expanduser()
+        return prefix if (prefix / "conda-meta").is_dir() else None
+
+    for envs_dir in get_envs_dirs():
+        prefix = envs_dir / env_name
+        if (prefix / "conda-meta").is_dir():
+            return prefix
+
+    for prefix in get_known_prefixes():
+        if prefix.name == env_name and (prefix / "conda-meta").is_dir():
+            return prefix
+    return None
+
+
+def list_env_prefixes() -> Dict[str, Path]:
+    """
+    All environments conda knows about, as a mapping of environment name to prefix.
+    If two environments share a name, the one conda would pick for `-n` wins.
+    """
+
+    root = get_root_prefix()
+    prefixes: Dict[str, Path] = {}
+
+    for prefix in get_known_prefixes():
+        if prefix != root and (prefix / "conda-meta").is_dir():
+            prefixes[prefix.name] = prefix
+
+    for envs_dir in reversed(get_envs_dirs()):
+        if envs_dir.is_dir():
+            for prefix in envs_dir.iterdir():
+                if (prefix / "conda-meta").is_dir():
+                    prefixes[prefix.name] = prefix
+
+    if root:
+        prefixes["base"] = root
+    return prefixes
+
+
+def get_prefix_state(prefix: Path) -> Tuple:
+    """
+    Modification times and sizes of the files and directories that change
+    whenever conda or pip install or remove packages in the prefix.
+    """
+
+    prefix = Path(prefix)
+    paths = [prefix / "conda-meta", prefix / "conda-meta" / "history"]
+    if sys.platform == "win32":
+        paths.append(prefix / "Lib" / "site-packages")
+    else:
+        paths.extend(sorted(prefix.glob("lib/python*/site-packages")))
+
+    state = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            state.append((str(path), None, None))
+        else:
+            state.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(state)
+
+
+def _load_json(path: Path) -> Dict:
+
+    with open(path, "rb") as f:
+        return json.loads(f.read())
+
+
+def _load_record(path: Path) -> Dict:
+    """
+    Load a package record without the lists of its files, which make up most
+    of the record. Only the pip metadata files that the package owns (e.g.
+    '*.dist-info/RECORD') are kept in 'files', to tell pip packages apart.
+    """
+
+    record = _load_json(path)
+    record.pop("paths_data", None)
+    if "files" in record:
+        record["files"] = [
+            fpath for fpath in record["files"] if fpath.endswith(_PYPI_ANCHOR_ENDINGS)
+        ]
+    return record
+
+
+def read_prefix_records(prefix: Path, max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    Load every package record in '<prefix>/conda-meta/*.json', without the
+    lists of files of the packages, so that only one full record per worker
+    is in memory at a time. Records are parsed in parallel across a thread pool.
+    """
+
+    record_files = sorted((Path(prefix) / "conda-meta").glob("*.json"))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_load_record, record_files))
+
+
+def split_channel_url(channel_url: str) -> Dict:
+    """
+    Split a channel url (with or without the subdir) into the channel name
+    and base url, the same way `conda list` reports them.
+    """
+
+    parsed = urlparse(channel_url)
+    # drop anaconda.org tokens from the path
+    path = _TOKEN_RE.sub("", parsed.path, count=1).rstrip("/")
+    head, _, last = path.rpartition("/")
+    if last in KNOWN_SUBDIRS:
+        path = head
+
+    if parsed.scheme == "file":
+        name = path.rsplit("/", 1)[-1]
+    else:
+        name = path.strip("/")
+
+    return {"base_url": f"{parsed.scheme}://{parsed.netloc}{path}", "channel": name}
+
+
+def to_list_record(record: Dict) -> Dict:
+    """Convert a conda-meta record to the fields reported by `conda list --json`"""
+
+    url = record.get("url") or ""
+    channel = record.get("channel") or ""
+    subdir = record.get("subdir") or (url.rsplit("/", 2)[-2] if url else "")
+
+    if "://" in channel:
+        channel_info = split_channel_url(channel)
+    elif url:
+        channel_info = split_channel_url(url.rsplit("/", 1)[0])
+    else:
+        channel_info = {"base_url": None, "channel": channel}
+
+    dist_name = record.get("fn") or ""
+    for ext in _PKG_EXTENSIONS:
+        if dist_name.endswith(ext):
+            dist_name = dist_name[: -len(ext)]
+    if not dist_name:
+        dist_name = f"{record['name']}-{record['version']}-{record['build']}"
+
+    return {
+        "base_url": channel_info["base_url"],
+        "build_number": record.get("build_number", 0),
+        "build_string": record["build"],
+        "channel": channel_info["channel"],
+        "dist_name": dist_name,
+        "name": record["name"],
+        "platform": subdir,
+        "version": record["version"],
+    }
+
+
+def _get_site_packages(prefix: Path, records: List[Dict]) -> Optional[str]:
+
+    python = next((r for r in records if r["name"] == "python"), None)
+    if python is None:
+        return None
+    if sys.platform == "win32":
+        return "Lib/site-packages"
+    major_minor = ".".join(python["version"].split(".")[:2])
+    return f"lib/python{major_minor}/site-packages"
+
+
+def get_prefix_python(prefix: Path) -> Path:
+    """Python executable of the environment"""
+
+    if sys.platform == "win32":
+        return Path(prefix) / "python.exe"
+    return Path(prefix) / "bin" / "python"
+
+
+def _iter_pypi_distributions(
+    prefix: Path, records: List[Dict]
+) -> Iterator[Tuple[Path, Message]]:
+    """
+    Metadata directories (or files) and metadata of the python packages in
+    site-packages that were not installed by conda (e.g. with pip).
+    """
+
+    site_packages = _get_site_packages(prefix, records)
+    if site_packages is None or not (Path(prefix) / site_packages).is_dir():
+        return
+
+    # anchor files owned by conda packages
+    conda_anchor_files = set()
+    for record in records:
+        for fpath in record.get("files", ()):
+            if fpath.startswith(site_packages) and fpath.endswith(_PYPI_ANCHOR_ENDINGS):
+                conda_anchor_files.add(fpath)
+
+    for entry in os.scandir(Path(prefix) / site_packages):
+        if entry.name.endswith(".dist-info"):
+            anchor_file = f"{site_packages}/{entry.name}/RECORD"
+            metadata_file = Path(entry.path) / "METADATA"
+        elif entry.name.endswith(".egg-info"):
+            if entry.is_file():
+                anchor_file = f"{site_packages}/{entry.name}"
+                metadata_file = Path(entry.path)
+            else:
+                anchor_file = f"{site_packages}/{entry.name}/PKG-INFO"
+                metadata_file = Path(entry.path) / "PKG-INFO"
+        else:
+            continue
+
+        if anchor_file in conda_anchor_files or not metadata_file.is_file():
+            continue
+
+        with open(metadata_file, "r", encoding="utf-8", errors="replace") as f:
+            metadata = HeaderParser().parse(f)
+        if not metadata.get("Name") or not metadata.get("Version"):
+            continue
+
+        yield Path(entry.path), metadata
+
+
+def _normalize_pypi_name(name: str) -> str:
+
+    return name.replace(".", "-").replace("_", "-").lower()
+
+
+def read_pypi_records(prefix: Path, records: List[Dict]) -> List[Dict]:
+    """
+    Find python packages in site-packages that were not installed by conda
+    (e.g. with pip) and report them the way `conda list --json` does.
+    """
+
+    pypi_records = []
+    for _, metadata in _iter_pypi_distributions(prefix, records):
+        name = _normalize_pypi_name(metadata["Name"])
+        version = metadata["Version"]
+        pypi_records.append(
+            {
+                "base_url": "https://conda.anaconda.org/pypi",
+                "build_number": 0,
+                "build_string": "pypi_0",
+                "channel": "pypi",
+                "dist_name": f"{name}-{version}-pypi_0",
+                "name": name,
+                "platform": "pypi",
+                "version": version,
+            }
+        )
+    return pypi_records
+
+
+def read_pypi_direct_urls(prefix: Path, records: List[Dict]) -> Dict[str, Dict]:
+    """
+    Direct URL that each pip installed package was installed from, with the
+    sha256 of the wheel or sdist when pip recorded one (in 'direct_url.json').
+
+    pip only records this for packages installed from a URL, a VCS or a local
+    path - not for packages installed from an index.
+    """
+
+    direct_urls = {}
+    for path, metadata in _iter_pypi_distributions(prefix, records):
+        if not (path / "direct_url.json").is_file():
+            continue
+
+        direct_url = _load_json(path / "direct_url.json")
+        if not direct_url.get("url"):
+            continue
+
+        url = direct_url["url"]
+        vcs_info = direct_url.get("vcs_info")
+        if vcs_info is not None:
+            url = f"{vcs_info['vcs']}+{url}@{vcs_info['commit_id']}"
+
+        entry = {"url": url}
+        archive_info = direct_url.get("archive_info", {})
+        sha256 = archive_info.get("hashes", {}).get("sha256")
+        if sha256 is None and archive_info.get("hash", "").startswith("sha256="):
+            sha256 = archive_info["hash"][len("sha256=") :]
+        if sha256:
+            entry["sha256"] = sha256
+
+        direct_urls[_normalize_pypi_name(metadata["Name"])] = entry
+    return direct_urls
+
+
+def read_installed_packages(
+    prefix: Path, records: Optional[List[Dict]] = None
+) -> List[Dict]:
+    """
+    Return the installed packages in the prefix with the same fields and
+    ordering as `conda list --json`, without starting conda.
+    """
+
+    if records is None:
+        records = read_prefix_records(prefix)
+
+    packages = [to_list_record(record) for record in records]
+    packages.extend(read_pypi_records(prefix, records))
+
+    return sorted(packages, key=lambda pkg: pkg["name"])
+
+
+def build_reverse_dependency_index(records: List[Dict]) -> Dict[str, Set[str]]:
+    """
+    Map every package name to the names of the installed packages that
+    depend on it, using the 'depends' field of the conda-meta records.
+    """
+
+    index: Dict[str, Set[str]] = {}
+    for record in records:
+        for dep in record.get("depends", ()):
+            m = _DEP_NAME_RE.match(dep)
+            if m:
+                index.setdefault(m.group(0), set()).add(record["name"])
+    return index
@@ -0,0 +1,326 @@
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import threading
+
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .prefix import get_pkgs_dirs, split_channel_url
+
+
+_MANIFEST = "manifest.json"
+_SHARDS = "shards"
+# fields of the repodata records that are kept in the shards
+_RECORD_FIELDS = ("version", "build", "build_number", "depends", "subdir")
+
+# older conda versions put the HTTP cache headers at the start of the file
+_HEADER_BYTES = 4096
+_HEADER_FIELD_RE = re.compile(r'"(_etag|_mod)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# cached repodata files being split in the background by this process
+_building: Set[str] = set()
+_building_lock = threading.Lock()
+
+
+def get_repodata_index_dir() -> Path:
+    """Directory of the repodata shards, in the user's cache directory"""
+
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+        return Path(base) / "ezconda" / "cache" / "repodata"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ezconda" / "repodata"
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "ezconda" / "repodata"
+
+
+def _read_json(path: Path) -> Optional[Dict]:
+
+    try:
+        with open(path, "rb") as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+
+    # processes (and threads) building the same shards write their own files
+    tmp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _cached_repodata_url(cache_file: Path, repodata: Dict) -> Optional[str]:
+    """Channel url of a cached repodata file, from the file itself or its '.info.json'"""
+
+    if repodata.get("_url"):
+        return repodata["_url"]
+    info = _read_json(cache_file.with_name(f"{cache_file.stem}.info.json"))
+    return info.get("url") if info else None
+
+
+def _cache_key(cache_file: Path, stat) -> Dict:
+    """
+    What identifies the content of a cached repodata file: the ETag and
+    Last-Modified headers (and hash) of the response conda saved it from, or
+    else the size and modification time of the file.
+
+    Some conda versions touch the file on every '304 Not Modified' response,
+    so the modification time alone would split unchanged files again.
+    """
+
+    info = _read_json(cache_file.with_name(f"{cache_file.stem}.info.json"))
+    if info is not None:
+        key = {k: info.get(k) for k in ("etag", "mod", "blake2_256")}
+    else:
+        try:
+            with open(cache_file, "rb") as f:
+                header = f.read(_HEADER_BYTES).decode("utf-8", errors="replace")
+        except OSError:
+            header = ""
+        key = {field[1:]: value for field, value in _HEADER_FIELD_RE.findall(header)}
+
+    key = {k: v for k, v in key.items() if v}
+    if not key:
+        key = {"mtime_ns": stat.st_mtime_ns}
+    key["size"] = stat.st_size
+    return key
+
+
+def _in_channels(url: str, channel: str, channels: Optional[Set[str]]) -> bool:
+    """Whether the repodata of a channel url is one of the `channels` (all if None)"""
+
+    return (
+        channels is None
+        or channel in channels
+        or url.rsplit("/", 1)[0] in channels
+        # 'defaults' are the anaconda.com 'pkgs/*' channels
+        or ("defaults" in channels and channel.startswith("pkgs/"))
+    )
+
+
+class RepodataIndex:
+    """
+    Metadata of the packages in the channel repodata that conda has cached
+    ('<pkgs_dir>/cache/*.json'), split into one shard per package name.
+
+    Each cached repodata file gets a directory with a small manifest (the
+    channel and what identifies the content of the file it was built from,
+    see `_cache_key`)
+    and a '<name>.json' shard for every package name in it. Looking up a package
+    only reads its own shards, and only the repodata files of the channels that
+    are looked up are split again when conda has updated them.
+
+    With `background=True`, files are split again in a background thread, and
+    lookups meanwhile use the shards of the previous version of the file (and
+    skip files that were never split). The thread does not keep ezconda from
+    exiting; a split that is cut short leaves the previous manifest, so the
+    file is split again next time and lookups meanwhile may see some shards
+    of the newer version.
+    """
+
+    def __init__(
+        self,
+        pkgs_dirs: Optional[List[Path]] = None,
+        index_dir: Optional[Path] = None,
+        background: bool = False,
+    ) -> None:
+
+        self.pkgs_dirs = get_pkgs_dirs() if pkgs_dirs is None else pkgs_dirs
+        self.index_dir = Path(
+            get_repodata_index_dir() if index_dir is None else index_dir
+        )
+        self.background = background
+        self._selected: Dict[Optional[Tuple[str, ...]], List[Dict]] = {}
+        self._orphans_removed = False
+
+    def _cache_files(self) -> Iterator[Path]:
+
+        for pkgs_dir in self.pkgs_dirs:
+            cache_dir = Path(pkgs_dir) / "cache"
+            if not cache_dir.is_dir():
+                continue
+            for path in sorted(cache_dir.glob("*.json")):
+                if not path.name.endswith((".info.json", ".state.json")):
+                    yield path
+
+    def _index_dir_for(self, cache_file: Path) -> Path:
+
+        key = hashlib.sha1(str(cache_file.resolve()).encode("utf-8")).hexdigest()
+        return self.index_dir / key
+
+    def _build(self, cache_file: Path, index_dir: Path, key: Dict) -> Optional[Dict]:
+        """
+        Split a cached repodata file into shards. Shards that did not change are
+        left alone and shards of packages that are gone are removed.
+        """
+
+        repodata = _read_json(cache_file)
+        url = _cached_repodata_url(cache_file, repodata) if repodata else None
+        if url is None:
+            return None
+
+        shards: Dict[str, List[Dict]] = {}
+        for packages_key in ("packages", "packages.conda"):
+            for fn, record in repodata.get(packages_key, {}).items():
+                shard = {"fn": fn}
+                shard.update((k, record[k]) for k in _RECORD_FIELDS if k in record)
+                shards.setdefault(record["name"], []).append(shard)
+
+        shards_dir = index_dir / _SHARDS
+        shards_dir.mkdir(parents=True, exist_ok=True)
+        existing = {
+            entry.name
+            for entry in os.scandir(shards_dir)
+            if entry.name.endswith(".json")
+        }
+
+        for name, records in shards.items():
+            shard_file = f"{name}.json"
+            data = json.dumps(records, sort_keys=True).encode("utf-8")
+            if shard_file in existing:
+                existing.remove(shard_file)
+                with open(shards_dir / shard_file, "rb") as f:
+                    if f.read() == data:
+                        continue
+            _write_atomic(shards_dir / shard_file, data)
+
+        for shard_file in existing:
+            try:
+                os.unlink(shards_dir / shard_file)
+            except FileNotFoundError:
+                # removed by another process building the same shards
+                pass
+
+        manifest = {
+            "source": str(cache_file),
+            "key": key,
+            "url": url,
+            "channel": split_channel_url(url)["channel"],
+            "subdir": repodata.get("info", {}).get("subdir"),
+            "packages": len(shards),
+        }
+        # written last, so an interrupted build is started over
+        _write_atomic(index_dir / _MANIFEST, json.dumps(manifest).encode("utf-8"))
+        return manifest
+
+    def _build_in_background(
+        self, cache_file: Path, index_dir: Path, key: Dict
+    ) -> None:
+
+        with _building_lock:
+            if str(cache_file) in _building:
+                return
+            _building.add(str(cache_file))
+
+        def build():
+            try:
+                self._build(cache_file, index_dir, key)
+            except OSError:
+                # e.g. conda is rewriting the file; split it again next time
+                pass
+            finally:
+                with _building_lock:
+                    _building.discard(str(cache_file))
+
+        # a daemon thread, so that ezconda does not wait for it to exit
+        threading.Thread(target=build, name="repodata-index", daemon=True).start()
+
+    def _select(self, channels: Optional[Iterable[str]]) -> List[Dict]:
+        """
+        Manifests of the cached repodata files of the channels (all if None),
+        splitting the files that conda has updated since they were split.
+        """
+
+        key = None if channels is None else tuple(sorted(set(channels)))
+        if key in self._selected:
+            return self._selected[key]
+        channel_set = None if key is None else set(key)
+
+        if not self._orphans_removed:
+            self._orphans_removed = True
+            if self.background:
+                threading.Thread(target=self._remove_orphans, daemon=True).start()
+            else:
+                self._remove_orphans()
+
+        manifests = []
+        for cache_file in self._cache_files():
+            index_dir = self._index_dir_for(cache_file)
+            manifest = _read_json(index_dir / _MANIFEST)
+
+            # the url of the file tells if it is worth splitting it (again)
+            url = manifest["url"] if manifest else _cached_repodata_url(cache_file, {})
+            if url is not None and not _in_channels(
+                url, split_channel_url(url)["channel"], channel_set
+            ):
+                continue
+
+            cache_key = _cache_key(cache_file, cache_file.stat())
+            if manifest is None or manifest.get("key") != cache_key:
+                if self.background:
+                    self._build_in_background(cache_file, index_dir, cache_key)
+                else:
+                    manifest = self._build(cache_file, index_dir, cache_key)
+
+            if manifest is not None and _in_channels(
+                manifest["url"], manifest["channel"], channel_set
+            ):
+                manifests.append({**manifest, "path": str(index_dir)})
+
+        self._selected[key] = manifests
+        return manifests
+
+    def refresh(self) -> List[Dict]:
+        """Split the cached repodata files that changed again; return all manifests"""
+
+        self._selected.clear()
+        self._orphans_removed = False
+        return self._select(None)
+
+    def _remove_orphans(self) -> None:
+        """Remove the shards of repodata files that conda has since removed"""
+
+        if not self.index_dir.is_dir():
+            return
+        for entry in os.scandir(self.index_dir):
+            manifest = _read_json(Path(entry.path) / _MANIFEST)
+            if manifest is not None and not os.path.exists(manifest["source"]):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    @property
+    def manifests(self) -> List[Dict]:
+        """Manifests of all cached repodata files"""
+
+        return self._select(None)
+
+    def has_channels(self, channels: Optional[Iterable[str]] = None) -> bool:
+        """Whether conda has cached repodata for any of the channels"""
+
+        return bool(self._select(channels))
+
+    def get(self, name: str, channels: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Cached records of a package, from all (or the given) channels"""
+
+        records = []
+        for manifest in self._select(channels):
+            shard = _read_json(Path(manifest["path"]) / _SHARDS / f"{name}.json")
+            for record in shard or ():
+                records.append({"name": name, "channel": manifest["channel"], **record})
+        return records
+
+    def names(self, channels: Optional[Iterable[str]] = None) -> Set[str]:
+        """Names of all cached packages, from all (or the given) channels"""
+
+        names = set()
+        for manifest in self._select(channels):
+            for entry in os.scandir(Path(manifest["path"]) / _SHARDS):
+                if entry.name.endswith(".json"):
+                    names.add(entry.name[: -len(".json")])
+        return names
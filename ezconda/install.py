@@ -10,12 +10,14 @@ from ._utils import (
     add_pkg_to_dependencies,
     write_env_file,
     add_new_channel_to_env_specs,
+    check_package_specs,
     run_command,
 )
 from .solver import Solver
 from .config import get_default_solver
-from .summary import get_summary_for_revision
+from .summary import get_summary_for_dry_run, get_summary_for_revision
 from .experimental import write_lock_file
+from .snapshot import get_snapshot
 
 
 def install(
@@ -41,6 +43,11 @@ def install(
         False, "--verbose", "-v", help="Display standard output from conda"
     ),
     lock: Optional[bool] = typer.Option(True, help="Write lockfile"),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Only show the changes that would be made and their download size",
+    ),
 ):
     """
     Install package/s in specified conda environment.
@@ -55,6 +62,7 @@ def install(
         env_specs = read_env_file(file)
         env_specs = add_pkg_to_dependencies(env_specs, pkg_name)
         env_specs = add_new_channel_to_env_specs(env_specs, channel)
+        check_package_specs(pkg_name, env_specs.get("channels"))
 
         if solver is None:
             solver = get_default_solver()
@@ -75,7 +83,12 @@ def install(
                 "-y",
             ]
 
-        run_command(cmd, verbose=verbose)
+        if dry_run:
+            get_summary_for_dry_run(cmd)
+            return
+
+        run_command(cmd, verbose=verbose, status=status)
+        snapshot = get_snapshot(env_name)
 
         console.print(f"[bold green] :rocket: Installed packages in {env_name}")
 
@@ -87,9 +100,9 @@ def install(
         if lock:
             status.update(f"[magenta]Writing lock file")
 
-            write_lock_file(env_name)
+            write_lock_file(env_name, snapshot)
 
         console.print(f"[bold green] :star: Done!")
 
         if summary:
-            get_summary_for_revision(env_name)
+            get_summary_for_revision(env_name, snapshot=snapshot)
@@ -1,35 +1,82 @@
 import typer
+from importlib import import_module
+from pathlib import Path
+from typing import Optional
+from typer.core import TyperGroup
 
-from . import __version__
 from .console import console
 
-# from .tree import show
-from .create import create
-from .install import install
-from .remove import remove
-from .config import config
-from .summary import summary
-from .sync import sync
-from .update import update
-from .experimental.lock import lock
+
+# command name -> (module, function)
+# command modules are only imported when their command is invoked,
+# so each command only pays for importing its own dependencies
+LAZY_COMMANDS = {
+    "create": (".create", "create"),
+    "install": (".install", "install"),
+    "remove": (".remove", "remove"),
+    "lock": (".experimental.lock", "lock"),
+    "fetch": (".fetch", "fetch"),
+    "summary": (".summary", "summary"),
+    "sync": (".sync", "sync"),
+    "update": (".update", "update"),
+    "apply": (".apply", "apply"),
+    "config": (".config", "config"),
+    "daemon": (".daemon", "daemon"),
+    # "show": (".tree", "show"),
+}
+
+
+class LazyGroup(TyperGroup):
+    """Command group that imports command modules on first use."""
+
+    def list_commands(self, ctx):
+
+        commands = list(LAZY_COMMANDS)
+        commands.extend(c for c in super().list_commands(ctx) if c not in commands)
+        return commands
+
+    def get_command(self, ctx, cmd_name):
+
+        if cmd_name in LAZY_COMMANDS and cmd_name not in self.commands:
+            module_name, function_name = LAZY_COMMANDS[cmd_name]
+            function = getattr(import_module(module_name, __package__), function_name)
+
+            command_app = typer.Typer(add_completion=False)
+            command_app.command(name=cmd_name)(function)
+            self.add_command(typer.main.get_command(command_app), cmd_name)
+
+        return super().get_command(ctx, cmd_name)
 
 
 app = typer.Typer(
-    help="Create, Manage, Re-create conda environments & specifications with ease"
+    cls=LazyGroup,
+    help="Create, Manage, Re-create conda environments & specifications with ease",
 )
 
-app.command()(create)
-app.command()(install)
-app.command()(remove)
-app.command()(lock)
-app.command()(summary)
-app.command()(sync)
-app.command()(update)
-app.command()(config)
-# app.command()(show)
+
+@app.callback()
+def callback(
+    ctx: typer.Context,
+    profile: bool = typer.Option(
+        False, "--profile", help="Show the time taken by each phase of the command"
+    ),
+    profile_trace: Optional[Path] = typer.Option(
+        None,
+        "--profile-trace",
+        dir_okay=False,
+        help="Also write the timings to a Chrome trace-event '.json' file",
+    ),
+):
+    if profile or profile_trace is not None:
+        from .profiling import start_profiling, report
+
+        start_profiling()
+        ctx.call_on_close(lambda: report(profile_trace))
 
 
 @app.command()
 def version():
     """Shows the version of 'ezconda' installed"""
+    from . import __version__
+
     console.print(f"[magenta]{__version__}")
@@ -0,0 +1,156 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+
+# [channel[/subdir]::]name[ ]version[ |=]build[[key=value, ...]]
+_BRACKET_RE = re.compile(r"\[(?P<brackets>[^\]]*)\]\s*$")
+_NAME_RE = re.compile(r"\s*(?P<name>[A-Za-z0-9_*][A-Za-z0-9_.*+\-]*)\s*")
+_BRACKET_ITEM_RE = re.compile(r"""(\w+)\s*=\s*(?:'([^']*)'|"([^"]*)"|([^,\s]*))""")
+# version and an optional build, separated by a space or '=' that does not
+# follow an operator, so '>=1.0 , < 2.0 py34_0' has the build 'py34_0'
+# (the same as conda's `_parse_version_plus_build`)
+_VERSION_BUILD_RE = re.compile(
+    r"((?:.+?)[^><!,|]?)(?:(?<![=!|,<>~])(?:[ =])([^-=,|<>~]+?))?$"
+)
+
+# '1.21', '=1.21', '==1.21.0', '1.21.*' or '1.21*'; no ranges, 'or' or 'and'
+_SIMPLE_VERSION_RE = re.compile(
+    r"(?P<op>==|=)?(?P<version>[A-Za-z0-9_.+!]+?)(?P<star>\.?\*)?"
+)
+_VERSION_SEP_RE = re.compile(r"[._+-]")
+
+
+class MatchSpec(NamedTuple):
+    """Parts of a conda package specification, e.g. 'conda-forge::numpy>=1.20'"""
+
+    name: str
+    channel: Optional[str] = None
+    version: Optional[str] = None
+    build: Optional[str] = None
+
+
+def parse_spec(spec: str) -> MatchSpec:
+    """
+    Split a conda package specification into its channel, name, version and build.
+
+    Supports 'numpy', 'numpy=1.21', 'numpy>=1.20,<2', 'numpy 1.21.* py39_0',
+    'numpy=1.21=py39_0', 'conda-forge::numpy' and 'numpy[version=">=1.20"]'.
+    """
+
+    brackets = {}
+    match = _BRACKET_RE.search(spec)
+    if match:
+        for key, *values in _BRACKET_ITEM_RE.findall(match.group("brackets")):
+            brackets[key] = next((v for v in values if v), "")
+        spec = spec[: match.start()]
+
+    channel = None
+    if "::" in spec:
+        channel, spec = spec.split("::", 1)
+        channel = channel.strip()
+
+    match = _NAME_RE.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid package specification: '{spec}'")
+    name = match.group("name").lower()
+    rest = spec[match.end() :].strip()
+
+    version = build = None
+    if rest:
+        version, build = _parse_version_and_build(rest)
+
+    version = brackets.get("version", version) or None
+    build = brackets.get("build", build) or None
+    channel = brackets.get("channel", channel) or None
+
+    return MatchSpec(name, channel, version, build)
+
+
+def _parse_version_and_build(version_build: str) -> Tuple[str, Optional[str]]:
+    """
+    Version and build of a spec (after the name), e.g. ('>=3.8,<3.11', None)
+    for '>=3.8, <3.11' and ('1.21', 'py39_0') for '=1.21=py39_0'.
+
+    Versions are normalized the way conda does: spaces are removed, '=1.21'
+    becomes '1.21*' and '==1.21' becomes '1.21' (unless there is a build).
+    """
+
+    match = _VERSION_BUILD_RE.search(version_build)
+    if match is None:
+        version, build = version_build, None
+    else:
+        version, build = match.groups()
+        build = build and build.strip()
+    version = version.replace(" ", "")
+
+    if version.startswith("="):
+        bare = version[1:]
+        if version.startswith("==") and build is None:
+            version = version[2:]
+        elif not any(c in bare for c in "=,|"):
+            if build is None and not bare.endswith("*"):
+                version = bare + "*"
+            else:
+                version = bare
+
+    return version, build or None
+
+
+def spec_name(spec: Union[str, Dict]) -> str:
+    """
+    Package name of a dependency in the environment specifications.
+
+    Sections like `{"pip": [...]}` are named after their key with a trailing
+    ':' so they never clash with a package of the same name.
+    """
+
+    if isinstance(spec, dict):
+        return f"{next(iter(spec), '')}:"
+    return parse_spec(spec).name
+
+
+def index_dependencies(dependencies: Optional[List]) -> Dict[str, List[int]]:
+    """
+    Positions of the dependencies in the environment specifications by package
+    name, in order. A package listed more than once has all its positions.
+    """
+
+    index: Dict[str, List[int]] = {}
+    for position, dep in enumerate(dependencies or []):
+        index.setdefault(spec_name(dep), []).append(position)
+    return index
+
+
+def _version_parts(version: str) -> List[str]:
+
+    parts = _VERSION_SEP_RE.split(version.lower())
+    # '1.21' and '1.21.0' are the same version
+    while len(parts) > 1 and parts[-1] == "0":
+        parts.pop()
+    return parts
+
+
+def version_matches(spec_version: str, version: str) -> Optional[bool]:
+    """
+    Whether a package version matches the version of a spec. Only exact
+    ('1.21', '==1.21') and fuzzy ('=1.21', '1.21.*') versions are understood;
+    returns None for anything else, e.g. '>=1.20,<2'.
+    """
+
+    match = _SIMPLE_VERSION_RE.fullmatch(spec_version.strip())
+    if match is None:
+        return None
+
+    if match.group("op") == "=" or match.group("star"):
+        prefix = _VERSION_SEP_RE.split(match.group("version").lower())
+        return _VERSION_SEP_RE.split(version.lower())[: len(prefix)] == prefix
+    return _version_parts(version) == _version_parts(match.group("version"))
+
+
+def version_key(version: str) -> Tuple:
+    """Sort key that orders versions like '1.9' < '1.10' < '1.10.1'"""
+
+    return tuple(
+        (1, int(part), "") if part.isdigit() else (0, 0, part)
+        for part in _version_parts(version)
+    )
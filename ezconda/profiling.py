@@ -0,0 +1,166 @@
+"""
+Timings of the phases of a command, for `ezconda --profile <command>`.
+
+Phases are recorded by wrapping functions with `profiled` (or code blocks with
+`phase`). Nothing is recorded unless profiling was started, and only the
+standard library is imported here, so commands pay nothing for it otherwise.
+"""
+import os
+import json
+import time
+import threading
+import functools
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+_enabled = False
+_start = 0.0
+_events: List[Dict] = []
+_events_lock = threading.Lock()
+# nesting depth of the phases running in each thread
+_local = threading.local()
+
+
+def start_profiling() -> None:
+    """Start recording phases, discarding those of an earlier command"""
+
+    global _enabled, _start
+    with _events_lock:
+        _events.clear()
+    _start = time.perf_counter()
+    _enabled = True
+
+
+def stop_profiling() -> List[Dict]:
+    """Stop recording phases and return them in the order they started"""
+
+    global _enabled
+    _enabled = False
+    with _events_lock:
+        return sorted(_events, key=lambda event: event["start"])
+
+
+@contextmanager
+def phase(name: str, details: Optional[Dict] = None):
+    """Record the time spent in the block as a phase of the command"""
+
+    if not _enabled:
+        yield
+        return
+
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _local.depth = depth
+        event = {
+            "name": name,
+            "start": start - _start,
+            "duration": end - start,
+            "depth": depth,
+            "thread": threading.get_ident(),
+            "details": details or {},
+        }
+        with _events_lock:
+            _events.append(event)
+
+
+def profiled(name: str, details: Optional[Callable[..., Dict]] = None):
+    """
+    Decorator that records every call of the function as a phase.
+    `details` is called with the function's arguments and returns extra
+    information to show with the phase, e.g. the command that was run.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with phase(name, details(*args, **kwargs) if details else None):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format(value) -> str:
+
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def _describe(event: Dict) -> str:
+
+    return " ".join(_format(value) for value in event["details"].values())
+
+
+def print_profile(events: List[Dict], total: float) -> None:
+    """Print a table with the time taken by each phase"""
+
+    from rich.table import Table
+    from .console import console
+
+    table = Table(title="Profile")
+    table.add_column("Phase", style="magenta")
+    table.add_column("Details", overflow="fold")
+    table.add_column("Time (s)", justify="right")
+    table.add_column("%", justify="right")
+
+    for event in events:
+        table.add_row(
+            "  " * event["depth"] + event["name"],
+            _describe(event),
+            f"{event['duration']:.3f}",
+            f"{100 * event['duration'] / total:.0f}" if total else "",
+        )
+    table.add_row("[bold]total", "", f"[bold]{total:.3f}", "")
+
+    console.print(table)
+
+
+def write_trace(events: List[Dict], trace_file: Path) -> None:
+    """
+    Write the phases as a Chrome trace-event file, which can be opened with
+    chrome://tracing or https://ui.perfetto.dev
+    """
+
+    pid = os.getpid()
+    trace_events = [
+        {
+            "name": event["name"],
+            "cat": "ezconda",
+            "ph": "X",
+            "ts": round(event["start"] * 1e6),
+            "dur": round(event["duration"] * 1e6),
+            "pid": pid,
+            "tid": event["thread"],
+            "args": {k: _format(v) for k, v in event["details"].items()},
+        }
+        for event in events
+    ]
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+def report(trace_file: Optional[Path] = None) -> None:
+    """Stop profiling, print the phases and write them to the trace file"""
+
+    total = time.perf_counter() - _start
+    events = stop_profiling()
+
+    print_profile(events, total)
+    if trace_file is not None:
+        write_trace(events, trace_file)
+
+        from .console import console
+
+        console.print(f"[bold green] :stopwatch: Trace written to '{trace_file}'")
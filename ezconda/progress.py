@@ -0,0 +1,84 @@
+"""
+Progress of a running conda, mamba or pip command, parsed from its output
+so that it can be shown in the status while the command runs.
+"""
+import re
+
+from typing import Dict, Optional
+
+
+# conda: "Solving environment: ...working... done"
+_CONDA_STEP = re.compile(
+    r"^(Collecting package metadata|Solving environment|Preparing transaction|"
+    r"Verifying transaction|Executing transaction|Downloading and Extracting Packages|"
+    r"Installing pip dependencies)"
+)
+# conda: "numpy-1.22.3   | 6.8 MB    | ########## | 100%"
+_CONDA_DOWNLOAD = re.compile(
+    r"^(?P<pkg>\S+)\s*\|\s*(?P<size>[\d.]+\s*[KMGT]?B)\s*\|.*?(?P<percent>\d+)%\s*$"
+)
+# mamba: "numpy    6.8MB @  3.1MB/s  2.2s"
+_MAMBA_DOWNLOAD = re.compile(r"^(?P<pkg>\S+)\s+[\d.]+\s*[kKMGT]?B\s+@\s+")
+# mamba: "Linking numpy-1.22.3-py39h..."
+_MAMBA_LINK = re.compile(r"^Linking (?P<pkg>\S+)")
+# pip: "Collecting numpy", "Downloading numpy-1.22.3.whl (16.8 MB)"
+_PIP_STEP = re.compile(
+    r"^(?P<step>Collecting|Downloading|Installing collected packages|Successfully installed)"
+    r"\s*:?\s*(?P<pkg>\S*)"
+)
+
+
+class SolverProgress:
+    """
+    Turns the lines written by a command into short progress messages,
+    counting the packages that were downloaded & extracted and linked.
+    """
+
+    def __init__(self) -> None:
+
+        # percentage done of each package being downloaded & extracted
+        self.downloads: Dict[str, int] = {}
+        self.linked = 0
+
+    @property
+    def downloaded(self) -> int:
+        return sum(1 for percent in self.downloads.values() if percent >= 100)
+
+    def is_update(self, line: str) -> bool:
+        """Whether the line only redraws a progress bar of an unfinished download"""
+
+        match = _CONDA_DOWNLOAD.match(line.strip())
+        return match is not None and int(match["percent"]) < 100
+
+    def update(self, line: str) -> Optional[str]:
+        """Progress message for a line of output, or None if it says nothing new"""
+
+        line = line.strip()
+
+        match = _CONDA_DOWNLOAD.match(line)
+        if match:
+            self.downloads[match["pkg"]] = int(match["percent"])
+            return (
+                f"Downloading & extracting packages ({self.downloaded}/"
+                f"{len(self.downloads)}): {match['pkg']} {match['percent']}%"
+            )
+
+        match = _MAMBA_DOWNLOAD.match(line)
+        if match:
+            self.downloads[match["pkg"]] = 100
+            return f"Downloaded {self.downloaded} packages: {match['pkg']}"
+
+        match = _MAMBA_LINK.match(line)
+        if match:
+            self.linked += 1
+            return f"Linking packages ({self.linked}): {match['pkg']}"
+
+        match = _CONDA_STEP.match(line)
+        if match:
+            return match[1]
+
+        match = _PIP_STEP.match(line)
+        if match:
+            return f"pip: {match['step']} {match['pkg']}".rstrip()
+
+        return None
@@ -1,12 +1,7 @@
 import typer
-import json
-import os
-import conda.exports
 
 from typing import List, Optional
 
-from rich.tree import Tree
-
 from .console import console
 from ._utils import (
     get_validate_file_name,
@@ -15,12 +10,15 @@ from ._utils import (
     write_env_file,
     update_channels_after_removal,
     recheck_dependencies,
+    get_dependent_packages,
+    confirm_dependent_removal,
     run_command,
 )
 from .solver import Solver
 from .config import get_default_solver
-from .summary import get_summary_for_revision
+from .summary import get_summary_for_dry_run, get_summary_for_revision
 from .experimental import write_lock_file
+from .snapshot import get_snapshot
 
 
 def remove(
@@ -43,6 +41,11 @@ def remove(
         False, "--verbose", "-v", help="Display standard output from conda"
     ),
     lock: Optional[bool] = typer.Option(True, help="Write lockfile"),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Only show the changes that would be made and their download size",
+    ),
 ):
     """
     Remove/uninstall packages from environment.
@@ -56,44 +59,13 @@ def remove(
         env_specs = remove_pkg_from_dependencies(env_specs, pkg_name)
 
         channels = env_specs["channels"]
-        installed_packages = [
-            specs["name"]
-            for specs in json.load(os.popen(f"conda list -n {env_name} --json"))
-        ]
 
-        for pkg in pkg_name:
-            cmd = ["mamba", "repoquery", "whoneeds"]
-            for chn in channels:
-                cmd.append("-c")
-                cmd.append(chn)
-            cmd.append(f"{pkg}")
-            cmd.append("--json")
-
-            output = run_command(cmd, verbose=False)
-            formatted_output = json.loads(output.stdout)
-            dependent_pkgs_info = formatted_output["result"]["pkgs"]
-
-            if dependent_pkgs_info:
-                dependent_pkgs = [p["name"] for p in dependent_pkgs_info]
-                # check if any of the installed packages require this as dep
-                intersection_pkgs = set(dependent_pkgs).intersection(
-                    set(installed_packages)
-                )
-
-                if intersection_pkgs:
-                    tree = Tree(f"[bold yellow]{pkg} is required by[/]")
-                    console.print(
-                        f"[bold magenta] :warning: There are packages that depend on {pkg}\n"
-                    )
-                    console.print(
-                        f"[bold magenta] :warning: Removing {pkg} will also remove them!\n"
-                    )
-                    for dep_pk in intersection_pkgs:
-                        tree.add(f"[bold yellow]{dep_pk}[/]")
-                    console.print(tree)
-                    status.stop()
-                    typer.confirm(f"Do you want to continue?", abort=True)
-                    status.start()
+        snapshot = get_snapshot(env_name)
+
+        # answer "who needs it" for all packages at once
+        required_by = get_dependent_packages(pkg_name, snapshot, channels)
+
+        confirm_dependent_removal(required_by, dry_run, status)
 
         status.update("[magenta]Removing packages")
 
@@ -109,13 +81,18 @@ def remove(
             "-y",
         ]
 
-        run_command(cmd, verbose=verbose)
+        if dry_run:
+            get_summary_for_dry_run(cmd)
+            return
+
+        run_command(cmd, verbose=verbose, status=status)
+        snapshot.invalidate()
 
-        env_specs = update_channels_after_removal(env_specs, env_name)
+        env_specs = update_channels_after_removal(env_specs, snapshot)
 
         # check if any dependent packages are removed from env but not from .yml file
         # if so, remove them from .yml file
-        env_specs = recheck_dependencies(env_specs, env_name)
+        env_specs = recheck_dependencies(env_specs, snapshot)
 
         console.print(
             f"[bold green] :cross_mark_button: Removed packages from {env_name}"
@@ -128,9 +105,9 @@ def remove(
         if lock:
             status.update(f"[magenta]Writing lock file")
 
-            write_lock_file(env_name)
+            write_lock_file(env_name, snapshot)
 
         console.print(f"[bold green] :star: Done!")
 
         if summary:
-            get_summary_for_revision(env_name)
+            get_summary_for_revision(env_name, snapshot=snapshot)
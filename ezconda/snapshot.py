@@ -0,0 +1,180 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from ._utils import run_command
+from .files.history import CondaHistory
+from .files.prefix import (
+    resolve_env_prefix,
+    get_prefix_state,
+    read_prefix_records,
+    read_installed_packages,
+    build_reverse_dependency_index,
+)
+
+
+class EnvSnapshot:
+    """
+    Installed packages and revision history of a conda environment.
+
+    Each is read at most once and then shared by every stage of a command
+    (channel update, dependency recheck, lock file and summary). Call
+    `invalidate` after running a solver command that changes the environment.
+
+    Packages are read directly from '<prefix>/conda-meta' when the prefix can
+    be located; otherwise `conda list` is used.
+    """
+
+    def __init__(self, env_name: str) -> None:
+
+        self.env_name = env_name
+        self._prefix: Optional[Path] = None
+        self._records: Optional[List[Dict]] = None
+        self._packages: Optional[List[Dict]] = None
+        self._revisions: Optional[List[Dict]] = None
+        self._history: Optional[CondaHistory] = None
+        self._dependents: Optional[Dict[str, Set[str]]] = None
+
+    @property
+    def prefix(self) -> Optional[Path]:
+        """Prefix of the environment, if it can be located without conda"""
+
+        if self._prefix is None:
+            self._prefix = resolve_env_prefix(self.env_name)
+        return self._prefix
+
+    @property
+    def records(self) -> Optional[List[Dict]]:
+        """
+        'conda-meta' records of the environment (without the lists of files
+        of the packages), if the prefix is known
+        """
+
+        if self._records is None and self.prefix is not None:
+            self._records = read_prefix_records(self.prefix)
+        return self._records
+
+    @property
+    def packages(self) -> List[Dict]:
+        """Packages installed in the environment, as reported by `conda list`"""
+
+        if self._packages is None:
+            if self.records is not None:
+                self._packages = read_installed_packages(self.prefix, self.records)
+            else:
+                self._packages = self._list_packages()
+        return self._packages
+
+    @property
+    def dependents(self) -> Optional[Dict[str, Set[str]]]:
+        """
+        Reverse dependency index of the installed packages, mapping a package
+        name to the packages that depend on it. None if the prefix is unknown.
+        """
+
+        if self._dependents is None and self.records is not None:
+            self._dependents = build_reverse_dependency_index(self.records)
+        return self._dependents
+
+    def _list_packages(self) -> List[Dict]:
+
+        cmd = ["conda", "list", "-n", self.env_name, "--json"]
+        result = run_command(cmd, verbose=False)
+        return json.loads(result.stdout)
+
+    @property
+    def package_names(self) -> List[str]:
+        """Names of the packages installed in the environment"""
+
+        return [pkg["name"] for pkg in self.packages]
+
+    @property
+    def channels(self) -> List[str]:
+        """Unique channels the installed packages come from"""
+
+        return list(set([pkg["channel"] for pkg in self.packages]))
+
+    @property
+    def revisions(self) -> List[Dict]:
+        """Revision history of the environment, as reported by `conda list --revision`"""
+
+        if self._revisions is None:
+            cmd = ["conda", "list", "--revision", "-n", self.env_name, "--json"]
+            result = run_command(cmd, verbose=False)
+            self._revisions = json.loads(result.stdout)
+        return self._revisions
+
+    @property
+    def history(self) -> Optional[CondaHistory]:
+        """Reader for the 'conda-meta/history' file, if the prefix is known"""
+
+        if self._history is None and self.prefix is not None:
+            history = CondaHistory(self.prefix)
+            if history.exists():
+                self._history = history
+        return self._history
+
+    @property
+    def revision_count(self) -> int:
+        """Number of revisions of the environment"""
+
+        if self.history is not None:
+            return len(self.history)
+        return len(self.revisions)
+
+    def revision(self, revision_no: int = -1) -> Dict:
+        """
+        Changes made in a revision (negative numbers count from the latest).
+        Raises IndexError if the revision does not exist.
+        """
+
+        if self.history is not None:
+            return self.history.read_revision(revision_no)
+        return self.revisions[revision_no]
+
+    def invalidate(self) -> None:
+        """Drop cached data; the next access reads the environment again."""
+
+        self._prefix = None
+        self._records = None
+        self._packages = None
+        self._revisions = None
+        self._history = None
+        self._dependents = None
+
+
+# env name -> (prefix state, snapshot), only kept once `keep_snapshots` is called
+_snapshots: Optional[Dict[str, Tuple[Tuple, EnvSnapshot]]] = None
+
+
+def keep_snapshots() -> None:
+    """
+    Share snapshots between commands run by the same process (`ezconda daemon`)
+    for as long as the environment does not change on disk.
+    """
+
+    global _snapshots
+    if _snapshots is None:
+        _snapshots = {}
+
+
+def get_snapshot(env_name: str) -> EnvSnapshot:
+    """
+    Snapshot of the environment. Reuses the snapshot of an earlier command
+    when snapshots are kept and neither conda nor pip changed the prefix since.
+    """
+
+    if _snapshots is None:
+        return EnvSnapshot(env_name)
+
+    prefix = resolve_env_prefix(env_name)
+    if prefix is None:
+        return EnvSnapshot(env_name)
+
+    state = get_prefix_state(prefix)
+    if env_name in _snapshots and _snapshots[env_name][0] == state:
+        return _snapshots[env_name][1]
+
+    snapshot = EnvSnapshot(env_name)
+    _snapshots[env_name] = (state, snapshot)
+    return snapshot
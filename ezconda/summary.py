@@ -1,11 +1,17 @@
 import json
 from textwrap import dedent
+from typing import Dict, List, Optional
 import typer
 
+from rich.filesize import decimal
 from rich.tree import Tree
 
 from .console import console
-from ._utils import run_command
+from .profiling import profiled
+from ._utils import get_update_plan_command, run_command
+from .solver import Solver
+from .matchspec import version_key
+from .snapshot import EnvSnapshot, get_snapshot
 
 
 def summary(
@@ -29,25 +35,24 @@ def summary(
     _ = get_summary_for_revision(name, revision_no=revision)
 
 
-def get_summary_for_revision(name: str, revision_no: int = -1):
+@profiled("summary")
+def get_summary_for_revision(
+    name: str, revision_no: int = -1, snapshot: Optional[EnvSnapshot] = None
+):
     """ "
     Get summary for the revision number of the environment.
     By default, it will show the latest revision.
     """
 
-    output = run_command(
-        ["conda", "list", "--revision", "-n", name, "--json"],
-        verbose=False,
-    )
+    if snapshot is None:
+        snapshot = get_snapshot(name)
 
     # summary info
-    _rev_data = json.loads(output.stdout)
-
     try:
-        _info = _rev_data[revision_no]
+        _info = snapshot.revision(revision_no)
     except IndexError:
         console.print(
-            f"[red]Revision {revision_no} not found.\nYou have {len(_rev_data)} revisions for {name} environment."
+            f"[red]Revision {revision_no} not found.\nYou have {snapshot.revision_count} revisions for {name} environment."
         )
         raise typer.Exit(code=1)
 
@@ -56,33 +61,194 @@ def get_summary_for_revision(name: str, revision_no: int = -1):
     _removed = _info["remove"]
     _downgraded = _info["downgrade"]
 
+    print_changes(_installed, _upgraded, _downgraded, _removed)
+
+    return _installed, _upgraded, _downgraded, _removed
+
+
+def print_changes(
+    installed: List[str],
+    upgraded: List[Dict],
+    downgraded: List[Dict],
+    removed: List[str],
+    title: str = "Summary",
+) -> None:
+    """Print the number of changes and a tree of the changed packages"""
+
     console.print(
         dedent(
             f"""
-            [bold green]{len(_installed)} Installs,[/] [bold purple]{len(_upgraded)} Upgrades[/], [bold yellow]{len(_downgraded)} Downgrades[/], [bold red]{len(_removed)} Removals[/]
+            [bold green]{len(installed)} Installs,[/] [bold purple]{len(upgraded)} Upgrades[/], [bold yellow]{len(downgraded)} Downgrades[/], [bold red]{len(removed)} Removals[/]
             """
         )
     )
 
-    tree = Tree("[bold]Summary[/]")
-    if _installed:
+    tree = Tree(f"[bold]{title}[/]")
+    if installed:
         install_branch = tree.add("[bold green]Installs[/]")
-        for i in _installed:
+        for i in installed:
             install_branch.add(f"[green]{i}[/]")
-    if _upgraded:
+    if upgraded:
         upgrade_branch = tree.add("[bold purple]Upgrades[/]")
-        for u in _upgraded:
+        for u in upgraded:
             upgrade_branch.add(f"[purple]New: {u['new']}[/]\nOld: {u['old']}")
-    if _downgraded:
+    if downgraded:
         downgrade_branch = tree.add("[bold yellow]Downgrades")
-        for d in _downgraded:
+        for d in downgraded:
             downgrade_branch.add(f"[yellow]New: {d['new']}[/]\nOld: {d['old']}")
-    if _removed:
+    if removed:
         removal_branch = tree.add("[bold red]Removals[/]")
-        for r in _removed:
+        for r in removed:
             removal_branch.add(f"[red]{r}[/]")
 
-    if _installed or _upgraded or _downgraded or _removed:
+    if installed or upgraded or downgraded or removed:
         console.print(tree)
 
-    return _installed, _upgraded, _downgraded, _removed
+
+def _dist(pkg: Dict) -> str:
+
+    return "-".join(
+        (pkg["name"], pkg["version"], pkg["build_string"], pkg["channel"])
+    ) + (f"/{pkg['platform']}" if pkg.get("platform") else "")
+
+
+def get_transaction_plan(actions: Dict) -> Dict[str, List]:
+    """
+    Group the 'LINK' and 'UNLINK' actions of a solver dry-run into installs,
+    upgrades, downgrades and removals, like a revision of the environment.
+    """
+
+    linked = {pkg["name"]: pkg for pkg in actions.get("LINK", [])}
+    unlinked = {pkg["name"]: pkg for pkg in actions.get("UNLINK", [])}
+
+    plan: Dict[str, List] = {
+        "install": [],
+        "upgrade": [],
+        "downgrade": [],
+        "remove": [],
+    }
+    for name in sorted(linked.keys() & unlinked.keys()):
+        new, old = linked[name], unlinked[name]
+        details = {"old": _dist(old), "new": _dist(new)}
+        new_key = (version_key(new["version"]), new.get("build_number", 0))
+        old_key = (version_key(old["version"]), old.get("build_number", 0))
+        if new_key >= old_key:
+            plan["upgrade"].append(details)
+        else:
+            plan["downgrade"].append(details)
+
+    for name in sorted(linked.keys() - unlinked.keys()):
+        plan["install"].append(_dist(linked[name]))
+    for name in sorted(unlinked.keys() - linked.keys()):
+        plan["remove"].append(_dist(unlinked[name]))
+    return plan
+
+
+def get_actions_from_solution(actions: Dict, installed: List[Dict]) -> Dict:
+    """
+    Turn the actions of solving specifications into a new environment into the
+    actions that change the installed packages into the same solution.
+    """
+
+    def dist(pkg: Dict):
+        return pkg["name"], pkg["version"], pkg["build_string"]
+
+    solution = actions.get("LINK", [])
+    # pip packages are not part of the solution
+    installed = [pkg for pkg in installed if pkg.get("channel") != "pypi"]
+    installed_dists = {dist(pkg) for pkg in installed}
+    solution_dists = {dist(pkg) for pkg in solution}
+
+    return {
+        **actions,
+        "LINK": [pkg for pkg in solution if dist(pkg) not in installed_dists],
+        "UNLINK": [pkg for pkg in installed if dist(pkg) not in solution_dists],
+    }
+
+
+def print_transaction_cost(actions: Dict) -> None:
+    """Print the download size and how many packages need to be downloaded and linked"""
+
+    fetch = actions.get("FETCH", [])
+    link = actions.get("LINK", [])
+    unlink = actions.get("UNLINK", [])
+
+    download_size = sum(pkg.get("size") or 0 for pkg in fetch)
+    fetched = {pkg["name"] for pkg in fetch}
+    cached = [pkg for pkg in link if pkg["name"] not in fetched]
+
+    console.print(
+        f"[bold] :package: {len(fetch)} packages to download ({decimal(download_size)}), "
+        f"{len(cached)} already in the package cache"
+    )
+    console.print(
+        f"[bold] :link: {len(link)} packages to link, {len(unlink)} to unlink"
+    )
+
+
+@profiled("summary", lambda cmd, *args, **kwargs: {"dry_run": True})
+def get_summary_for_dry_run(cmd: List[str]) -> Dict[str, List]:
+    """
+    Run a solver command with '--dry-run' and show the changes it would make
+    and what they would cost, without changing the environment.
+    """
+
+    output = run_command([*cmd, "--dry-run", "--json"], verbose=False)
+    actions = json.loads(output.stdout).get("actions", {})
+    return print_planned_changes(actions)
+
+
+def print_planned_changes(actions: Dict) -> Dict[str, List]:
+    """Print the changes of the actions of a dry-run and what they would cost"""
+
+    plan = get_transaction_plan(actions)
+    if not any(plan.values()):
+        console.print(f"[bold green] :white_heavy_check_mark: Nothing to change")
+        return plan
+
+    print_changes(
+        plan["install"],
+        plan["upgrade"],
+        plan["downgrade"],
+        plan["remove"],
+        title="Planned changes",
+    )
+    print_transaction_cost(actions)
+    return plan
+
+
+@profiled("summary", lambda env_name, *args, **kwargs: {"dry_run": env_name})
+def get_summary_for_update_plan(
+    env_name: str, file: str, solver: Solver, installed: List[Dict]
+) -> Dict[str, List]:
+    """
+    Show the changes `env update --prune` would make to the environment with
+    the specifications in `file`, without changing the environment.
+
+    `env update` keeps the installed packages as they are unless the
+    specifications need them to change. The specifications are solved into a
+    new environment once to find the installed packages that are still needed,
+    and again with those pinned to their installed builds.
+    """
+
+    cmd = get_update_plan_command(env_name, file, solver)
+    output = run_command([*cmd, "--dry-run", "--json"], verbose=False)
+    fresh = json.loads(output.stdout).get("actions", {})
+
+    needed = {pkg["name"] for pkg in fresh.get("LINK", [])}
+    frozen = [pkg for pkg in installed if pkg["name"] in needed]
+    cmd = get_update_plan_command(env_name, file, solver, frozen)
+    output = run_command([*cmd, "--dry-run", "--json"], verbose=False, check=False)
+
+    if output.returncode == 0:
+        actions = json.loads(output.stdout).get("actions", {})
+    else:
+        # like `env update`, give up on keeping the installed packages
+        console.print(
+            f"[yellow]The installed packages cannot all be kept; the plan below "
+            f"is an estimate from solving '{file}' from scratch, and may upgrade "
+            f"more packages than 'update' will"
+        )
+        actions = fresh
+
+    return print_planned_changes(get_actions_from_solution(actions, installed))
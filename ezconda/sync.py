@@ -12,7 +12,13 @@ from .solver import Solver
 from .config import get_default_solver
 from .summary import get_summary_for_revision
 from .experimental import write_lock_file
-from .files.lockfile import read_lock_file_and_install
+from .files.lockfile import (
+    LockFile,
+    apply_lock_file_changes,
+    get_lock_file_changes,
+    read_lock_file_and_install,
+)
+from .snapshot import get_snapshot
 
 
 class SyncFile(str, Enum):
@@ -63,7 +69,35 @@ def sync(
         if file is None:
             file = Path(f"{env_name}-{sys.platform}-{platform.machine()}.lock")
 
-        read_lock_file_and_install(file, solver, verbose, env_name)
+        snapshot = get_snapshot(env_name)
+
+        if Path(file).is_file() and snapshot.prefix is not None:
+            # only apply the difference to an existing environment
+            with console.status(
+                f"[magenta]Comparing '{env_name}' with '{file}'"
+            ) as status:
+                l = LockFile()
+                doc = l.read_lock_file(file)
+                changes = get_lock_file_changes(doc, snapshot)
+
+                # nothing to do if the environment already has the locked packages
+                if not any(changes.values()):
+                    console.print(
+                        f"[bold green] :arrows_counterclockwise: '{env_name}' & '{file}' are already in sync!"
+                    )
+                    return
+
+                l.verify_lock_file_contents(doc)
+                status.update(f"[magenta]Applying changes to '{env_name}'")
+                apply_lock_file_changes(env_name, changes, solver, verbose, status)
+
+            console.print(
+                f"[bold green] :arrows_counterclockwise: "
+                f"{len(changes['added'])} added, {len(changes['changed'])} changed, "
+                f"{len(changes['removed'])} removed"
+            )
+        else:
+            read_lock_file_and_install(file, solver, verbose, env_name)
 
         console.print(
             f"[bold green] :arrows_counterclockwise: '{env_name}' & '{file}' are now in sync!"
@@ -91,7 +125,8 @@ def sync(
                 "--prune",
             ]
 
-            run_command(cmd, verbose=verbose)
+            run_command(cmd, verbose=verbose, status=status)
+            snapshot = get_snapshot(env_name)
 
             console.print(
                 f"[bold green] :arrows_counterclockwise: '{env_name}' & '{file}' are now in sync!"
@@ -99,9 +134,9 @@ def sync(
 
             if lock:
                 status.update(f"[magenta]Writing lock file")
-                write_lock_file(env_name)
+                write_lock_file(env_name, snapshot)
 
             console.print(f"[bold green] :star: Done!")
 
             if summary:
-                get_summary_for_revision(env_name)
+                get_summary_for_revision(env_name, snapshot=snapshot)
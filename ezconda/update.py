@@ -7,8 +7,9 @@ from .console import console
 from ._utils import get_validate_file_name, run_command
 from .solver import Solver
 from .config import get_default_solver
-from .summary import get_summary_for_revision
+from .summary import get_summary_for_revision, get_summary_for_update_plan
 from .experimental import write_lock_file
+from .snapshot import get_snapshot
 
 
 def update(
@@ -33,6 +34,11 @@ def update(
         False, "--verbose", "-v", help="Display standard output from conda"
     ),
     lock: Optional[bool] = typer.Option(True, help="Write lockfile"),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Only show the changes that would be made and their download size",
+    ),
 ):
     """
     Update environment according to specifications file.
@@ -44,6 +50,15 @@ def update(
 
         file = get_validate_file_name(env_name, file)
 
+        if dry_run:
+            status.update(
+                f"[magenta]Solving environment '{env_name}' with file '{file}'"
+            )
+            get_summary_for_update_plan(
+                env_name, file, solver, get_snapshot(env_name).packages
+            )
+            return
+
         status.update(f"[magenta]Updating environment '{env_name}' with file '{file}'")
 
         cmd = [
@@ -57,15 +72,16 @@ def update(
             "--prune",
         ]
 
-        run_command(cmd, verbose=verbose)
+        run_command(cmd, verbose=verbose, status=status)
+        snapshot = get_snapshot(env_name)
 
         console.print(f"[bold green] :white_heavy_check_mark: '{env_name}' updated!")
 
         if lock:
             status.update(f"[magenta]Updating lock file")
-            write_lock_file(env_name)
+            write_lock_file(env_name, snapshot)
 
         console.print(f"[bold green] :star: Done!")
 
         if summary:
-            get_summary_for_revision(env_name)
+            get_summary_for_revision(env_name, snapshot=snapshot)
@@ -0,0 +1,107 @@
+import json
+import sys
+import pytest
+import typer
+from typer.testing import CliRunner
+from ezconda.main import app
+from ezconda.apply import merge_plan, read_plan_file, remove_leftover_packages
+from ezconda.console import console
+from ezconda.snapshot import EnvSnapshot
+from ezconda.solver import Solver
+from ezconda._utils import read_env_file
+from .helpers import check_if_pkg_is_installed
+
+
+runner = CliRunner()
+
+
+def test_read_plan_file(tmp_path):
+    plan_file = tmp_path / "plan.toml"
+    plan_file.write_text('add = ["numpy>=1.20", "pandas"]\nremove = ["scipy"]\n')
+
+    plan = read_plan_file(plan_file)
+    assert plan == {
+        "add": ["numpy>=1.20", "pandas"],
+        "remove": ["scipy"],
+        "channels": [],
+    }
+
+    plan_file.write_text('add = "numpy"\n')
+    with pytest.raises(typer.Exit):
+        read_plan_file(plan_file)
+
+    plan_file.write_text('install = ["numpy"]\n')
+    with pytest.raises(typer.Exit):
+        read_plan_file(plan_file)
+
+
+def test_merge_plan():
+    env_specs = {
+        "name": "test",
+        "channels": ["defaults"],
+        "dependencies": ["python=3.9", "numpy", "scipy"],
+    }
+    env_specs = merge_plan(
+        env_specs,
+        add=["pandas", "numpy=1.22"],
+        remove=["scipy", "numpy"],
+        channels=["conda-forge"],
+    )
+
+    assert env_specs["dependencies"] == ["python=3.9", "pandas", "numpy=1.22"]
+    assert env_specs["channels"] == ["defaults", "conda-forge"]
+
+
+@pytest.mark.usefixtures("clean_up_env_after_test")
+def test_apply_adds_and_removes_in_one_transaction(clean_up_env_after_test):
+    _ = runner.invoke(
+        app, ["create", "-n", "test", "-c", "conda-forge", "python=3.9", "typer"]
+    )
+    result = runner.invoke(
+        app, ["apply", "-n", "test", "--add", "six", "--remove", "typer"]
+    )
+
+    assert result.exit_code == 0
+    check_if_pkg_is_installed("test", "six")
+    with pytest.raises(AssertionError):
+        check_if_pkg_is_installed("test", "typer")
+
+    dependencies = read_env_file("test.yml")["dependencies"]
+    assert "six" in dependencies
+    assert "typer" not in dependencies
+
+
+@pytest.mark.parametrize("removable", [True, False])
+def test_apply_removes_packages_left_by_prune(removable, tmp_path, monkeypatch):
+    meta = tmp_path / "envs" / "test" / "conda-meta"
+    meta.mkdir(parents=True)
+    for name in ("six", "typer"):
+        record = {"name": name, "version": "1.0", "build": "0", "channel": "x"}
+        (meta / f"{name}-1.0-0.json").write_text(json.dumps(record))
+    monkeypatch.setenv("CONDA_ENVS_PATH", str(tmp_path / "envs"))
+
+    commands = []
+
+    def run_command(cmd, verbose=False, status=None):
+        commands.append(cmd)
+        if removable:
+            (meta / "typer-1.0-0.json").unlink()
+
+    apply_module = sys.modules[remove_leftover_packages.__module__]
+    monkeypatch.setattr(apply_module, "run_command", run_command)
+
+    # 'typer' is still installed after 'env update --prune'
+    snapshot = EnvSnapshot("test")
+    with console.status("") as status:
+        if removable:
+            remove_leftover_packages(
+                "test", ["typer>=0.4", "numpy"], snapshot, Solver.conda, False, status
+            )
+            assert snapshot.package_names == ["six"]
+        else:
+            with pytest.raises(typer.Exit):
+                remove_leftover_packages(
+                    "test", ["typer>=0.4"], snapshot, Solver.conda, False, status
+                )
+
+    assert commands == [["conda", "remove", "-n", "test", "typer>=0.4", "-y"]]
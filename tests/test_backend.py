@@ -0,0 +1,40 @@
+import json
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ezconda.backend import conda_api_available, run_in_process
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        ["pip", "install", "rich"],
+        ["conda", "run", "-n", "base", "python", "--version"],
+        ["mamba", "run", "-n", "base", "python", "--version"],
+    ],
+)
+def test_run_in_process_only_runs_solver_commands(command):
+    assert run_in_process(command) is None
+
+
+@pytest.mark.skipif(not conda_api_available(), reason="conda is not importable")
+def test_run_in_process():
+    result = run_in_process(["conda", "list", "-n", "base", "--json"])
+
+    assert result.returncode == 0
+    assert "conda" in [pkg["name"] for pkg in json.loads(result.stdout)]
+
+    result = run_in_process(["conda", "list", "-n", "does-not-exist", "--json"])
+    assert result.returncode != 0
+
+
+def test_run_in_process_leaves_other_environments_and_threads_to_subprocesses():
+    command = ["conda", "list", "-n", "base", "--json"]
+
+    # conda's configuration is read from the environment of the process
+    assert run_in_process(command, env={"CONDA_SUBDIR": "osx-arm64"}) is None
+
+    # commands from other threads would have to wait for each other
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(run_in_process, command).result() is None
@@ -4,7 +4,12 @@ from pathlib import Path
 from typer.testing import CliRunner
 
 from ezconda.solver import Solver
-from ezconda.config import make_and_read_config_file, get_default_solver
+from ezconda.backend import Backend
+from ezconda.config import (
+    make_and_read_config_file,
+    get_default_backend,
+    get_default_solver,
+)
 from ezconda.main import app
 
 
@@ -66,3 +71,15 @@ def test_show_configs(delete_config_file) -> None:
     result = runner.invoke(app, ["config", "--show"])
 
     assert 'Current Configuration\n{\n  "solver": "conda"\n}\n' in result.stdout
+
+
+def test_default_backend_when_none_is_set() -> None:
+    assert get_default_backend() == Backend.subprocess
+
+
+@pytest.mark.usefixtures("delete_config_file")
+def test_default_backend_after_setting_it(delete_config_file) -> None:
+    result = runner.invoke(app, ["config", "--backend", "inprocess"])
+    assert result.exit_code == 0
+
+    assert get_default_backend() == Backend.inprocess
@@ -0,0 +1,202 @@
+import os
+import array
+import sys
+import json
+import time
+import signal
+import socket
+import pytest
+import subprocess
+
+from ezconda import snapshot
+from ezconda.client import DAEMON_SOCKET_VAR, connect, get_daemon_socket, run_in_daemon
+from ezconda.console import console, reset_console
+from ezconda.snapshot import get_snapshot
+
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="ezconda daemon needs Unix sockets"
+)
+
+
+@pytest.fixture()
+def daemon(tmp_path):
+    socket_path = str(tmp_path / "ezconda.sock")
+    env = {**os.environ, DAEMON_SOCKET_VAR: socket_path}
+    cmd = [sys.executable, "-m", "ezconda", "daemon"]
+
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+
+    yield socket_path
+
+    subprocess.run([*cmd, "--stop"], env=env, capture_output=True)
+    process.wait(timeout=10)
+
+
+def test_daemon_runs_commands_in_client_directory(daemon, tmp_path, monkeypatch, capfd):
+    (tmp_path / "empty.lock").write_text("packages = []\n")
+    monkeypatch.chdir(tmp_path)
+
+    argv = ["fetch", "empty.lock", "--pkgs-dir", str(tmp_path / "pkgs")]
+    assert run_in_daemon(argv, daemon) == 0
+    assert "Done!" in capfd.readouterr().out
+
+    assert run_in_daemon(["no-such-command"], daemon) == 2
+    assert "No such command" in capfd.readouterr().err
+
+
+def test_daemon_stop(daemon):
+    env = {**os.environ, DAEMON_SOCKET_VAR: daemon}
+    cmd = [sys.executable, "-m", "ezconda", "daemon", "--stop"]
+
+    result = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    assert "Stopped" in result.stdout
+    assert not os.path.exists(daemon)
+    # commands run in the calling process again
+    assert run_in_daemon(["version"], daemon) is None
+
+
+def test_default_socket_is_in_private_directory(monkeypatch):
+    monkeypatch.delenv(DAEMON_SOCKET_VAR, raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setenv("TMPDIR", "/tmp")
+
+    assert get_daemon_socket() == f"/tmp/ezconda-{os.getuid()}/daemon.sock"
+
+
+def test_connect_refuses_socket_others_can_replace(tmp_path, capsys):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    socket_path = str(shared / "daemon.sock")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+
+        assert connect(socket_path) is None
+        assert "ignoring daemon socket" in capsys.readouterr().err
+
+        shared.chmod(0o700)
+        sock = connect(socket_path)
+        assert sock is not None
+        sock.close()
+
+
+def test_unreadable_request_closes_received_fds():
+    from ezconda.daemon import _receive_request
+
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    client, server = socket.socketpair()
+    with client, server:
+        ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [w]))]
+        client.sendmsg([b"not json\n"], ancdata)
+        os.close(w)
+
+        with pytest.raises(ValueError):
+            _receive_request(server)
+
+    # the pipe ends once the write end the daemon received is closed
+    try:
+        assert os.read(r, 1) == b""
+    finally:
+        os.close(r)
+
+
+def test_reset_console_follows_client_terminal(tmp_path, monkeypatch):
+    client_stdout = open(tmp_path / "out", "w")
+    monkeypatch.setenv("COLUMNS", "42")
+    monkeypatch.setenv("NO_COLOR", "1")
+    try:
+        reset_console(client_stdout)
+        assert console.file is client_stdout
+        assert console.width == 42
+        assert console.no_color
+        assert not console.is_terminal
+    finally:
+        monkeypatch.undo()
+        reset_console()
+        client_stdout.close()
+
+    assert console.file is sys.stdout
+    assert not console.no_color
+
+
+def test_interrupted_client_stops_command_in_daemon(daemon, tmp_path):
+    # a 'conda' that runs until it is stopped
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    conda = bin_dir / "conda"
+    conda.write_text(
+        f"#!{sys.executable}\n"
+        "import os, time\n"
+        "open(os.environ['CONDA_PID_FILE'], 'w').write(str(os.getpid()))\n"
+        "time.sleep(60)\n"
+    )
+    conda.chmod(0o755)
+    pid_file = tmp_path / "conda.pid"
+
+    env = {
+        **os.environ,
+        DAEMON_SOCKET_VAR: daemon,
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        "CONDA_PID_FILE": str(pid_file),
+        "XDG_CONFIG_HOME": str(tmp_path / "config"),
+    }
+    cmd = [
+        sys.executable,
+        "-m",
+        "ezconda",
+        "create",
+        "-n",
+        "test",
+        "six",
+        "--solver",
+        "conda",
+    ]
+    client = subprocess.Popen(cmd, env=env, cwd=tmp_path, stdout=subprocess.DEVNULL)
+
+    for _ in range(100):
+        if pid_file.exists() and pid_file.read_text():
+            break
+        time.sleep(0.1)
+    conda_pid = int(pid_file.read_text())
+
+    client.send_signal(signal.SIGINT)
+    assert client.wait(timeout=10) == 130
+
+    # conda was stopped, and the daemon keeps serving commands
+    with pytest.raises(ProcessLookupError):
+        os.kill(conda_pid, 0)
+    assert not (tmp_path / "test.yml").exists()
+    assert run_in_daemon(["version"], daemon) == 0
+
+
+def test_snapshots_are_kept_until_prefix_changes(tmp_path, monkeypatch):
+    prefix = tmp_path / "envs" / "test"
+    (prefix / "conda-meta").mkdir(parents=True)
+    (prefix / "conda-meta" / "history").write_text("==> 2022-01-01 00:00:00 <==\n")
+    monkeypatch.setenv("CONDA_ENVS_PATH", str(prefix.parent))
+
+    # snapshots are not shared unless asked for
+    assert get_snapshot("test") is not get_snapshot("test")
+
+    monkeypatch.setattr(snapshot, "_snapshots", {})
+    first = get_snapshot("test")
+    assert get_snapshot("test") is first
+
+    with open(prefix / "conda-meta" / "history", "a") as f:
+        f.write("==> 2022-01-02 00:00:00 <==\n")
+    assert get_snapshot("test") is not first
+
+    os.utime(prefix / "conda-meta", ns=(0, 0))
+    second = get_snapshot("test")
+    record = {"name": "six", "version": "1.16.0", "build": "py_0"}
+    with open(prefix / "conda-meta" / "six-1.16.0-py_0.json", "w") as f:
+        json.dump(record, f)
+    assert get_snapshot("test") is not second
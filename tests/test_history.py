@@ -0,0 +1,74 @@
+import pytest
+from textwrap import dedent
+
+from ezconda.files.history import CondaHistory
+
+
+HISTORY = dedent(
+    """\
+    ==> 2021-01-01 00:00:00 <==
+    # cmd: conda create -n test python=3.8
+    +defaults::python-3.8.0-h1
+    +defaults::numpy-1.19-py38_0
+    ==> 2021-01-02 10:00:00 <==
+    # cmd: conda install -n test -c conda-forge numpy scipy
+    +conda-forge::numpy-1.20-py38_1
+    -defaults::numpy-1.19-py38_0
+    +conda-forge::scipy-1.6.0-py38_0
+    -defaults::python-3.8.0-h1
+    +defaults::python-3.7.0-h1
+    -defaults::Pillow-8.0-py38_0
+    """
+)
+
+
+@pytest.fixture()
+def history(tmp_path):
+    meta = tmp_path / "env" / "conda-meta"
+    meta.mkdir(parents=True)
+    (meta / "history").write_text(HISTORY)
+    return CondaHistory(tmp_path / "env", cache_dir=tmp_path / "cache")
+
+
+def test_read_revision(history):
+    assert len(history) == 2
+
+    first = history.read_revision(0)
+    assert first["install"] == [
+        "numpy-1.19-py38_0-defaults",
+        "python-3.8.0-h1-defaults",
+    ]
+
+    latest = history.read_revision()
+    assert latest == {
+        "date": "2021-01-02 10:00:00",
+        "rev": 1,
+        "install": ["scipy-1.6.0-py38_0-conda-forge"],
+        "remove": ["pillow-8.0-py38_0-defaults"],
+        "upgrade": [
+            {
+                "old": "numpy-1.19-py38_0-defaults",
+                "new": "numpy-1.20-py38_1-conda-forge",
+            }
+        ],
+        "downgrade": [
+            {"old": "python-3.8.0-h1-defaults", "new": "python-3.7.0-h1-defaults"}
+        ],
+    }
+
+
+def test_revision_not_found(history):
+    with pytest.raises(IndexError):
+        history.read_revision(20)
+
+
+def test_offsets_are_cached_and_extended(history, tmp_path):
+    offsets = history.offsets
+    assert history.cache_file.is_file()
+
+    with open(history.path, "a") as f:
+        f.write("==> 2021-01-03 10:00:00 <==\n+defaults::xz-5.2-h0\n")
+
+    updated = CondaHistory(tmp_path / "env", cache_dir=tmp_path / "cache")
+    assert updated.offsets[:-1] == offsets
+    assert updated.read_revision()["install"] == ["xz-5.2-h0-defaults"]
@@ -1,9 +1,34 @@
+import pytest
+import hashlib
 import subprocess
+import zipfile
 import os
 import sys
+import json
 import platform
+import tomlkit
+import typer
+from base64 import urlsafe_b64encode
 from typer.testing import CliRunner
 from ezconda.main import app
+from ezconda.experimental.lock import find_environments_to_lock, solve_for_platform
+from ezconda.files.lockfile import (
+    LockFile,
+    Platform,
+    get_current_system,
+    get_explicit_line,
+    get_package_downloads,
+    get_package_url,
+    get_pip_requirements,
+    load_lock_file,
+    with_artifact_info,
+)
+from ezconda.files.prefix import (
+    read_installed_packages,
+    read_prefix_records,
+    read_pypi_direct_urls,
+)
+from ezconda.solver import Solver
 
 
 runner = CliRunner()
@@ -38,3 +63,456 @@ def test_lock_for_existing_conda_envs():
     )
 
     subprocess.run(["rm", "-rf", f"lock-test-{sys.platform}-{platform.machine()}.lock"])
+
+
+def test_lock_all_envs_with_specfiles(tmp_path, monkeypatch):
+    envs_dir = tmp_path / "envs"
+    for env_name in ["proj-a", "proj-b", "no-specfile"]:
+        meta = envs_dir / env_name / "conda-meta"
+        meta.mkdir(parents=True)
+        with open(meta / "zlib-1.2.11-h7b6447c_3.json", "w") as f:
+            json.dump(
+                {
+                    "name": "zlib",
+                    "version": "1.2.11",
+                    "build": "h7b6447c_3",
+                    "build_number": 3,
+                    "channel": "https://repo.anaconda.com/pkgs/main/linux-64",
+                    "subdir": "linux-64",
+                    "fn": "zlib-1.2.11-h7b6447c_3.conda",
+                },
+                f,
+            )
+    # an environment with a broken record does not stop the others
+    broken = envs_dir / "broken" / "conda-meta"
+    broken.mkdir(parents=True)
+    (broken / "zlib-1.2.11-h7b6447c_3.json").write_text("{")
+    monkeypatch.setenv("CONDA_ENVS_PATH", str(envs_dir))
+
+    specs_dir = tmp_path / "specs"
+    (specs_dir / "a").mkdir(parents=True)
+    (specs_dir / "b").mkdir(parents=True)
+    (specs_dir / "a" / "proj-a.yml").touch()
+    (specs_dir / "b" / "proj-b.yml").touch()
+    (specs_dir / "b" / "broken.yml").touch()
+    (specs_dir / "b" / "not-an-env.yml").touch()
+
+    environments = find_environments_to_lock(specs_dir)
+    assert environments == {
+        "broken": specs_dir / "b",
+        "proj-a": specs_dir / "a",
+        "proj-b": specs_dir / "b",
+    }
+
+    result = runner.invoke(app, ["lock", "--all", "--dir", str(specs_dir), "-j", "2"])
+    assert result.exit_code == 0
+    assert "JSONDecodeError" in result.stdout
+
+    suffix = f"{sys.platform}-{platform.machine()}.lock"
+    assert (specs_dir / "a" / f"proj-a-{suffix}").is_file()
+    assert (specs_dir / "b" / f"proj-b-{suffix}").is_file()
+    assert not (specs_dir / "b" / f"broken-{suffix}").exists()
+
+    # '--dir' is not silently ignored without '--all'
+    result = runner.invoke(app, ["lock", "-n", "proj-a", "--dir", str(specs_dir)])
+    assert result.exit_code == 1
+    assert "'--dir' can only be used with '--all'" in result.stdout
+
+
+def test_lock_for_other_platforms(tmp_path, monkeypatch):
+    # local channel with a platform specific package and a noarch package
+    channel = tmp_path / "channel"
+    for subdir, packages in [
+        ("noarch", {"bar-2.0-pyh_0.conda": ("bar", "2.0", "pyh_0", [])}),
+        ("linux-64", {"foo-1.0-h0_0.conda": ("foo", "1.0", "h0_0", ["bar"])}),
+        ("osx-arm64", {"foo-1.1-h0_0.conda": ("foo", "1.1", "h0_0", ["bar"])}),
+    ]:
+        (channel / subdir).mkdir(parents=True)
+        repodata = {"info": {"subdir": subdir}, "packages": {}, "packages.conda": {}}
+        for fn, (name, version, build, depends) in packages.items():
+            repodata["packages.conda"][fn] = {
+                "name": name,
+                "version": version,
+                "build": build,
+                "build_number": 0,
+                "depends": depends,
+                "subdir": subdir,
+                "md5": "0" * 32,
+                "size": 100,
+            }
+        with open(channel / subdir / "repodata.json", "w") as f:
+            json.dump(repodata, f)
+
+    monkeypatch.chdir(tmp_path)
+    with open("multi.yml", "w") as f:
+        f.write(f"name: multi\nchannels:\n- {channel.as_uri()}\ndependencies:\n- foo\n")
+
+    result = runner.invoke(
+        app,
+        [
+            "lock",
+            "-n",
+            "multi",
+            "-p",
+            "linux-64",
+            "-p",
+            "osx-arm64",
+            "--solver",
+            "conda",
+        ],
+    )
+    assert result.exit_code == 0
+
+    linux = LockFile().read_lock_file(tmp_path / "multi-linux-x86_64.lock")
+    assert linux["system"]["platform"] == "linux"
+    assert {(p["name"], p["version"]) for p in linux["packages"]} == {
+        ("bar", "2.0"),
+        ("foo", "1.0"),
+    }
+
+    osx = LockFile().read_lock_file(tmp_path / "multi-darwin-arm64.lock")
+    assert osx["system"]["machine"] == "arm64"
+    assert {(p["name"], p["platform"]) for p in osx["packages"]} == {
+        ("bar", "noarch"),
+        ("foo", "osx-arm64"),
+    }
+    # file names and checksums come from the solver's fetch actions
+    assert {p["fn"] for p in osx["packages"]} == {
+        "bar-2.0-pyh_0.conda",
+        "foo-1.1-h0_0.conda",
+    }
+    assert all(p["md5"] == "0" * 32 for p in osx["packages"])
+
+
+def test_solve_for_platform_reads_cached_artifacts(tmp_path, monkeypatch):
+    bar = make_package("bar", "2.0", "pyh_0", platform="noarch")
+    foo = make_package("foo", "1.1", "h0_0", platform="osx-arm64")
+    actions = {
+        "LINK": [foo, bar],
+        "FETCH": [dict(foo, fn="foo-1.1-h0_0.conda", md5="a" * 32)],
+    }
+    output = subprocess.CompletedProcess([], 0, json.dumps({"actions": actions}))
+    # 'ezconda.experimental.lock' is also the name of the 'lock' command
+    lock_module = sys.modules[solve_for_platform.__module__]
+    monkeypatch.setattr(lock_module, "run_command", lambda *args, **kwargs: output)
+
+    # 'bar' is already in the package cache, so it is only in 'LINK'
+    pkgs_dir = tmp_path / "pkgs"
+    monkeypatch.setenv("CONDA_PKGS_DIRS", str(pkgs_dir))
+    info = pkgs_dir / "bar-2.0-pyh_0" / "info"
+    info.mkdir(parents=True)
+    record = {
+        "name": "bar",
+        "fn": "bar-2.0-pyh_0.conda",
+        "url": f"{bar['base_url']}/noarch/bar-2.0-pyh_0.conda",
+        "md5": "b" * 32,
+        "sha256": "c" * 64,
+    }
+    (info / "repodata_record.json").write_text(json.dumps(record))
+
+    env_specs = {"channels": ["conda-forge"], "dependencies": ["foo"]}
+    packages = solve_for_platform(env_specs, Platform.osx_arm64, Solver.conda)
+    assert [(p["name"], p["fn"], p["md5"]) for p in packages] == [
+        ("bar", "bar-2.0-pyh_0.conda", "b" * 32),
+        ("foo", "foo-1.1-h0_0.conda", "a" * 32),
+    ]
+    assert packages[0]["sha256"] == "c" * 64
+
+    # a spec file without dependencies solves just like an empty list
+    packages = solve_for_platform(
+        {"channels": ["conda-forge"]}, Platform.osx_arm64, Solver.conda
+    )
+    assert [p["name"] for p in packages] == ["bar", "foo"]
+
+    # without a file name the lock file is not written with a guessed url
+    (info / "repodata_record.json").unlink()
+    with pytest.raises(typer.Exit):
+        solve_for_platform(env_specs, Platform.osx_arm64, Solver.conda)
+
+
+def test_load_lock_file_is_plain_and_cached(tmp_path, monkeypatch):
+    lock_file = tmp_path / "test.lock"
+    with open(lock_file, "w") as f:
+        f.write(
+            '[version]\nezconda-min-version = "0.4.0"\n\n'
+            '[[packages]]\nname = "zlib"\nbuild_number = 3\n'
+        )
+
+    doc = load_lock_file(lock_file)
+    assert doc == tomlkit.loads(lock_file.read_text())
+    assert type(doc) is dict and type(doc["packages"][0]) is dict
+    assert load_lock_file(lock_file) is doc
+
+    # without tomllib/tomli the result is the same
+    monkeypatch.setattr("ezconda.files.lockfile.tomllib", None)
+    monkeypatch.setattr("ezconda.files.lockfile._lock_file_cache", {})
+    fallback = load_lock_file(lock_file)
+    assert fallback == doc
+    assert type(fallback["packages"][0]["name"]) is str
+
+    # a changed file is read again
+    with open(lock_file, "a") as f:
+        f.write('\n[[packages]]\nname = "python"\nbuild_number = 0\n')
+    assert [p["name"] for p in load_lock_file(lock_file)["packages"]] == [
+        "zlib",
+        "python",
+    ]
+
+
+def make_package(name, version, build, channel="conda-forge", platform="linux-64"):
+    return {
+        "base_url": f"https://conda.anaconda.org/{channel}",
+        "build_number": 0,
+        "build_string": build,
+        "channel": channel,
+        "dist_name": f"{name}-{version}-{build}",
+        "name": name,
+        "platform": platform,
+        "version": version,
+    }
+
+
+LOCK_FILE_HEADER = """\
+[version]
+ezconda-min-version = "0.9.0"
+lock-version = 2
+
+[system]
+platform = "linux"
+architecture = "64bit"
+machine = "x86_64"
+
+[environment]
+name = "test"
+"""
+
+
+@pytest.mark.parametrize(
+    "packages, expected",
+    [
+        ([], "packages = []\nchannels = []\n\n" + LOCK_FILE_HEADER),
+        (
+            [
+                make_package("zlib", "1.2.11", "h7b6447c_3"),
+                make_package("six", "1.16.0", "pyh6c4a22f_0", platform="noarch"),
+                dict(
+                    make_package(
+                        'quote"back\\slash\ttabé', "1.0", "0", channel="bioconda"
+                    ),
+                    **{"weird key": True, "depends": ["python >=3.8"]},
+                ),
+            ],
+            LOCK_FILE_HEADER
+            + r"""
+[[packages]]
+name = "zlib"
+version = "1.2.11"
+build_string = "h7b6447c_3"
+channel = 0
+build_number = 0
+
+[[packages]]
+name = "six"
+version = "1.16.0"
+build_string = "pyh6c4a22f_0"
+channel = 1
+build_number = 0
+
+[[packages]]
+name = "quote\"back\\slash\ttabé"
+version = "1.0"
+build_string = "0"
+channel = 2
+build_number = 0
+"weird key" = true
+depends = ["python >=3.8"]
+
+[[channels]]
+base_url = "https://conda.anaconda.org/conda-forge"
+channel = "conda-forge"
+platform = "linux-64"
+
+[[channels]]
+base_url = "https://conda.anaconda.org/conda-forge"
+channel = "conda-forge"
+platform = "noarch"
+
+[[channels]]
+base_url = "https://conda.anaconda.org/bioconda"
+channel = "bioconda"
+platform = "linux-64"
+""",
+        ),
+    ],
+)
+def test_streamed_lock_file(packages, expected, tmp_path):
+    lock_file = LockFile().write_platform_lockfile(
+        "test", Platform.linux_64, iter(packages), tmp_path
+    )
+    assert lock_file.read_text() == expected
+
+
+def test_read_lock_file_with_channel_table(tmp_path):
+    packages = [
+        make_package("python", "3.9.7", "h12debd9_1"),
+        make_package("six", "1.16.0", "pyh6c4a22f_0", platform="noarch"),
+        dict(make_package("zlib", "1.2.11", "h7b6447c_3"), build_number=3),
+    ]
+    lock_file = LockFile().write_platform_lockfile(
+        "test", Platform.linux_64, packages, tmp_path
+    )
+
+    doc = tomlkit.loads(lock_file.read_text())
+    assert doc["channels"] == [
+        {
+            "base_url": "https://conda.anaconda.org/conda-forge",
+            "channel": "conda-forge",
+            "platform": "linux-64",
+        },
+        {
+            "base_url": "https://conda.anaconda.org/conda-forge",
+            "channel": "conda-forge",
+            "platform": "noarch",
+        },
+    ]
+    assert [p["channel"] for p in doc["packages"]] == [0, 1, 0]
+
+    # packages are read back with all their fields, including the build number
+    assert [p["build_number"] for p in doc["packages"]] == [0, 0, 3]
+    assert LockFile().read_lock_file(lock_file)["packages"] == packages
+
+    # lock files without a channel table can still be read
+    v1_lock_file = tmp_path / "v1.lock"
+    with open(v1_lock_file, "w") as f:
+        tomlkit.dump({"packages": packages}, f)
+    assert LockFile().read_lock_file(v1_lock_file)["packages"] == packages
+
+
+def test_lock_file_records_artifacts(tmp_path):
+    packages = [
+        make_package("python", "3.9.7", "h12debd9_1"),
+        make_package("requests", "2.28.1", "pypi_0", channel="pypi", platform="pypi"),
+    ]
+    records = [
+        {
+            "name": "python",
+            "fn": "python-3.9.7-h12debd9_1.conda",
+            "md5": "a" * 32,
+            "sha256": "b" * 64,
+        }
+    ]
+    lock_file = LockFile().write_platform_lockfile(
+        "test",
+        Platform.linux_64,
+        with_artifact_info(packages, records),
+        tmp_path,
+    )
+
+    downloads = get_package_downloads(LockFile().read_lock_file(lock_file)["packages"])
+    assert downloads == [
+        {
+            "url": "https://conda.anaconda.org/conda-forge/linux-64/python-3.9.7-h12debd9_1.conda",
+            "md5": "a" * 32,
+            "sha256": "b" * 64,
+        }
+    ]
+    assert get_explicit_line(downloads[0]).endswith(".conda#" + "a" * 32)
+
+    # without the file name (older lock files) the extension is guessed
+    assert get_package_url(packages[0]).endswith("h12debd9_1.tar.bz2")
+
+
+def test_pip_requirements_from_lock_file():
+    packages = [
+        make_package("python", "3.9.7", "h12debd9_1"),
+        dict(
+            make_package("localpkg", "1.0", "pypi_0", channel="pypi"),
+            url="file:///wheels/localpkg-1.0-py3-none-any.whl",
+            sha256="a" * 64,
+        ),
+        make_package("typing-extensions", "4.0.1", "pypi_0", channel="pypi"),
+    ]
+
+    # hashes are only used if every pip package has one
+    assert get_pip_requirements(packages) == [
+        "localpkg @ file:///wheels/localpkg-1.0-py3-none-any.whl",
+        "typing-extensions==4.0.1",
+    ]
+    assert get_pip_requirements(packages[:2]) == [
+        "localpkg @ file:///wheels/localpkg-1.0-py3-none-any.whl --hash=sha256:"
+        + "a" * 64
+    ]
+
+    # a hash without the url it was taken from does not pin the index package
+    packages[2]["sha256"] = "b" * 64
+    assert get_pip_requirements(packages[1:])[1] == "typing-extensions==4.0.1"
+
+
+def make_wheel(path, name, version):
+    dist_info = f"{name}-{version}.dist-info"
+    files = {
+        f"{name}.py": b"",
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n".encode(),
+        f"{dist_info}/WHEEL": b"Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    record = [
+        f"{p},sha256={urlsafe_b64encode(hashlib.sha256(d).digest()).rstrip(b'=').decode()},{len(d)}"
+        for p, d in files.items()
+    ]
+    wheel = path / f"{name}-{version}-py3-none-any.whl"
+    with zipfile.ZipFile(wheel, "w") as z:
+        for p, data in files.items():
+            z.writestr(p, data)
+        z.writestr(f"{dist_info}/RECORD", "\n".join(record + [f"{dist_info}/RECORD,,"]))
+    return wheel
+
+
+def test_lock_pip_package_installed_from_local_wheel(tmp_path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    with open(prefix / "conda-meta" / "python-3.9.7-h12debd9_1.json", "w") as f:
+        json.dump({"name": "python", "version": "3.9.7", "build": "h12debd9_1"}, f)
+    site_packages = prefix / "lib" / "python3.9" / "site-packages"
+
+    wheel = make_wheel(tmp_path, "localpkg", "1.0")
+    pip = [sys.executable, "-m", "pip", "install", "-q", "--no-deps", "--no-index"]
+    subprocess.run([*pip, "--target", str(site_packages), str(wheel)], check=True)
+
+    records = read_prefix_records(prefix)
+    packages = read_installed_packages(prefix, records)
+    packages = list(
+        with_artifact_info(packages, records, read_pypi_direct_urls(prefix, records))
+    )
+
+    # the wheel is not on any index, so it is required by its url
+    requirements = get_pip_requirements(packages)
+    assert requirements == [
+        f"localpkg @ {wheel.as_uri()} --hash=sha256:"
+        + hashlib.sha256(wheel.read_bytes()).hexdigest()
+    ]
+
+    requirements_file = tmp_path / "requirements.txt"
+    requirements_file.write_text("\n".join(requirements))
+    target = tmp_path / "installed"
+    subprocess.run(
+        [*pip, "--target", str(target), "-r", str(requirements_file)], check=True
+    )
+    assert (target / "localpkg.py").is_file()
+
+
+def test_lock_file_in_newer_format_is_refused(capsys):
+    doc = {
+        "version": {"ezconda-min-version": "99.0.0", "lock-version": 99},
+        "system": get_current_system(),
+        "packages": [],
+    }
+
+    with pytest.raises(typer.Exit):
+        LockFile().verify_lock_file_contents(doc)
+    assert "generated by a newer version of ezconda" in capsys.readouterr().out
+
+    # lock files in this format, or older ones without a format version, are accepted
+    doc["version"]["lock-version"] = LockFile._LOCK_VERSION
+    LockFile().verify_lock_file_contents(doc)
+    del doc["version"]["lock-version"]
+    LockFile().verify_lock_file_contents(doc)
@@ -0,0 +1,82 @@
+import pytest
+
+from ezconda.matchspec import (
+    MatchSpec,
+    index_dependencies,
+    parse_spec,
+    version_key,
+    version_matches,
+)
+
+
+@pytest.mark.parametrize(
+    "spec,expected",
+    [
+        ("numpy", MatchSpec("numpy")),
+        ("scikit-learn", MatchSpec("scikit-learn")),
+        ("numpy=1.21", MatchSpec("numpy", version="1.21*")),
+        ("numpy>=1.20,<2", MatchSpec("numpy", version=">=1.20,<2")),
+        ("numpy==1.21.0", MatchSpec("numpy", version="1.21.0")),
+        (
+            "numpy==1.21.0=py39_0",
+            MatchSpec("numpy", version="==1.21.0", build="py39_0"),
+        ),
+        ("numpy 1.21.* py39_0", MatchSpec("numpy", version="1.21.*", build="py39_0")),
+        ("numpy=1.21=py39_0", MatchSpec("numpy", version="1.21", build="py39_0")),
+        ("conda-forge::numpy", MatchSpec("numpy", channel="conda-forge")),
+        (
+            "conda-forge/linux-64::python-dateutil>=2.8",
+            MatchSpec(
+                "python-dateutil", channel="conda-forge/linux-64", version=">=2.8"
+            ),
+        ),
+        (
+            "numpy[version='>=1.20', build=py*]",
+            MatchSpec("numpy", version=">=1.20", build="py*"),
+        ),
+        ("PyYAML", MatchSpec("pyyaml")),
+        ("python >=3.8, <3.11", MatchSpec("python", version=">=3.8,<3.11")),
+        (
+            "foo >=1.0 , < 2.0 py34_0",
+            MatchSpec("foo", version=">=1.0,<2.0", build="py34_0"),
+        ),
+        ("numpy 1.21|1.22", MatchSpec("numpy", version="1.21|1.22")),
+    ],
+)
+def test_parse_spec(spec, expected):
+    assert parse_spec(spec) == expected
+
+
+def test_index_dependencies():
+    dependencies = [
+        "python=3.9",
+        "conda-forge::numpy",
+        {"pip": ["rich"]},
+        "pip",
+        "numpy>=1.20",
+    ]
+
+    index = index_dependencies(dependencies)
+
+    # every entry of a package listed more than once is kept
+    assert index == {"python": [0], "numpy": [1, 4], "pip:": [2], "pip": [3]}
+
+
+@pytest.mark.parametrize(
+    "spec_version,version,expected",
+    [
+        ("1.21", "1.21.0", True),
+        ("==1.21", "1.21.1", False),
+        ("=1.21", "1.21.5", True),
+        ("=1.2", "1.21", False),
+        ("1.21.*", "1.21.3", True),
+        (">=1.20,<2", "1.21", None),
+    ],
+)
+def test_version_matches(spec_version, version, expected):
+    assert version_matches(spec_version, version) is expected
+
+
+def test_version_key():
+    versions = ["1.10", "1.9", "1.10.1", "1.2.0"]
+    assert sorted(versions, key=version_key) == ["1.2.0", "1.9", "1.10", "1.10.1"]
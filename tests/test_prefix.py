@@ -0,0 +1,201 @@
+import json
+import pytest
+from pathlib import Path
+
+from ezconda.files.prefix import (
+    build_reverse_dependency_index,
+    resolve_env_prefix,
+    read_installed_packages,
+    read_prefix_records,
+    read_pypi_direct_urls,
+    split_channel_url,
+)
+
+
+def make_record(name, version, build, channel, subdir, files=()):
+    return {
+        "name": name,
+        "version": version,
+        "build": build,
+        "build_number": 0,
+        "channel": channel,
+        "subdir": subdir,
+        "fn": f"{name}-{version}-{build}.conda",
+        "url": f"{channel}/{name}-{version}-{build}.conda",
+        "files": list(files),
+    }
+
+
+@pytest.fixture()
+def fake_prefix(tmp_path):
+    prefix = tmp_path / "envs" / "test"
+    meta = prefix / "conda-meta"
+    meta.mkdir(parents=True)
+
+    records = [
+        make_record(
+            "python",
+            "3.9.7",
+            "h12debd9_1",
+            "https://repo.anaconda.com/pkgs/main/linux-64",
+            "linux-64",
+        ),
+        make_record(
+            "six",
+            "1.16.0",
+            "pyhd3eb1b0_0",
+            "https://conda.anaconda.org/conda-forge/linux-64",
+            "noarch",
+            files=["lib/python3.9/site-packages/six-1.16.0.dist-info/RECORD"],
+        ),
+    ]
+    for record in records:
+        with open(meta / f"{record['fn'][:-6]}.json", "w") as f:
+            json.dump(record, f)
+    (meta / "history").touch()
+
+    site_packages = prefix / "lib" / "python3.9" / "site-packages"
+    for name, version in [("six", "1.16.0"), ("Typing_Extensions", "4.0.1")]:
+        dist_info = site_packages / f"{name}-{version}.dist-info"
+        dist_info.mkdir(parents=True)
+        (dist_info / "METADATA").write_text(f"Name: {name}\nVersion: {version}\n")
+        (dist_info / "RECORD").touch()
+
+    return prefix
+
+
+def test_read_installed_packages(fake_prefix):
+    packages = read_installed_packages(fake_prefix)
+
+    assert [pkg["name"] for pkg in packages] == ["python", "six", "typing-extensions"]
+
+    python, six, typing_extensions = packages
+    assert python == {
+        "base_url": "https://repo.anaconda.com/pkgs/main",
+        "build_number": 0,
+        "build_string": "h12debd9_1",
+        "channel": "pkgs/main",
+        "dist_name": "python-3.9.7-h12debd9_1",
+        "name": "python",
+        "platform": "linux-64",
+        "version": "3.9.7",
+    }
+    # noarch packages are recorded with the channel url of the native subdir
+    assert six["base_url"] == "https://conda.anaconda.org/conda-forge"
+    assert six["channel"] == "conda-forge"
+    assert six["platform"] == "noarch"
+    # packages not installed by conda are reported like 'conda list' does
+    assert typing_extensions["channel"] == "pypi"
+    assert typing_extensions["dist_name"] == "typing-extensions-4.0.1-pypi_0"
+
+
+def test_read_prefix_records_drops_file_lists(fake_prefix):
+    files = [f"lib/python3.9/site-packages/six/{i}.py" for i in range(1000)]
+    with open(fake_prefix / "conda-meta" / "six-1.16.0-pyhd3eb1b0_0.json", "w") as f:
+        record = make_record(
+            "six",
+            "1.16.0",
+            "pyhd3eb1b0_0",
+            "https://conda.anaconda.org/conda-forge/linux-64",
+            "noarch",
+            files=[*files, "lib/python3.9/site-packages/six-1.16.0.dist-info/RECORD"],
+        )
+        record["paths_data"] = {"paths": [{"_path": fpath} for fpath in files]}
+        json.dump(record, f)
+
+    records = read_prefix_records(fake_prefix)
+    six = next(r for r in records if r["name"] == "six")
+
+    # only the pip metadata owned by the package is kept
+    assert "paths_data" not in six
+    assert six["files"] == ["lib/python3.9/site-packages/six-1.16.0.dist-info/RECORD"]
+    names = [pkg["name"] for pkg in read_installed_packages(fake_prefix, records)]
+    assert names == ["python", "six", "typing-extensions"]
+
+
+def test_resolve_env_prefix(fake_prefix, monkeypatch):
+    monkeypatch.setenv("CONDA_ENVS_PATH", str(fake_prefix.parent))
+
+    assert resolve_env_prefix("test") == fake_prefix
+    assert resolve_env_prefix(str(fake_prefix)) == fake_prefix
+    assert resolve_env_prefix("does-not-exist") is None
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            "https://conda.anaconda.org/t/tk-123/conda-forge/osx-arm64",
+            {
+                "base_url": "https://conda.anaconda.org/conda-forge",
+                "channel": "conda-forge",
+            },
+        ),
+        (
+            "https://conda.anaconda.org/pytorch/label/dev",
+            {
+                "base_url": "https://conda.anaconda.org/pytorch/label/dev",
+                "channel": "pytorch/label/dev",
+            },
+        ),
+        (
+            "file:///tmp/local-channel/noarch",
+            {"base_url": "file:///tmp/local-channel", "channel": "local-channel"},
+        ),
+    ],
+)
+def test_split_channel_url(url, expected):
+    assert split_channel_url(url) == expected
+
+
+def test_build_reverse_dependency_index():
+    records = [
+        {"name": "pandas", "depends": ["numpy >=1.20", "python >=3.8,<3.9.0a0"]},
+        {"name": "scipy", "depends": ["numpy>=1.19", "python_abi 3.8.* *_cp38"]},
+        {"name": "numpy", "depends": ["python"]},
+        {"name": "python"},
+    ]
+
+    index = build_reverse_dependency_index(records)
+
+    assert index["numpy"] == {"pandas", "scipy"}
+    assert index["python"] == {"pandas", "numpy"}
+    assert index["python_abi"] == {"scipy"}
+    assert "pandas" not in index
+
+
+def test_read_pypi_direct_urls(fake_prefix):
+    dist_info = (
+        fake_prefix / "lib/python3.9/site-packages/Typing_Extensions-4.0.1.dist-info"
+    )
+    with open(dist_info / "direct_url.json", "w") as f:
+        json.dump(
+            {
+                "url": "file:///wheels/typing_extensions-4.0.1-py3-none-any.whl",
+                "archive_info": {"hash": "sha256=" + "a" * 64},
+            },
+            f,
+        )
+
+    records = read_prefix_records(fake_prefix)
+    assert read_pypi_direct_urls(fake_prefix, records) == {
+        "typing-extensions": {
+            "url": "file:///wheels/typing_extensions-4.0.1-py3-none-any.whl",
+            "sha256": "a" * 64,
+        }
+    }
+
+    with open(dist_info / "direct_url.json", "w") as f:
+        json.dump(
+            {
+                "url": "https://github.com/python/typing_extensions",
+                "vcs_info": {"vcs": "git", "commit_id": "0123abc"},
+            },
+            f,
+        )
+
+    assert read_pypi_direct_urls(fake_prefix, records) == {
+        "typing-extensions": {
+            "url": "git+https://github.com/python/typing_extensions@0123abc",
+        }
+    }
@@ -0,0 +1,65 @@
+import json
+import threading
+from typer.testing import CliRunner
+from ezconda.main import app
+from ezconda import profiling
+from ezconda.profiling import phase, profiled, start_profiling, stop_profiling
+
+
+runner = CliRunner()
+
+
+@profiled("outer", lambda name: {"name": name})
+def outer(name):
+    with phase("inner"):
+        pass
+    return name
+
+
+def test_phases_are_only_recorded_while_profiling():
+    assert outer("a") == "a"
+    assert stop_profiling() == []
+
+    start_profiling()
+    outer("b")
+    thread = threading.Thread(target=outer, args=("c",))
+    thread.start()
+    thread.join()
+    events = stop_profiling()
+
+    assert [(e["name"], e["depth"]) for e in events] == [
+        ("outer", 0),
+        ("inner", 1),
+        ("outer", 0),
+        ("inner", 1),
+    ]
+    assert events[0]["details"] == {"name": "b"}
+    assert events[0]["thread"] != events[2]["thread"]
+    assert events[0]["duration"] >= events[1]["duration"]
+
+    outer("d")
+    assert len(profiling._events) == len(events)
+
+
+def test_profile_table_and_trace(tmp_path):
+    trace_file = tmp_path / "trace.json"
+    result = runner.invoke(
+        app, ["--profile", "--profile-trace", str(trace_file), "version"]
+    )
+
+    assert result.exit_code == 0
+    assert "Profile" in result.stdout
+    assert "total" in result.stdout
+    assert json.loads(trace_file.read_text()) == {
+        "traceEvents": [],
+        "displayTimeUnit": "ms",
+    }
+
+    start_profiling()
+    outer("e")
+    profiling.write_trace(stop_profiling(), trace_file)
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["outer", "inner"]
+    assert events[0]["ph"] == "X"
+    assert events[0]["args"] == {"name": "e"}
+    assert events[0]["ts"] <= events[1]["ts"]
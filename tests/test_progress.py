@@ -0,0 +1,36 @@
+import pytest
+from ezconda.progress import SolverProgress
+
+
+def test_conda_download_progress():
+    progress = SolverProgress()
+
+    assert progress.update("Solving environment: ...working... done") == (
+        "Solving environment"
+    )
+    assert progress.update("numpy-1.22.3   | 6.8 MB    | ####5      |  45% ") == (
+        "Downloading & extracting packages (0/1): numpy-1.22.3 45%"
+    )
+    assert progress.is_update("numpy-1.22.3   | 6.8 MB    | ####5      |  45% ")
+    progress.update("numpy-1.22.3   | 6.8 MB    | ########## | 100% ")
+    assert progress.update("six-1.16.0     | 13 KB     | ########## | 100% ") == (
+        "Downloading & extracting packages (2/2): six-1.16.0 100%"
+    )
+    assert progress.downloaded == 2
+
+
+@pytest.mark.parametrize(
+    "line, message",
+    [
+        ("numpy    6.8MB @  3.1MB/s  2.2s", "Downloaded 1 packages: numpy"),
+        ("Linking numpy-1.22.3-py39h", "Linking packages (1): numpy-1.22.3-py39h"),
+        ("Collecting requests==2.28.1", "pip: Collecting requests==2.28.1"),
+        (
+            "Installing collected packages: requests",
+            "pip: Installing collected packages requests",
+        ),
+        ("  Package  Version  Build", None),
+    ],
+)
+def test_mamba_and_pip_progress(line, message):
+    assert SolverProgress().update(line) == message
@@ -1,6 +1,8 @@
 import pytest
 from typer.testing import CliRunner
 from ezconda.main import app
+from ezconda.remove import get_dependent_packages
+from ezconda.snapshot import EnvSnapshot
 from .helpers import check_if_pkg_is_installed
 
 
@@ -61,3 +63,21 @@ def test_remove_a_pkg_that_is_a_dep_for_other(clean_up_env_after_test):
     with pytest.raises(AssertionError):
         check_if_pkg_is_installed("test", "numpy", "conda-forge")
         check_if_pkg_is_installed("test", "pandas", "conda-forge")
+
+
+def test_dependent_packages_from_installed_records():
+    snapshot = EnvSnapshot("test")
+    snapshot._records = [
+        {"name": "pandas", "depends": ["numpy >=1.20", "python"]},
+        {"name": "scipy", "depends": ["numpy >=1.19", "python"]},
+        {"name": "numpy", "depends": ["python"]},
+        {"name": "python"},
+    ]
+    snapshot._packages = [{"name": r["name"]} for r in snapshot._records]
+
+    required_by = get_dependent_packages(["numpy>=1.20"], snapshot, ["defaults"])
+    assert required_by == {"numpy>=1.20": {"pandas", "scipy"}}
+
+    # packages that are removed together do not need a warning for each other
+    required_by = get_dependent_packages(["numpy", "scipy"], snapshot, ["defaults"])
+    assert required_by == {"numpy": {"pandas"}}
@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import pytest
+import threading
+
+from ezconda._utils import check_package_specs
+from ezconda.files.repodata import RepodataIndex, get_repodata_index_dir
+
+
+def make_repodata(subdir, packages):
+    return {
+        "info": {"subdir": subdir},
+        "packages": {},
+        "packages.conda": {
+            f"{name}-{version}-h0_0.conda": {
+                "name": name,
+                "version": version,
+                "build": "h0_0",
+                "build_number": 0,
+                "depends": [],
+                "subdir": subdir,
+                "md5": "0" * 32,
+            }
+            for name, version in packages
+        },
+    }
+
+
+@pytest.fixture()
+def pkgs_dir(tmp_path):
+    cache = tmp_path / "pkgs" / "cache"
+    cache.mkdir(parents=True)
+
+    # older conda versions record the url in the repodata file ...
+    repodata = make_repodata("linux-64", [("numpy", "1.21.5"), ("numpy", "1.22.3")])
+    repodata["_url"] = "https://conda.anaconda.org/conda-forge/linux-64"
+    (cache / "0a1b2c3d.json").write_text(json.dumps(repodata))
+
+    # ... newer ones in a separate '.info.json' file
+    repodata = make_repodata("noarch", [("six", "1.16.0"), ("scipy", "1.7.3")])
+    (cache / "4e5f6a7b.json").write_text(json.dumps(repodata))
+    (cache / "4e5f6a7b.info.json").write_text(
+        json.dumps({"url": "https://repo.anaconda.com/pkgs/main/noarch"})
+    )
+    return tmp_path / "pkgs"
+
+
+def test_repodata_index_lookups(pkgs_dir, tmp_path):
+    index = RepodataIndex([pkgs_dir], tmp_path / "index")
+
+    assert [m["channel"] for m in index.manifests] == ["conda-forge", "pkgs/main"]
+    assert [r["version"] for r in index.get("numpy")] == ["1.21.5", "1.22.3"]
+    assert index.get("numpy")[0]["channel"] == "conda-forge"
+
+    assert index.get("six", ["conda-forge"]) == []
+    assert len(index.get("six", ["defaults"])) == 1
+    assert index.names(["defaults"]) == {"six", "scipy"}
+    assert not index.has_channels(["bioconda"])
+
+
+def test_repodata_index_refreshes_changed_files(pkgs_dir, tmp_path):
+    index_dir = tmp_path / "index"
+    RepodataIndex([pkgs_dir], index_dir).refresh()
+
+    shards = {p.name: p for p in index_dir.glob("*/shards/*.json")}
+    for shard in shards.values():
+        os.utime(shard, ns=(0, 0))
+
+    # conda refreshed the noarch repodata: 'six' changed, 'scipy' was removed
+    cache_file = pkgs_dir / "cache" / "4e5f6a7b.json"
+    cache_file.write_text(json.dumps(make_repodata("noarch", [("six", "1.17.0")])))
+
+    index = RepodataIndex([pkgs_dir], index_dir)
+    assert [r["version"] for r in index.get("six")] == ["1.17.0"]
+    assert index.get("scipy") == []
+    assert not shards["scipy.json"].exists()
+    # shards of unchanged files are left alone
+    assert shards["numpy.json"].stat().st_mtime_ns == 0
+
+    # and the shards of removed repodata files are cleaned up
+    cache_file.unlink()
+    index = RepodataIndex([pkgs_dir], index_dir)
+    assert index.get("six") == []
+    assert not shards["six.json"].exists()
+
+
+def test_repodata_index_only_splits_queried_channels(pkgs_dir, tmp_path):
+    cache = pkgs_dir / "cache"
+    (cache / "0a1b2c3d.info.json").write_text(
+        json.dumps({"url": "https://conda.anaconda.org/conda-forge/linux-64"})
+    )
+    index_dir = tmp_path / "index"
+    index = RepodataIndex([pkgs_dir], index_dir)
+
+    assert [r["version"] for r in index.get("six", ["defaults"])] == ["1.16.0"]
+    # the conda-forge repodata was not split
+    assert not list(index_dir.glob("*/shards/numpy.json"))
+
+
+def test_repodata_index_splits_in_background(pkgs_dir, tmp_path, monkeypatch):
+    index_dir = tmp_path / "index"
+    RepodataIndex([pkgs_dir], index_dir).refresh()
+
+    cache_file = pkgs_dir / "cache" / "4e5f6a7b.json"
+    cache_file.write_text(json.dumps(make_repodata("noarch", [("six", "1.17.0")])))
+
+    threads = []
+
+    class Thread(threading.Thread):
+        def start(self):
+            threads.append(self)
+
+    monkeypatch.setattr(threading, "Thread", Thread)
+
+    # the previous shards are used while the file is split again
+    index = RepodataIndex([pkgs_dir], index_dir, background=True)
+    assert [r["version"] for r in index.get("six", ["defaults"])] == ["1.16.0"]
+    # ezconda does not wait for the threads to exit
+    assert threads and all(thread.daemon for thread in threads)
+    for thread in threads:
+        thread.run()
+
+    index = RepodataIndex([pkgs_dir], index_dir, background=True)
+    assert [r["version"] for r in index.get("six", ["defaults"])] == ["1.17.0"]
+    assert not list(index_dir.glob("*/shards/*.tmp"))
+
+
+def test_repodata_index_keys_on_content(pkgs_dir, tmp_path):
+    cache_file = pkgs_dir / "cache" / "0a1b2c3d.json"
+    repodata = make_repodata("linux-64", [("numpy", "1.22.3")])
+
+    def write(etag):
+        # older conda versions write the response headers first
+        header = {
+            "_url": "https://conda.anaconda.org/conda-forge/linux-64",
+            "_etag": etag,
+            "_mod": "Mon, 04 Apr 2022 10:00:00 GMT",
+        }
+        cache_file.write_text(json.dumps({**header, **repodata}))
+
+    write('W/"abc"')
+    index_dir = tmp_path / "index"
+    RepodataIndex([pkgs_dir], index_dir).refresh()
+    shard = next(index_dir.glob("*/shards/numpy.json"))
+    manifest = shard.parent.parent / "manifest.json"
+    os.utime(manifest, ns=(0, 0))
+
+    # conda only touched the file after a '304 Not Modified' response
+    os.utime(cache_file, ns=(1, 1))
+    RepodataIndex([pkgs_dir], index_dir).refresh()
+    assert manifest.stat().st_mtime_ns == 0
+
+    # the channel changed
+    repodata = make_repodata("linux-64", [("numpy", "1.23.0")])
+    write('W/"def"')
+    index = RepodataIndex([pkgs_dir], index_dir)
+    assert [r["version"] for r in index.get("numpy")] == ["1.23.0"]
+
+
+def test_repodata_index_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(sys, "platform", "linux")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    assert get_repodata_index_dir() == tmp_path / "ezconda" / "repodata"
+
+
+def test_check_package_specs(pkgs_dir, tmp_path, capsys):
+    index = RepodataIndex([pkgs_dir], tmp_path / "index")
+
+    check_package_specs(["numpy=1.22", "six", "scipy>=1.7"], None, index)
+    assert capsys.readouterr().out == ""
+
+    check_package_specs(["numpyy"], None, index)
+    assert "Did you mean 'numpy'?" in capsys.readouterr().out
+
+    check_package_specs(["numpy=1.19"], ["conda-forge"], index)
+    assert "Latest versions: 1.22.3, 1.21.5" in capsys.readouterr().out
+
+    # nothing is known about channels that conda has not cached
+    check_package_specs(["numpyy", "bioconda::samtools"], ["bioconda"], index)
+    assert capsys.readouterr().out == ""
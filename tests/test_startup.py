@@ -0,0 +1,60 @@
+import sys
+import subprocess
+import pytest
+from textwrap import dedent
+
+from ezconda.main import LAZY_COMMANDS
+
+
+def imported_modules(*args):
+    """Modules imported by `ezconda <args>`"""
+    code = dedent(
+        f"""
+        import sys
+        from ezconda.main import app
+        try:
+            app({list(args)!r})
+        except SystemExit:
+            pass
+        sys.stderr.write(" ".join(sys.modules))
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    return set(result.stderr.split())
+
+
+def test_version_does_not_import_heavy_modules():
+    modules = imported_modules("version")
+    for heavy in ("conda", "tomlkit", "yaml", "rich.table", "rich.tree"):
+        assert heavy not in modules
+
+
+def test_version_is_only_looked_up_by_the_version_command():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, ezconda.main; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert "importlib_metadata" not in result.stdout.split()
+    assert "importlib_metadata" in imported_modules("version")
+
+
+@pytest.mark.parametrize("command", list(LAZY_COMMANDS))
+def test_commands_are_imported_lazily(command):
+    modules = imported_modules(command, "--help")
+
+    command_modules = {
+        name: "ezconda" + module for name, (module, _) in LAZY_COMMANDS.items()
+    }
+    assert command_modules[command] in modules
+    # 'create', 'install', 'remove', 'sync' and 'update' only provide commands,
+    # so they should never be imported by another command
+    for other in ("create", "install", "remove", "sync", "update"):
+        if other != command:
+            assert command_modules[other] not in modules
@@ -1,8 +1,18 @@
 import sys
+import json
 import pytest
+import subprocess
 from typer.testing import CliRunner
+from ezconda import summary
 from ezconda.main import app
-from ezconda.summary import get_summary_for_revision
+from ezconda.solver import Solver
+from ezconda.summary import (
+    get_actions_from_solution,
+    get_summary_for_revision,
+    get_summary_for_update_plan,
+    get_transaction_plan,
+    print_transaction_cost,
+)
 
 
 runner = CliRunner()
@@ -39,3 +49,125 @@ def test_installs_upgrade_downgrade_removal_summary(clean_up_env_after_test):
         "test", revision_no=-1
     )
     assert removal
+
+
+def _pkg(name, version, build_number=0, size=0):
+    return {
+        "name": name,
+        "version": version,
+        "build_string": f"h_{build_number}",
+        "build_number": build_number,
+        "channel": "conda-forge",
+        "platform": "linux-64",
+        "size": size,
+    }
+
+
+def test_transaction_plan_from_dry_run_actions():
+    actions = {
+        "LINK": [
+            _pkg("numpy", "1.22.0"),
+            _pkg("python", "3.9.7"),
+            _pkg("six", "1.16.0", build_number=1),
+            _pkg("scipy", "1.8.0"),
+        ],
+        "UNLINK": [
+            _pkg("numpy", "1.21.2"),
+            _pkg("python", "3.10.0"),
+            _pkg("six", "1.16.0"),
+            _pkg("pandas", "1.4.0"),
+        ],
+    }
+    plan = get_transaction_plan(actions)
+
+    assert plan["install"] == ["scipy-1.8.0-h_0-conda-forge/linux-64"]
+    assert plan["remove"] == ["pandas-1.4.0-h_0-conda-forge/linux-64"]
+    assert [u["new"] for u in plan["upgrade"]] == [
+        "numpy-1.22.0-h_0-conda-forge/linux-64",
+        "six-1.16.0-h_1-conda-forge/linux-64",
+    ]
+    assert plan["downgrade"] == [
+        {
+            "old": "python-3.10.0-h_0-conda-forge/linux-64",
+            "new": "python-3.9.7-h_0-conda-forge/linux-64",
+        }
+    ]
+
+    assert get_transaction_plan({}) == {
+        "install": [],
+        "upgrade": [],
+        "downgrade": [],
+        "remove": [],
+    }
+
+
+def test_transaction_cost(capsys):
+    actions = {
+        "FETCH": [_pkg("scipy", "1.8.0", size=2_500_000)],
+        "LINK": [_pkg("scipy", "1.8.0"), _pkg("numpy", "1.22.0")],
+        "UNLINK": [_pkg("numpy", "1.21.2")],
+    }
+    print_transaction_cost(actions)
+
+    out = capsys.readouterr().out
+    assert "1 packages to download (2.5 MB), 1 already in the package cache" in out
+    assert "2 packages to link, 1 to unlink" in out
+
+
+def test_actions_from_solution():
+    installed = [
+        _pkg("numpy", "1.21.2"),
+        _pkg("python", "3.9.7"),
+        _pkg("scipy", "1.7.3"),
+        {**_pkg("black", "22.3.0"), "channel": "pypi"},
+    ]
+    # solution of the specifications in a new environment
+    actions = {
+        "FETCH": [_pkg("numpy", "1.22.0", size=100)],
+        "LINK": [_pkg("numpy", "1.22.0"), _pkg("python", "3.9.7")],
+    }
+    actions = get_actions_from_solution(actions, installed)
+
+    assert [pkg["version"] for pkg in actions["LINK"]] == ["1.22.0"]
+    assert [pkg["name"] for pkg in actions["UNLINK"]] == ["numpy", "scipy"]
+    assert actions["FETCH"] == [_pkg("numpy", "1.22.0", size=100)]
+
+
+@pytest.mark.parametrize("frozen_solve_works", [True, False])
+def test_update_plan_keeps_installed_packages(
+    frozen_solve_works, tmp_path, monkeypatch, capsys
+):
+    file = tmp_path / "test.yml"
+    file.write_text("name: test\nchannels:\n- defaults\ndependencies:\n- app\n")
+    installed = [_pkg("app", "1.0"), _pkg("lib", "1.0"), _pkg("old", "1.0")]
+
+    commands = []
+
+    def run_command(cmd, verbose=False, check=True):
+        commands.append(cmd)
+        if len(commands) == 1:
+            # solved from scratch, 'lib' would be upgraded
+            link = [_pkg("app", "1.0"), _pkg("lib", "1.1")]
+        elif frozen_solve_works:
+            link = [_pkg("app", "1.0"), _pkg("lib", "1.0")]
+        else:
+            return subprocess.CompletedProcess(cmd, 1, "{}", "")
+        return subprocess.CompletedProcess(
+            cmd, 0, json.dumps({"actions": {"LINK": link}})
+        )
+
+    monkeypatch.setattr(summary, "run_command", run_command)
+    plan = get_summary_for_update_plan("test", str(file), Solver.conda, installed)
+
+    # only packages that are still needed are pinned, and never those in the file
+    assert "lib==1.0=h_0" in commands[1]
+    assert not any(arg.startswith(("app==", "old==")) for arg in commands[1])
+
+    assert plan["remove"] == ["old-1.0-h_0-conda-forge/linux-64"]
+    if frozen_solve_works:
+        assert plan["upgrade"] == []
+    else:
+        assert [u["new"] for u in plan["upgrade"]] == [
+            "lib-1.1-h_0-conda-forge/linux-64"
+        ]
+        assert "estimate" in capsys.readouterr().out
@@ -1,3 +1,5 @@
+import copy
+import json
 import pytest
 import shutil
 import sys
@@ -5,6 +7,8 @@ import platform
 from typer.testing import CliRunner
 from ezconda.main import app
 from ezconda._utils import read_env_file, add_pkg_to_dependencies, write_env_file
+from ezconda.files.lockfile import LockFile, get_lock_file_changes
+from ezconda.snapshot import EnvSnapshot
 from .helpers import check_if_pkg_is_installed
 
 
@@ -69,3 +73,69 @@ def test_verbose_install_w_conda(clean_up_env_after_test):
     assert result.exit_code == 0
 
     check_if_pkg_is_installed("test", "numpy")
+
+
+def test_env_sync_w_lockfile_already_in_sync(tmp_path, monkeypatch):
+    meta = tmp_path / "envs" / "synced" / "conda-meta"
+    meta.mkdir(parents=True)
+    with open(meta / "zlib-1.2.11-h7b6447c_3.json", "w") as f:
+        json.dump(
+            {
+                "name": "zlib",
+                "version": "1.2.11",
+                "build": "h7b6447c_3",
+                "build_number": 3,
+                "channel": "https://repo.anaconda.com/pkgs/main/linux-64",
+                "subdir": "linux-64",
+            },
+            f,
+        )
+    monkeypatch.setenv("CONDA_ENVS_PATH", str(tmp_path / "envs"))
+
+    lock_file = LockFile().write_lockfile("synced", lockfile_dir=tmp_path)
+
+    # the solver is never started when nothing changed
+    monkeypatch.setenv("PATH", "")
+    result = runner.invoke(
+        app, ["sync", "-n", "synced", "--with", "lockfile", "-f", str(lock_file)]
+    )
+    assert result.exit_code == 0
+    assert "already in sync" in result.stdout
+
+    doc = copy.deepcopy(LockFile().read_lock_file(lock_file))
+    doc["packages"][0]["build_string"] = "h7b6447c_4"
+    changes = get_lock_file_changes(doc, EnvSnapshot("synced"))
+    assert changes["changed"] == [doc["packages"][0]]
+
+
+def test_lock_file_changes_with_environment():
+    snapshot = EnvSnapshot("test")
+    snapshot._prefix = "/envs/test"
+
+    def pkg(name, version, build="0"):
+        return {
+            "name": name,
+            "version": version,
+            "build_string": build,
+            "channel": "conda-forge",
+        }
+
+    snapshot._packages = [
+        pkg("python", "3.9.7"),
+        pkg("numpy", "1.21.0"),
+        pkg("six", "1.16.0"),
+    ]
+    doc = {
+        "packages": [
+            pkg("python", "3.9.7"),
+            pkg("numpy", "1.22.0"),
+            pkg("scipy", "1.8.0"),
+        ]
+    }
+
+    changes = get_lock_file_changes(doc, snapshot)
+    assert changes == {
+        "added": [pkg("scipy", "1.8.0")],
+        "removed": [pkg("six", "1.16.0")],
+        "changed": [pkg("numpy", "1.22.0")],
+    }
@@ -1,3 +1,4 @@
+import os
 import sys
 import pytest
 import typer
@@ -11,7 +12,11 @@ from ezconda._utils import (
     add_new_channel_to_env_specs,
     remove_pkg_from_dependencies,
     run_command,
+    write_env_file,
+    confirm_dependent_removal,
+    _TAIL_LINES,
 )
+from ezconda.console import console
 
 
 runner = CliRunner()
@@ -111,6 +116,16 @@ def test_add_pkg_to_dependencies(ENV_SPECS, package, EXPECTED_SPECS):
     assert env_specs == EXPECTED_SPECS
 
 
+def test_add_existing_pkg_with_channel_and_version():
+    env_specs = {"name": "test", "dependencies": ["conda-forge::scikit-learn=1.0"]}
+
+    # 'scikit-image' is a different package than 'scikit-learn'
+    add_pkg_to_dependencies(env_specs, ["scikit-image"])
+
+    with pytest.raises(typer.Exit):
+        add_pkg_to_dependencies(env_specs, ["scikit-learn>=1.1"])
+
+
 @pytest.mark.parametrize(
     "ENV_SPECS,channel,EXPECTED_SPECS",
     [
@@ -166,6 +181,37 @@ def test_add_new_channel_to_env_specs(ENV_SPECS, channel, EXPECTED_SPECS):
                 "dependencies": ["numpy", "scipy"],
             },
         ),
+        (  # names with dashes, channels and versions
+            {
+                "name": "test",
+                "channels": ["conda-forge", "defaults"],
+                "dependencies": [
+                    "scikit-image",
+                    "scikit-learn>=1.0",
+                    "conda-forge::numpy=1.21",
+                    {"pip": ["rich"]},
+                ],
+            },
+            ["scikit-learn", "numpy"],
+            {
+                "name": "test",
+                "channels": ["conda-forge", "defaults"],
+                "dependencies": ["scikit-image", {"pip": ["rich"]}],
+            },
+        ),
+        (  # every entry of a package listed more than once
+            {
+                "name": "test",
+                "channels": ["conda-forge", "defaults"],
+                "dependencies": ["numpy>=1.20", "scipy", "numpy<2", "pandas"],
+            },
+            ["numpy"],
+            {
+                "name": "test",
+                "channels": ["conda-forge", "defaults"],
+                "dependencies": ["scipy", "pandas"],
+            },
+        ),
     ],
 )
 def test_remove_pkg_from_dependencies(ENV_SPECS, package, EXPECTED_SPECS):
@@ -179,6 +225,31 @@ def test_run_command_w_verbose():
     assert "hello world!" in result.stdout
 
 
+def test_run_command_streams_into_status():
+    script = (
+        "for i in range(1000): print(f'line {i}')\nprint('Solving environment: done')"
+    )
+    with console.status("[magenta]Running") as status:
+        result = run_command([sys.executable, "-c", script], status=status)
+        assert status.status == "[magenta]Running"
+
+    lines = result.stdout.splitlines()
+    assert len(lines) == _TAIL_LINES
+    assert lines[-1] == "Solving environment: done"
+
+
+def test_run_command_streamed_failure_shows_tail(capsys):
+    script = "import sys\nfor i in range(1000): print(f'line {i}')\nsys.exit('failed!')"
+    with console.status("[magenta]Running") as status:
+        with pytest.raises(typer.Exit):
+            run_command([sys.executable, "-c", script], status=status)
+
+    out = capsys.readouterr().out
+    assert "failed!" in out
+    assert "line 999" in out
+    assert "line 0\n" not in out
+
+
 def test_abort_when_filename_and_env_name_different():
     with pytest.raises(typer.Exit):
         get_validate_file_name(
@@ -195,3 +266,88 @@ def test_remove_pkg_from_dependencies_when_none():
     with pytest.raises(typer.Exit):
         remove_pkg_from_dependencies({"name": "test"}, ["numpy"])
         assert "There are no packages listed in 'test.yml' file." in sys.stdout
+
+
+def test_write_env_file_only_updates_changed_sections(tmp_path):
+    file = tmp_path / "test.yml"
+    file.write_text(
+        "# shared team environment\n"
+        "name: test  # do not rename\n"
+        "channels:\n"
+        "  - conda-forge  # first\n"
+        "  - defaults\n"
+        "dependencies:\n"
+        "  - python=3.9\n"
+        "  - numpy  # pinned by the solver\n"
+        "  - pandas\n"
+        "\n"
+        "# runtime settings\n"
+        "variables:\n"
+        "  OMP_NUM_THREADS: 1\n"
+    )
+
+    env_specs = read_env_file(file)
+    env_specs = add_pkg_to_dependencies(env_specs, ["scipy"])
+    env_specs = remove_pkg_from_dependencies(env_specs, ["pandas"])
+    write_env_file(env_specs, file)
+
+    assert read_env_file(file) == env_specs
+    assert file.read_text() == (
+        "# shared team environment\n"
+        "name: test  # do not rename\n"
+        "channels:\n"
+        "  - conda-forge  # first\n"
+        "  - defaults\n"
+        "dependencies:\n"
+        "  - python=3.9\n"
+        "  - numpy  # pinned by the solver\n"
+        "  - scipy\n"
+        "\n"
+        "# runtime settings\n"
+        "variables:\n"
+        "  OMP_NUM_THREADS: 1\n"
+    )
+
+
+def test_write_env_file_skips_unchanged_file(tmp_path):
+    file = tmp_path / "test.yml"
+    write_env_file({"name": "test", "channels": ["defaults"]}, file)
+    os.utime(file, ns=(0, 0))
+
+    write_env_file(read_env_file(file), file)
+    assert file.stat().st_mtime_ns == 0
+
+
+class FakeStatus:
+    def __init__(self):
+        self.calls = []
+
+    def stop(self):
+        self.calls.append("stop")
+
+    def start(self):
+        self.calls.append("start")
+
+
+def test_confirm_dependent_removal(monkeypatch, capsys):
+    required_by = {"numpy": {"scipy", "pandas"}}
+    answers = []
+    monkeypatch.setattr(
+        "typer.confirm", lambda *args, **kwargs: answers.append(args) or True
+    )
+
+    # dry runs only show what depends on the removed packages
+    status = FakeStatus()
+    confirm_dependent_removal(required_by, True, status)
+    out = capsys.readouterr().out
+    assert "numpy is required by" in out
+    assert out.index("pandas") < out.index("scipy")
+    assert answers == [] and status.calls == []
+
+    # the status is paused while asking
+    confirm_dependent_removal(required_by, False, status)
+    assert len(answers) == 1 and status.calls == ["stop", "start"]
+
+    # nothing is asked when nothing depends on the removed packages
+    confirm_dependent_removal({}, False, status)
+    assert len(answers) == 1